@@ -0,0 +1,55 @@
+"""space playlist item order
+
+Revision ID: 3c1d7e9a4b2f
+Revises: b939b39395e2
+Create Date: 2026-10-19 09:12:41.318204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3c1d7e9a4b2f"
+down_revision: Union[str, Sequence[str], None] = "b939b39395e2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # dense positions -> keys 1024 apart, also fixes colliding positions
+    op.execute(
+        """
+        UPDATE playlist_items AS pi
+        SET "order" = ranked.new_order
+        FROM (
+            SELECT id,
+                   row_number() OVER (
+                       PARTITION BY playlist_id ORDER BY "order", id
+                   ) * 1024 AS new_order
+            FROM playlist_items
+        ) AS ranked
+        WHERE pi.id = ranked.id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        """
+        UPDATE playlist_items AS pi
+        SET "order" = ranked.new_order
+        FROM (
+            SELECT id,
+                   row_number() OVER (
+                       PARTITION BY playlist_id ORDER BY "order", id
+                   ) - 1 AS new_order
+            FROM playlist_items
+        ) AS ranked
+        WHERE pi.id = ranked.id
+        """
+    )
@@ -0,0 +1,124 @@
+"""upload sessions
+
+Revision ID: 4c9e1b7d3a60
+Revises: f61c2a8d4b37
+Create Date: 2026-10-19 22:02:41.318406
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "4c9e1b7d3a60"
+down_revision: Union[str, Sequence[str], None] = "f61c2a8d4b37"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "upload_sessions",
+        sa.Column(
+            "id",
+            sa.String(length=32),
+            nullable=False,
+            comment="random hex, part of the url",
+        ),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            nullable=False,
+            comment="uploading user - cascades on delete",
+        ),
+        sa.Column(
+            "s3_key", sa.Text(), nullable=False, comment="key the file is assembled at"
+        ),
+        sa.Column(
+            "s3_upload_id", sa.Text(), nullable=False, comment="s3 multipart upload id"
+        ),
+        sa.Column(
+            "filename",
+            sa.String(length=255),
+            nullable=False,
+            comment="client file name",
+        ),
+        sa.Column(
+            "title",
+            sa.String(length=255),
+            nullable=True,
+            comment="from Upload-Metadata",
+        ),
+        sa.Column(
+            "author",
+            sa.String(length=255),
+            nullable=True,
+            comment="from Upload-Metadata",
+        ),
+        sa.Column(
+            "upload_length", sa.BigInteger(), nullable=False, comment="total bytes"
+        ),
+        sa.Column(
+            "upload_offset",
+            sa.BigInteger(),
+            server_default="0",
+            nullable=False,
+            comment="bytes received so far",
+        ),
+        sa.Column(
+            "part_etags",
+            postgresql.ARRAY(sa.Text()),
+            server_default="{}",
+            nullable=False,
+            comment="etag of each part received, in order",
+        ),
+        sa.Column(
+            "expires_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            comment="aborted after this, pushed back by every chunk",
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="session creation timestamp",
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="last update timestamp",
+        ),
+        sa.CheckConstraint(
+            "upload_offset >= 0 AND upload_offset <= upload_length",
+            name="valid_upload_offset",
+        ),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_upload_sessions_user_id"),
+        "upload_sessions",
+        ["user_id"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_upload_sessions_expires_at"),
+        "upload_sessions",
+        ["expires_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_upload_sessions_expires_at"), table_name="upload_sessions")
+    op.drop_index(op.f("ix_upload_sessions_user_id"), table_name="upload_sessions")
+    op.drop_table("upload_sessions")
@@ -0,0 +1,59 @@
+"""audio seek indexes
+
+Revision ID: 7b3d5e1f9a24
+Revises: e4f9a2c7b610
+Create Date: 2026-10-19 17:42:10.218734
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "7b3d5e1f9a24"
+down_revision: Union[str, Sequence[str], None] = "e4f9a2c7b610"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "audio_seek_indexes",
+        sa.Column(
+            "audio_id",
+            sa.Integer(),
+            nullable=False,
+            comment="audio file - cascades on delete",
+        ),
+        sa.Column(
+            "interval_seconds",
+            sa.Integer(),
+            server_default="1",
+            nullable=False,
+            comment="seconds between entries",
+        ),
+        sa.Column(
+            "offsets",
+            sa.LargeBinary(),
+            nullable=False,
+            comment="packed uint32 little endian offsets",
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="index creation timestamp",
+        ),
+        sa.CheckConstraint("interval_seconds > 0", name="positive_seek_interval"),
+        sa.ForeignKeyConstraint(["audio_id"], ["audio_files.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("audio_id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("audio_seek_indexes")
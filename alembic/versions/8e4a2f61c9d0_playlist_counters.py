@@ -0,0 +1,79 @@
+"""playlist counters
+
+Revision ID: 8e4a2f61c9d0
+Revises: 3c1d7e9a4b2f
+Create Date: 2026-10-19 10:03:27.551962
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "8e4a2f61c9d0"
+down_revision: Union[str, Sequence[str], None] = "3c1d7e9a4b2f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "playlists",
+        sa.Column(
+            "item_count",
+            sa.Integer(),
+            server_default="0",
+            nullable=False,
+            comment="number of audio files in playlist",
+        ),
+    )
+    op.add_column(
+        "playlists",
+        sa.Column(
+            "total_duration",
+            sa.BigInteger(),
+            server_default="0",
+            nullable=False,
+            comment="sum of item durations in seconds",
+        ),
+    )
+    op.add_column(
+        "playlists",
+        sa.Column(
+            "total_size",
+            sa.BigInteger(),
+            server_default="0",
+            nullable=False,
+            comment="sum of item file sizes in bytes",
+        ),
+    )
+    op.create_index("idx_playlist_user_created", "playlists", ["user_id", "created_at"])
+
+    # backfill from existing items
+    op.execute("""
+        UPDATE playlists AS p
+        SET item_count = totals.count,
+            total_duration = totals.duration,
+            total_size = totals.size
+        FROM (
+            SELECT pi.playlist_id,
+                   count(pi.id) AS count,
+                   coalesce(sum(a.duration), 0) AS duration,
+                   coalesce(sum(a.file_size), 0) AS size
+            FROM playlist_items AS pi
+            JOIN audio_files AS a ON a.id = pi.audio_id
+            GROUP BY pi.playlist_id
+        ) AS totals
+        WHERE p.id = totals.playlist_id
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("idx_playlist_user_created", table_name="playlists")
+    op.drop_column("playlists", "total_size")
+    op.drop_column("playlists", "total_duration")
+    op.drop_column("playlists", "item_count")
@@ -0,0 +1,37 @@
+"""batch upload sessions
+
+Revision ID: 9d5a3c8e2f17
+Revises: 4c9e1b7d3a60
+Create Date: 2026-10-19 22:48:09.553170
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "9d5a3c8e2f17"
+down_revision: Union[str, Sequence[str], None] = "4c9e1b7d3a60"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "upload_sessions",
+        sa.Column(
+            "batch",
+            sa.Boolean(),
+            server_default="false",
+            nullable=False,
+            comment="kept once complete for a batch upload to claim, not added on its own",
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("upload_sessions", "batch")
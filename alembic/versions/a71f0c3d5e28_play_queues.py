@@ -0,0 +1,92 @@
+"""play queues
+
+Revision ID: a71f0c3d5e28
+Revises: 8e4a2f61c9d0
+Create Date: 2026-10-19 11:20:14.907336
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "a71f0c3d5e28"
+down_revision: Union[str, Sequence[str], None] = "8e4a2f61c9d0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "play_queues",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            nullable=False,
+            comment="owner user id - one queue per user",
+        ),
+        sa.Column(
+            "playlist_id",
+            sa.Integer(),
+            nullable=True,
+            comment="source playlist, null when built from the library",
+        ),
+        sa.Column(
+            "author",
+            sa.String(length=255),
+            nullable=True,
+            comment="library author filter, if any",
+        ),
+        sa.Column(
+            "audio_ids",
+            postgresql.ARRAY(sa.Integer()),
+            nullable=False,
+            comment="audio ids in play order",
+        ),
+        sa.Column("shuffle", sa.Boolean(), nullable=False, comment="shuffled"),
+        sa.Column("seed", sa.BigInteger(), nullable=True, comment="shuffle seed"),
+        sa.Column(
+            "repeat",
+            sa.String(length=8),
+            nullable=False,
+            comment="repeat mode: off, all or one",
+        ),
+        sa.Column(
+            "current_index",
+            sa.Integer(),
+            nullable=False,
+            comment="index into audio_ids",
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="queue creation timestamp",
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="last update timestamp",
+        ),
+        sa.CheckConstraint("repeat IN ('off', 'all', 'one')", name="valid_repeat_mode"),
+        sa.CheckConstraint("current_index >= 0", name="non_negative_queue_index"),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["playlist_id"], ["playlists.id"], ondelete="SET NULL"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id"),
+    )
+    op.create_index(op.f("ix_play_queues_id"), "play_queues", ["id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_play_queues_id"), table_name="play_queues")
+    op.drop_table("play_queues")
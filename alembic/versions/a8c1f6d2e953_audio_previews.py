@@ -0,0 +1,38 @@
+"""audio previews
+
+Revision ID: a8c1f6d2e953
+Revises: 7b3d5e1f9a24
+Create Date: 2026-10-19 19:05:47.331902
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a8c1f6d2e953"
+down_revision: Union[str, Sequence[str], None] = "7b3d5e1f9a24"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "audio_files",
+        sa.Column(
+            "preview_url", sa.Text(), nullable=True, comment="short clip for browsing"
+        ),
+    )
+    op.add_column(
+        "audio_files",
+        sa.Column("cover_url", sa.Text(), nullable=True, comment="cover art thumbnail"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("audio_files", "cover_url")
+    op.drop_column("audio_files", "preview_url")
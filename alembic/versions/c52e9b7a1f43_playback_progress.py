@@ -0,0 +1,85 @@
+"""playback progress
+
+Revision ID: c52e9b7a1f43
+Revises: a71f0c3d5e28
+Create Date: 2026-10-19 12:41:55.120478
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c52e9b7a1f43"
+down_revision: Union[str, Sequence[str], None] = "a71f0c3d5e28"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "playback_progress",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            nullable=False,
+            comment="listener user id - cascades on delete",
+        ),
+        sa.Column(
+            "audio_id",
+            sa.Integer(),
+            nullable=False,
+            comment="audio file id - cascades on delete",
+        ),
+        sa.Column(
+            "position",
+            sa.Integer(),
+            nullable=False,
+            comment="resume position in seconds",
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="when the heartbeat was received",
+        ),
+        sa.CheckConstraint("position >= 0", name="non_negative_position"),
+        sa.ForeignKeyConstraint(["audio_id"], ["audio_files.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "idx_unique_progress_user_audio",
+        "playback_progress",
+        ["user_id", "audio_id"],
+        unique=True,
+    )
+    op.create_index(
+        "idx_progress_user_updated",
+        "playback_progress",
+        ["user_id", "updated_at"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_playback_progress_audio_id"),
+        "playback_progress",
+        ["audio_id"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_playback_progress_id"), "playback_progress", ["id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_playback_progress_id"), table_name="playback_progress")
+    op.drop_index(op.f("ix_playback_progress_audio_id"), table_name="playback_progress")
+    op.drop_index("idx_progress_user_updated", table_name="playback_progress")
+    op.drop_index("idx_unique_progress_user_audio", table_name="playback_progress")
+    op.drop_table("playback_progress")
@@ -0,0 +1,73 @@
+"""audio renditions
+
+Revision ID: d2e7b4a9c186
+Revises: a8c1f6d2e953
+Create Date: 2026-10-19 20:31:12.904417
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "d2e7b4a9c186"
+down_revision: Union[str, Sequence[str], None] = "a8c1f6d2e953"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "audio_renditions",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column(
+            "audio_id",
+            sa.Integer(),
+            nullable=False,
+            comment="original audio file - cascades on delete",
+        ),
+        sa.Column(
+            "quality",
+            sa.String(length=16),
+            nullable=False,
+            comment="profile name e.g low",
+        ),
+        sa.Column(
+            "file_url", sa.Text(), nullable=False, comment="S3 cloud storage url"
+        ),
+        sa.Column("bitrate", sa.Integer(), nullable=False, comment="bits per second"),
+        sa.Column(
+            "file_size",
+            sa.BigInteger(),
+            nullable=False,
+            comment="file size in bytes",
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="rendition creation timestamp",
+        ),
+        sa.ForeignKeyConstraint(["audio_id"], ["audio_files.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "idx_unique_audio_rendition",
+        "audio_renditions",
+        ["audio_id", "quality"],
+        unique=True,
+    )
+    op.create_index(
+        op.f("ix_audio_renditions_id"), "audio_renditions", ["id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_audio_renditions_id"), table_name="audio_renditions")
+    op.drop_index("idx_unique_audio_rendition", table_name="audio_renditions")
+    op.drop_table("audio_renditions")
@@ -0,0 +1,134 @@
+"""ingest jobs
+
+Revision ID: e4f9a2c7b610
+Revises: c52e9b7a1f43
+Create Date: 2026-10-19 15:08:31.604512
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e4f9a2c7b610"
+down_revision: Union[str, Sequence[str], None] = "c52e9b7a1f43"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "audio_files",
+        sa.Column(
+            "checksum",
+            sa.String(length=64),
+            nullable=True,
+            comment="sha256 of the file, hex",
+        ),
+    )
+    # existing rows were processed inline at upload
+    op.add_column(
+        "audio_files",
+        sa.Column(
+            "status",
+            sa.String(length=16),
+            server_default="ready",
+            nullable=False,
+            comment="processing, ready or failed",
+        ),
+    )
+    op.create_check_constraint(
+        "valid_audio_status",
+        "audio_files",
+        "status IN ('processing', 'ready', 'failed')",
+    )
+
+    op.create_table(
+        "ingest_jobs",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column(
+            "audio_id",
+            sa.Integer(),
+            nullable=False,
+            comment="audio file to process - cascades on delete",
+        ),
+        sa.Column(
+            "status",
+            sa.String(length=16),
+            server_default="queued",
+            nullable=False,
+            comment="queued, running, done or failed",
+        ),
+        sa.Column(
+            "attempts",
+            sa.Integer(),
+            server_default="0",
+            nullable=False,
+            comment="runs so far",
+        ),
+        sa.Column(
+            "run_after",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="not claimed before this time, pushed back on retry",
+        ),
+        sa.Column(
+            "locked_at",
+            sa.DateTime(timezone=True),
+            nullable=True,
+            comment="when a worker claimed it",
+        ),
+        sa.Column(
+            "last_error",
+            sa.Text(),
+            nullable=True,
+            comment="error of the last failed run",
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="job creation timestamp",
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="last update timestamp",
+        ),
+        sa.CheckConstraint(
+            "status IN ('queued', 'running', 'done', 'failed')",
+            name="valid_ingest_status",
+        ),
+        sa.ForeignKeyConstraint(["audio_id"], ["audio_files.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("audio_id"),
+    )
+    op.create_index(
+        "idx_ingest_jobs_pending",
+        "ingest_jobs",
+        ["status", "run_after"],
+        unique=False,
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+    )
+    op.create_index(op.f("ix_ingest_jobs_id"), "ingest_jobs", ["id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_ingest_jobs_id"), table_name="ingest_jobs")
+    op.drop_index(
+        "idx_ingest_jobs_pending",
+        table_name="ingest_jobs",
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+    )
+    op.drop_table("ingest_jobs")
+    op.drop_constraint("valid_audio_status", "audio_files", type_="check")
+    op.drop_column("audio_files", "status")
+    op.drop_column("audio_files", "checksum")
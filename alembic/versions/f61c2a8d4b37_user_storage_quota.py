@@ -0,0 +1,36 @@
+"""user storage quota
+
+Revision ID: f61c2a8d4b37
+Revises: d2e7b4a9c186
+Create Date: 2026-10-19 21:14:55.620183
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "f61c2a8d4b37"
+down_revision: Union[str, Sequence[str], None] = "d2e7b4a9c186"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "users",
+        sa.Column(
+            "storage_quota_bytes",
+            sa.BigInteger(),
+            nullable=True,
+            comment="upload storage allowed, null uses USER_STORAGE_QUOTA_BYTES",
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("users", "storage_quota_bytes")
@@ -0,0 +1,126 @@
+"""
+Library serialization microbenchmark
+Compares the old /library path (ORM objects, per row pydantic validation,
+response_model re-validation, jsonable_encoder + json.dumps) with the
+fast path (column tuples encoded straight to json bytes)
+
+Runs against a throwaway sqlite file so it needs no postgres or s3
+
+usage: python -m benchmarks.library_serialization [rows] [repeats]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# own database, never the one from .env
+_db_file = tempfile.NamedTemporaryFile(suffix=".sqlite3", delete=False)
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_file.name}"
+
+import json
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import text
+
+from database.db import SessionLocal, engine
+from models.audio import AudioFile
+from schemas.audio import AudioLibraryResponse, AudioResponse
+from utils.serialization import encode_json, orjson, rows_to_dicts, schema_columns
+
+USER_ID = 1
+
+
+def seed(rows: int) -> None:
+    with engine.begin() as conn:
+        # users has a postgres only check constraint, a bare table is enough
+        conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO users (id) VALUES (:id)"), {"id": USER_ID})
+
+    AudioFile.__table__.create(bind=engine)
+
+    now = datetime.now(timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(
+            AudioFile.__table__.insert(),
+            [
+                {
+                    "user_id": USER_ID,
+                    "title": f"Lecture {i}",
+                    "author": f"Author {i % 250}",
+                    "file_url": f"https://bucket.s3.eu-north-1.amazonaws.com/users/1/audio/{i:032x}.mp3",
+                    "duration": 600 + i % 3000,
+                    "file_size": 5_000_000 + i,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for i in range(rows)
+            ],
+        )
+
+
+def library_before(db) -> bytes:
+    audios = (
+        db.query(AudioFile)
+        .filter(AudioFile.user_id == USER_ID)
+        .order_by(AudioFile.author)
+        .all()
+    )
+    response = AudioLibraryResponse(
+        audios=[AudioResponse.model_validate(audio) for audio in audios],
+        total=len(audios),
+    )
+
+    # what fastapi does with response_model: dump, validate, encode
+    validated = AudioLibraryResponse.model_validate(response.model_dump())
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def library_after(db) -> bytes:
+    columns = schema_columns(AudioResponse, AudioFile)
+    rows = (
+        db.query(*columns)
+        .filter(AudioFile.user_id == USER_ID)
+        .order_by(AudioFile.author)
+        .all()
+    )
+    audios = rows_to_dicts(list(AudioResponse.model_fields), rows)
+
+    return encode_json({"audios": audios, "total": len(audios)})
+
+
+def best_of(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            fn(db)
+            timings.append(time.perf_counter() - start)
+        finally:
+            db.close()
+
+    return min(timings)
+
+
+def run(rows: int = 10_000, repeats: int = 5) -> None:
+    seed(rows)
+
+    encoder = "orjson" if orjson is not None else "json (install orjson for more)"
+    print(f"{rows} rows, best of {repeats}, encoder: {encoder}\n")
+
+    before = best_of(library_before, repeats)
+    after = best_of(library_after, repeats)
+
+    print(f"  {'before':<8} {before * 1000:8.1f} ms  {rows / before:12,.0f} rows/sec")
+    print(f"  {'after':<8} {after * 1000:8.1f} ms  {rows / after:12,.0f} rows/sec")
+    print(f"\n  speedup  {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    try:
+        run(*(int(arg) for arg in sys.argv[1:3]))
+    finally:
+        engine.dispose()
+        os.unlink(_db_file.name)
@@ -0,0 +1,81 @@
+"""
+Response encoding benchmark
+Payload size and server encode time for each negotiated encoding and
+compression on realistic library sizes, using the same encoders and
+compression settings as utils.serialization
+
+Encodings whose optional package is not installed are skipped
+
+usage: python -m benchmarks.response_encodings [rows ...]
+"""
+
+import sys
+import time
+from datetime import datetime, timezone
+
+from utils.serialization import COMPRESSORS, ENCODERS
+
+LIBRARY_SIZES = (100, 1_000, 10_000)
+
+
+def library_payload(rows: int) -> dict:
+    """same shape as the /library response"""
+    now = datetime.now(timezone.utc)
+    audios = [
+        {
+            "id": i,
+            "user_id": 1,
+            "title": f"Tafsir of Surah Al-Baqarah part {i}",
+            "author": f"Sheikh Author {i % 250}",
+            "file_url": f"https://bucket.s3.eu-north-1.amazonaws.com/users/1/audio/{i:032x}.mp3",
+            "duration": 600 + i % 3000,
+            "file_size": 5_000_000 + i * 7,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(rows)
+    ]
+
+    return {"audios": audios, "total": rows}
+
+
+def best_of(fn, repeats: int = 5) -> tuple[float, bytes]:
+    best, result = float("inf"), b""
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+
+def run(sizes=LIBRARY_SIZES) -> None:
+    # x-msgpack is an alias of msgpack
+    encoders = {
+        media_type: encoder
+        for media_type, encoder in ENCODERS.items()
+        if media_type != "application/x-msgpack"
+    }
+    codings = ["identity", *COMPRESSORS]
+
+    for rows in sizes:
+        payload = library_payload(rows)
+        print(f"\n{rows} rows")
+        print(f"  {'media type':<22} {'coding':<9} {'bytes':>12} {'encode ms':>10}")
+
+        for media_type, encoder in encoders.items():
+            for coding in codings:
+                if coding == "identity":
+                    fn = lambda: encoder(payload)
+                else:
+                    compress = COMPRESSORS[coding]
+                    fn = lambda: compress(encoder(payload))
+
+                seconds, body = best_of(fn)
+                print(
+                    f"  {media_type:<22} {coding:<9} {len(body):>12,} {seconds * 1000:>10.2f}"
+                )
+
+
+if __name__ == "__main__":
+    run(tuple(int(arg) for arg in sys.argv[1:]) or LIBRARY_SIZES)
@@ -0,0 +1,339 @@
+"""
+Bulk audio import script
+Imports a local directory or an S3 prefix of mp3s into one user's
+library, for onboarding an existing collection too large for the api
+
+Each batch of files has its tags and duration read in a process pool,
+is copied into the user's storage by a pool of threads and inserted
+with one executemany, then queued for ingest like an upload. Running
+the same command again after a crash or ctrl+c carries on where it
+stopped: a file is stored at a key made from its source path, so one
+already in the library is skipped and one stored by a batch that never
+committed is overwritten. Finished files are also appended to a
+checkpoint file, which only saves looking them up again
+
+usage: python -m database.import_audio <user email or id> <directory | s3://bucket/prefix>
+           [--checkpoint FILE] [--batch N] [--processes N] [--uploads N]
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from database.db import SessionLocal, engine
+from models.audio import AudioFile, User
+from utils.ingest import add_uploaded_audios, duration_column
+from utils.metadata import HEAD_BYTES, extract_metadata
+from utils.mpeg import looks_like_mp3
+from utils.storage import (
+    ALLOWED_EXTENSIONS,
+    AWS_S3_BUCKET,
+    SNIFF_BYTES,
+    delete_audio_file,
+    s3_client,
+    s3_url_from_key,
+    upload_metadata,
+)
+
+# files read, stored and inserted together, a crash repeats at most one
+IMPORT_BATCH_SIZE = 500
+
+# metadata reads are a few small reads per file, mostly waiting on disk
+# or s3, so more processes than cores still helps
+IMPORT_PROCESSES = min(os.cpu_count() or 1, 8)
+
+# files copied into storage at once
+IMPORT_UPLOADS = 16
+
+
+def list_sources(source: str):
+    """Yield mp3 paths under a directory, or s3:// urls under a prefix, in name order"""
+    if source.startswith("s3://"):
+        bucket, _, prefix = source[len("s3://") :].partition("/")
+        paginator = s3_client.get_paginator("list_objects_v2")
+
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                if Path(item["Key"]).suffix.lower() in ALLOWED_EXTENSIONS:
+                    yield f"s3://{bucket}/{item['Key']}"
+        return
+
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            if Path(name).suffix.lower() in ALLOWED_EXTENSIONS:
+                yield os.path.join(root, name)
+
+
+def source_reader(path: str):
+    """read(offset, length) and size of a local file or s3 object"""
+    if path.startswith("s3://"):
+        bucket, _, key = path[len("s3://") :].partition("/")
+        size = s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+
+        def read(offset, length):
+            if offset >= size or length <= 0:
+                return b""
+            end = min(offset + length, size) - 1
+            response = s3_client.get_object(
+                Bucket=bucket, Key=key, Range=f"bytes={offset}-{end}"
+            )
+            return response["Body"].read()
+
+        return read, size
+
+    size = os.path.getsize(path)
+
+    def read(offset, length):
+        with open(path, "rb") as file:
+            file.seek(offset)
+            return file.read(length)
+
+    return read, size
+
+
+def read_source(path: str):
+    """
+    Runs in the process pool
+    Returns the row values for a file, or the reason it is skipped
+    """
+    try:
+        read, size = source_reader(path)
+
+        # extract_metadata starts with the same read, serve it from here
+        head = read(0, HEAD_BYTES)
+
+        def cached_read(offset, length):
+            if offset + length <= len(head):
+                return head[offset : offset + length]
+            return read(offset, length)
+
+        if not looks_like_mp3(head[:SNIFF_BYTES]):
+            return path, "not an mp3"
+
+        metadata = extract_metadata(cached_read, size)
+    except Exception as e:
+        return path, f"could not read: {e}"
+
+    name = Path(path.rpartition("/")[2])
+    return path, {
+        "title": (metadata.tags.get("title") or name.stem)[:255],
+        "author": (metadata.tags.get("artist") or "unknown")[:255],
+        "duration": duration_column(metadata.duration or 0),
+        "file_size": size,
+    }
+
+
+def import_key(path: str, user_id: int) -> str:
+    """Where a source file is stored, the same on every run"""
+    if not path.startswith("s3://"):
+        path = os.path.abspath(path)
+    digest = hashlib.sha256(path.encode()).hexdigest()[:32]
+    return f"users/{user_id}/audio/import-{digest}.mp3"
+
+
+def store_source(path: str, user_id: int) -> str:
+    """Copy a file into the user's storage, s3 sources are copied server side"""
+    filename = path.rpartition("/")[2]
+    s3_key = import_key(path, user_id)
+    extra_args = {
+        "ContentType": "audio/mpeg",
+        "ServerSideEncryption": "AES256",
+        "Metadata": upload_metadata(user_id, filename),
+    }
+
+    if path.startswith("s3://"):
+        bucket, _, key = path[len("s3://") :].partition("/")
+        s3_client.copy(
+            {"Bucket": bucket, "Key": key},
+            AWS_S3_BUCKET,
+            s3_key,
+            ExtraArgs={**extra_args, "MetadataDirective": "REPLACE"},
+        )
+    else:
+        s3_client.upload_file(path, AWS_S3_BUCKET, s3_key, ExtraArgs=extra_args)
+
+    return s3_url_from_key(s3_key)
+
+
+def find_user(db, user: str) -> User:
+    query = db.query(User)
+    if user.isdigit():
+        found = query.filter(User.id == int(user)).first()
+    else:
+        found = query.filter(User.email == user).first()
+
+    if found is None:
+        raise SystemExit(f"❌ User {user} not found")
+    return found
+
+
+def read_checkpoint(checkpoint: str) -> set:
+    if not os.path.exists(checkpoint):
+        return set()
+    with open(checkpoint) as file:
+        return {line.rstrip("\n") for line in file if line.strip()}
+
+
+def batches(paths, size: int):
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_batch(db, user_id: int, batch: list, processes, uploads) -> tuple:
+    """
+    Read, store and insert one batch
+    Returns the paths imported, by this run or an earlier one, and the
+    (path, reason) skipped
+    """
+    rows = {}
+    skipped = []
+
+    # already imported by a run that stopped before its checkpoint write
+    urls = {s3_url_from_key(import_key(path, user_id)): path for path in batch}
+    existing = {
+        urls[file_url]
+        for (file_url,) in db.query(AudioFile.file_url).filter(
+            AudioFile.user_id == user_id, AudioFile.file_url.in_(list(urls))
+        )
+    }
+    db.commit()
+
+    pending = [path for path in batch if path not in existing]
+
+    for path, result in processes.map(read_source, pending, chunksize=16):
+        if isinstance(result, str):
+            skipped.append((path, result))
+        else:
+            rows[path] = result
+
+    futures = {path: uploads.submit(store_source, path, user_id) for path in rows}
+    for path, future in futures.items():
+        try:
+            rows[path]["file_url"] = future.result()
+        except Exception as e:
+            skipped.append((path, f"could not store: {e}"))
+            del rows[path]
+
+    if not rows:
+        return list(existing), skipped
+
+    try:
+        # one executemany for the audio rows, one for their ingest jobs
+        add_uploaded_audios(db, user_id, list(rows.values()))
+        db.commit()
+    except Exception:
+        db.rollback()
+        for row in rows.values():
+            delete_audio_file(row["file_url"])
+        raise
+
+    return list(existing) + list(rows), skipped
+
+
+def import_audio(
+    user: str,
+    source: str,
+    checkpoint: str,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    process_count: int = IMPORT_PROCESSES,
+    upload_count: int = IMPORT_UPLOADS,
+):
+    """Import every mp3 under source into the user's library"""
+    if not source.startswith("s3://") and not os.path.isdir(source):
+        print(f"❌ {source} is not a directory or s3:// prefix")
+        return
+
+    db = SessionLocal()
+    done = read_checkpoint(checkpoint)
+    imported = skipped = 0
+    started = time.monotonic()
+
+    try:
+        user_id = find_user(db, user).id
+        db.commit()
+
+        print(f"\n📂 Importing {source} for user {user_id}")
+        if done:
+            print(f"⏩ Resuming, {len(done)} file(s) already imported")
+
+        pending = (path for path in list_sources(source) if path not in done)
+
+        # spawned so the workers do not inherit database connections
+        with ProcessPoolExecutor(
+            process_count, mp_context=get_context("spawn")
+        ) as processes, ThreadPoolExecutor(upload_count) as uploads, open(
+            checkpoint, "a"
+        ) as log:
+            for batch in batches(pending, batch_size):
+                paths, failed = import_batch(db, user_id, batch, processes, uploads)
+
+                # only once the rows are committed
+                log.writelines(f"{path}\n" for path in paths)
+                log.flush()
+                os.fsync(log.fileno())
+
+                for path, reason in failed:
+                    print(f"⚠️  Skipped {path}: {reason}")
+
+                imported += len(paths)
+                skipped += len(failed)
+                minutes = (time.monotonic() - started) / 60
+                print(
+                    f"📦 {imported} imported, {skipped} skipped, {imported / minutes:.0f} files/min"
+                )
+
+        print(f"\n✅ Import complete, {imported} file(s) imported, {skipped} skipped")
+        if skipped:
+            print("📝 Skipped files are retried when the import is run again")
+
+    except KeyboardInterrupt:
+        print(f"\n🛑 Stopped after {imported} file(s), run again to resume")
+
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        import traceback
+
+        traceback.print_exc()
+
+    finally:
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="bulk import mp3s into a library")
+    parser.add_argument("user", help="email or id of the user to import for")
+    parser.add_argument("source", help="local directory or s3://bucket/prefix")
+    parser.add_argument(
+        "--checkpoint",
+        default="import_audio.checkpoint",
+        help="file listing imported files, used to resume",
+    )
+    parser.add_argument("--batch", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--processes", type=int, default=IMPORT_PROCESSES)
+    parser.add_argument("--uploads", type=int, default=IMPORT_UPLOADS)
+    args = parser.parse_args()
+
+    import_audio(
+        args.user,
+        args.source,
+        args.checkpoint,
+        args.batch,
+        args.processes,
+        args.uploads,
+    )
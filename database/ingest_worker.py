@@ -0,0 +1,37 @@
+"""
+Standalone ingest worker
+Processes queued uploads outside the api, run as many as needed and
+set INGEST_WORKERS=0 on the api so it only queues jobs
+
+usage: python -m database.ingest_worker [threads]
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import sys
+
+from database.db import engine
+from utils.ingest import INGEST_WORKERS, IngestWorkerPool
+
+
+def run_workers(threads: int = INGEST_WORKERS):
+    """Run ingest worker threads until interrupted"""
+    pool = IngestWorkerPool(max(threads, 1))
+    pool.start()
+    print(
+        f"✅ Ingest worker running with {len(pool.threads)} thread(s), ctrl+c to stop"
+    )
+
+    try:
+        pool.stopping.wait()
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping, finishing jobs in progress...")
+    finally:
+        pool.stop()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    run_workers(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,197 @@
+"""
+Storage reconciliation script
+Finds files in S3 that no row points at (a failed cleanup after an
+upload, ingest or delete, a deleted user's files) and rows whose file
+is missing from S3
+
+Both sides are read in key order, S3 through list_objects_v2 pages and
+the database through a server side cursor over every stored url, and
+merge joined, so memory stays constant however many files there are.
+Dry run by default, --delete removes orphaned files in batches. Rows
+with a missing file are only reported
+
+usage: python -m database.reconcile_storage [--delete] [--user ID]
+           [--grace-hours N]
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, union_all
+
+from database.db import SessionLocal, engine
+from models.audio import AudioFile, AudioRendition, UploadSession
+from utils.storage import AWS_S3_BUCKET, s3_client, s3_url_from_key
+
+# files younger than this are left alone, an upload stores its file
+# before the row commits and ingest its derived files before the audio
+# row is updated
+RECONCILE_GRACE_HOURS = 24
+
+# keys per delete_objects request, the s3 maximum
+DELETE_BATCH_SIZE = 1000
+
+# rows fetched per round trip from the key cursor
+KEY_BATCH_SIZE = 10000
+
+
+def storage_objects(prefix: str):
+    """Yield (key, last modified) of every object under prefix, in key order"""
+    paginator = s3_client.get_paginator("list_objects_v2")
+
+    for page in paginator.paginate(Bucket=AWS_S3_BUCKET, Prefix=prefix):
+        for item in page.get("Contents", []):
+            yield item["Key"], item["LastModified"]
+
+
+def database_keys(db, prefix: str):
+    """Yield every S3 key a row points at under prefix, in key order, once each"""
+    base = s3_url_from_key("")
+
+    def keys_of(column):
+        return select(func.substr(column, len(base) + 1).label("key")).where(
+            column.startswith(base, autoescape=True)
+        )
+
+    stored = union_all(
+        keys_of(AudioFile.file_url),
+        keys_of(AudioFile.preview_url),
+        keys_of(AudioFile.cover_url),
+        keys_of(AudioRendition.file_url),
+        # stored uploads waiting to be claimed or finished, one still
+        # receiving chunks has no object yet
+        select(UploadSession.s3_key.label("key")).where(
+            UploadSession.upload_offset == UploadSession.upload_length
+        ),
+    ).subquery()
+
+    # byte order, the order s3 lists keys in
+    result = db.execute(
+        select(stored.c.key)
+        .where(stored.c.key.startswith(prefix, autoescape=True))
+        .order_by(stored.c.key.collate("C"))
+        .execution_options(yield_per=KEY_BATCH_SIZE)
+    )
+
+    previous = None
+    for (key,) in result:
+        if key != previous:
+            yield key
+        previous = key
+
+
+def merge_orphans(objects, keys):
+    """
+    Merge join of the two sorted streams
+    Yields ("storage", key, last modified) for objects no row points at
+    and ("database", key, None) for keys with no object
+    """
+    obj = next(objects, None)
+    key = next(keys, None)
+
+    while obj is not None or key is not None:
+        if key is None or (obj is not None and obj[0] < key):
+            yield "storage", obj[0], obj[1]
+            obj = next(objects, None)
+        elif obj is None or key < obj[0]:
+            yield "database", key, None
+            key = next(keys, None)
+        else:
+            obj = next(objects, None)
+            key = next(keys, None)
+
+
+def delete_keys(keys: list) -> int:
+    """Delete a batch of keys, returns how many were deleted"""
+    response = s3_client.delete_objects(
+        Bucket=AWS_S3_BUCKET,
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+    )
+
+    errors = response.get("Errors", [])
+    for error in errors:
+        print(f"⚠️  Could not delete {error['Key']}: {error.get('Message')}")
+
+    return len(keys) - len(errors)
+
+
+def reconcile_storage(
+    delete: bool = False,
+    user_id: int = None,
+    grace_hours: float = RECONCILE_GRACE_HOURS,
+):
+    """Report, and with delete remove, files no row points at"""
+    prefix = f"users/{user_id}/audio/" if user_id is not None else "users/"
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+
+    db = SessionLocal()
+    orphaned = missing = recent = deleted = 0
+    pending = []
+
+    print(f"\n🔍 Reconciling s3://{AWS_S3_BUCKET}/{prefix} with the database")
+    if not delete:
+        print("📝 Dry run, pass --delete to remove orphaned files")
+
+    try:
+        for side, key, modified in merge_orphans(
+            storage_objects(prefix), database_keys(db, prefix)
+        ):
+            if side == "database":
+                missing += 1
+                print(f"❓ Missing file: {key}")
+                continue
+
+            if modified > cutoff:
+                recent += 1
+                continue
+
+            orphaned += 1
+            print(f"🗑️  Orphaned file: {key}")
+
+            if delete:
+                pending.append(key)
+                if len(pending) == DELETE_BATCH_SIZE:
+                    deleted += delete_keys(pending)
+                    pending = []
+
+        if pending:
+            deleted += delete_keys(pending)
+
+        print(
+            f"\n✅ Reconciled, {orphaned} orphaned file(s), {missing} missing file(s)"
+        )
+        if recent:
+            print(f"⏳ {recent} unreferenced file(s) newer than {grace_hours}h skipped")
+        if delete:
+            print(f"🗑️  {deleted} orphaned file(s) deleted")
+
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        import traceback
+
+        traceback.print_exc()
+
+    finally:
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="find files and rows that do not match up"
+    )
+    parser.add_argument("--delete", action="store_true", help="delete orphaned files")
+    parser.add_argument("--user", type=int, help="only this user's files")
+    parser.add_argument(
+        "--grace-hours",
+        type=float,
+        default=RECONCILE_GRACE_HOURS,
+        help="leave unreferenced files younger than this",
+    )
+    args = parser.parse_args()
+
+    reconcile_storage(args.delete, args.user, args.grace_hours)
@@ -0,0 +1,42 @@
+"""
+Playlist counter repair script
+Recomputes item_count, total_duration and total_size on playlists
+from playlist_items, for backfills or if the counters ever drift
+
+usage: python -m database.refresh_playlist_counters [playlist_id ...]
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import sys
+
+from database.db import SessionLocal
+from utils.playlist_counters import refresh_playlist_counters
+
+
+def refresh_counters(playlist_ids=None):
+    """Recompute counters for the given playlists, or all of them"""
+    db = SessionLocal()
+
+    try:
+        fixed = refresh_playlist_counters(db, playlist_ids)
+        db.commit()
+
+        print(f"✅ Playlist counters refreshed, {fixed} playlist(s) corrected")
+
+    except Exception as e:
+        db.rollback()
+        print(f"\n❌ Error: {e}")
+        import traceback
+
+        traceback.print_exc()
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    refresh_counters(ids)
@@ -2,14 +2,23 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+import asyncio
 from contextlib import asynccontextmanager
 from typing import Annotated
 from sqlalchemy.orm import Session
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 
-from routes import audio, auth, playlists
+from routes import audio, auth, events, playlists, queue, uploads
 from database.db import engine
+from utils.cache import response_cache
+from utils.dependencies import get_current_user
+from utils.events import broadcaster
+from utils.ingest import INGEST_WORKERS, ingest_workers
+from utils.invalidation import listen_for_invalidations
+from utils.progress_buffer import flush_progress_periodically, progress_buffer
+from utils.upload_guard import UploadGuardMiddleware
+from utils.upload_sessions import cleanup_upload_sessions_periodically
 
 
 @asynccontextmanager
@@ -17,8 +26,25 @@ async def lifespan_manager(app: FastAPI):
     print("starting idaeho api")
     print("database connected")
 
+    progress_flusher = asyncio.create_task(flush_progress_periodically())
+    invalidation_listener = asyncio.create_task(listen_for_invalidations())
+    upload_cleaner = asyncio.create_task(cleanup_upload_sessions_periodically())
+
+    # INGEST_WORKERS=0 when ingest runs as its own process
+    if INGEST_WORKERS > 0:
+        ingest_workers.start()
+
     yield
     print("shutting down iadaeho api")
+
+    invalidation_listener.cancel()
+    upload_cleaner.cancel()
+    await asyncio.to_thread(ingest_workers.stop)
+
+    # write out heartbeats still sitting in the buffer
+    progress_flusher.cancel()
+    progress_buffer.flush()
+
     engine.dispose()
 
 
@@ -31,7 +57,8 @@ app = FastAPI(
     lifespan=lifespan_manager,
 )
 
-# middleware
+# middleware, the last added runs first
+app.add_middleware(UploadGuardMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:8080", "https://customdomain.com"],
@@ -44,6 +71,9 @@ app.add_middleware(
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(audio.router, prefix="/api/audio", tags=["Audio"])
 app.include_router(playlists.router, prefix="/api/playlists", tags=["Playlists"])
+app.include_router(queue.router, prefix="/api/queue", tags=["Queue"])
+app.include_router(events.router, prefix="/api/events", tags=["Events"])
+app.include_router(uploads.router, prefix="/api/uploads", tags=["Uploads"])
 
 
 @app.get("/", tags=["Health"])
@@ -59,6 +89,22 @@ async def root():
     }
 
 
+@app.get("/cache", tags=["Health"], dependencies=[Depends(get_current_user)])
+async def cache_stats():
+    """
+    response cache hit ratio and memory use, signed in users only
+    """
+    return response_cache.stats()
+
+
+@app.get("/events/stats", tags=["Health"], dependencies=[Depends(get_current_user)])
+async def event_stats():
+    """
+    open event streams on this worker, signed in users only
+    """
+    return broadcaster.stats()
+
+
 if __name__ == "__main__":
     import uvicorn
 
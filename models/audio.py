@@ -14,8 +14,11 @@ from sqlalchemy import (
     CheckConstraint,
     Enum as SQLEnum,
     Index,
+    Boolean,
+    LargeBinary,
 )
-from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql import func, text
 from sqlalchemy.orm import relationship
 import enum
 
@@ -45,6 +48,12 @@ class User(Base):
         String(255), nullable=False, comment="bcrypt hashed password"
     )
 
+    storage_quota_bytes = Column(
+        BigInteger,
+        nullable=True,
+        comment="upload storage allowed, null uses USER_STORAGE_QUOTA_BYTES",
+    )
+
     # metadata
     created_at = Column(
         DateTime(timezone=True),
@@ -124,6 +133,22 @@ class AudioFile(Base):
 
     file_size = Column(BigInteger, nullable=True, comment="file size in bytes")
 
+    checksum = Column(String(64), nullable=True, comment="sha256 of the file, hex")
+
+    # made by ingest, stored next to the file
+    preview_url = Column(Text, nullable=True, comment="short clip for browsing")
+
+    cover_url = Column(Text, nullable=True, comment="cover art thumbnail")
+
+    # ingest state, uploads are processed by the ingest workers
+    status = Column(
+        String(16),
+        nullable=False,
+        default="ready",
+        server_default="ready",
+        comment="processing, ready or failed",
+    )
+
     # metadata
     created_at = Column(
         DateTime(timezone=True),
@@ -151,6 +176,9 @@ class AudioFile(Base):
     __table_args__ = (
         CheckConstraint("duration > 0", name="positive_duration"),
         CheckConstraint("file_size > 0", name="positive_file_size"),
+        CheckConstraint(
+            "status IN ('processing', 'ready', 'failed')", name="valid_audio_status"
+        ),
         # composite indexes
         Index("idx_audio_user_created", "user_id", "created_at"),
         Index("idx_audio_author", "author"),
@@ -187,6 +215,31 @@ class Playlist(Base):
     # playlist information
     name = Column(String(255), nullable=False, comment="playlist name")
 
+    # denormalised counters, kept in step by the playlist item mutation paths
+    item_count = Column(
+        Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+        comment="number of audio files in playlist",
+    )
+
+    total_duration = Column(
+        BigInteger,
+        nullable=False,
+        default=0,
+        server_default="0",
+        comment="sum of item durations in seconds",
+    )
+
+    total_size = Column(
+        BigInteger,
+        nullable=False,
+        default=0,
+        server_default="0",
+        comment="sum of item file sizes in bytes",
+    )
+
     # metadata
     created_at = Column(
         DateTime(timezone=True),
@@ -215,6 +268,7 @@ class Playlist(Base):
 
     __table_args__ = (
         Index("idx_playlist_user", "user_id"),  # users playlists
+        Index("idx_playlist_user_created", "user_id", "created_at"),
         Index("idx_playlist_name", "name"),
     )
 
@@ -277,3 +331,399 @@ class PlaylistItem(Base):
 
     def __repr__(self):
         return f"<PlaylistItem(playlist_id={self.playlist_id}, audio_id={self.audio_id}, order={self.order})>"
+
+
+class PlayQueue(Base):
+    """
+    play queue model holds a user's server side playback queue
+
+    design principles:
+        - one queue per user, replaced when a new one is started
+        - snapshot of audio ids in play order, shuffle is applied once with
+          a stored seed so the order is reproducible on every device
+        - audio deleted after the snapshot is skipped when read
+    """
+
+    __tablename__ = "play_queues"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+        comment="owner user id - one queue per user",
+    )
+
+    # source the queue was built from
+    playlist_id = Column(
+        Integer,
+        ForeignKey("playlists.id", ondelete="SET NULL"),
+        nullable=True,
+        comment="source playlist, null when built from the library",
+    )
+
+    author = Column(String(255), nullable=True, comment="library author filter, if any")
+
+    audio_ids = Column(
+        ARRAY(Integer), nullable=False, comment="audio ids in play order"
+    )
+
+    # playback settings
+    shuffle = Column(Boolean, nullable=False, default=False, comment="shuffled")
+
+    seed = Column(BigInteger, nullable=True, comment="shuffle seed")
+
+    repeat = Column(
+        String(8),
+        nullable=False,
+        default="off",
+        comment="repeat mode: off, all or one",
+    )
+
+    current_index = Column(
+        Integer, nullable=False, default=0, comment="index into audio_ids"
+    )
+
+    # metadata
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+        comment="queue creation timestamp",
+    )
+
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+        comment="last update timestamp",
+    )
+
+    __table_args__ = (
+        CheckConstraint("repeat IN ('off', 'all', 'one')", name="valid_repeat_mode"),
+        CheckConstraint("current_index >= 0", name="non_negative_queue_index"),
+    )
+
+    def __repr__(self):
+        return f"<PlayQueue(user_id={self.user_id}, index={self.current_index})>"
+
+
+class PlaybackProgress(Base):
+    """
+    playback progress model stores resume position per user and audio file
+
+    design principles:
+        - one row per (user, audio), upserted in bulk by the progress buffer
+        - written behind heartbeats, so it can lag the client by one flush
+    """
+
+    __tablename__ = "playback_progress"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        comment="listener user id - cascades on delete",
+    )
+
+    audio_id = Column(
+        Integer,
+        ForeignKey("audio_files.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+        comment="audio file id - cascades on delete",
+    )
+
+    position = Column(Integer, nullable=False, comment="resume position in seconds")
+
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+        comment="when the heartbeat was received",
+    )
+
+    __table_args__ = (
+        Index("idx_unique_progress_user_audio", "user_id", "audio_id", unique=True),
+        Index("idx_progress_user_updated", "user_id", "updated_at"),
+        CheckConstraint("position >= 0", name="non_negative_position"),
+    )
+
+    def __repr__(self):
+        return f"<PlaybackProgress(user_id={self.user_id}, audio_id={self.audio_id}, position={self.position})>"
+
+
+class IngestJob(Base):
+    """
+    ingest job model is the durable queue of uploads waiting to be processed
+
+    design principles:
+        - one job per uploaded file, runs every ingest stage in order
+        - workers claim jobs with FOR UPDATE SKIP LOCKED so they never
+          wait on each other, a claim is a lease that expires if the
+          worker dies
+        - failed runs are retried with backoff up to a limit
+    """
+
+    __tablename__ = "ingest_jobs"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+
+    audio_id = Column(
+        Integer,
+        ForeignKey("audio_files.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+        comment="audio file to process - cascades on delete",
+    )
+
+    status = Column(
+        String(16),
+        nullable=False,
+        default="queued",
+        server_default="queued",
+        comment="queued, running, done or failed",
+    )
+
+    attempts = Column(
+        Integer, nullable=False, default=0, server_default="0", comment="runs so far"
+    )
+
+    run_after = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+        comment="not claimed before this time, pushed back on retry",
+    )
+
+    locked_at = Column(
+        DateTime(timezone=True), nullable=True, comment="when a worker claimed it"
+    )
+
+    last_error = Column(Text, nullable=True, comment="error of the last failed run")
+
+    # metadata
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+        comment="job creation timestamp",
+    )
+
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+        comment="last update timestamp",
+    )
+
+    __table_args__ = (
+        CheckConstraint(
+            "status IN ('queued', 'running', 'done', 'failed')",
+            name="valid_ingest_status",
+        ),
+        # claim query only looks at unfinished jobs
+        Index(
+            "idx_ingest_jobs_pending",
+            "status",
+            "run_after",
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    def __repr__(self):
+        return f"<IngestJob(audio_id={self.audio_id}, status='{self.status}')>"
+
+
+class AudioSeekIndex(Base):
+    """
+    seek index model maps playback time to byte offsets in an audio file
+
+    design principles:
+        - one row per audio file, written by ingest, kept out of
+          audio_files so library reads never carry it
+        - offsets are packed 4 byte little endian integers, entry n is
+          the frame playing at n * interval_seconds (utils.seek_index)
+    """
+
+    __tablename__ = "audio_seek_indexes"
+
+    audio_id = Column(
+        Integer,
+        ForeignKey("audio_files.id", ondelete="CASCADE"),
+        primary_key=True,
+        comment="audio file - cascades on delete",
+    )
+
+    interval_seconds = Column(
+        Integer,
+        nullable=False,
+        default=1,
+        server_default="1",
+        comment="seconds between entries",
+    )
+
+    offsets = Column(
+        LargeBinary, nullable=False, comment="packed uint32 little endian offsets"
+    )
+
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+        comment="index creation timestamp",
+    )
+
+    __table_args__ = (
+        CheckConstraint("interval_seconds > 0", name="positive_seek_interval"),
+    )
+
+    def __repr__(self):
+        return f"<AudioSeekIndex(audio_id={self.audio_id}, entries={len(self.offsets) // 4})>"
+
+
+class AudioRendition(Base):
+    """
+    rendition model is a lower bitrate copy of an audio file
+
+    design principles:
+        - made by ingest when an encoder is available, at most one per
+          quality, the original is always there to fall back on
+        - stored next to the original and deleted with it
+    """
+
+    __tablename__ = "audio_renditions"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+
+    audio_id = Column(
+        Integer,
+        ForeignKey("audio_files.id", ondelete="CASCADE"),
+        nullable=False,
+        comment="original audio file - cascades on delete",
+    )
+
+    quality = Column(String(16), nullable=False, comment="profile name e.g low")
+
+    file_url = Column(Text, nullable=False, comment="S3 cloud storage url")
+
+    bitrate = Column(Integer, nullable=False, comment="bits per second")
+
+    file_size = Column(BigInteger, nullable=False, comment="file size in bytes")
+
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+        comment="rendition creation timestamp",
+    )
+
+    __table_args__ = (
+        Index("idx_unique_audio_rendition", "audio_id", "quality", unique=True),
+    )
+
+    def __repr__(self):
+        return f"<AudioRendition(audio_id={self.audio_id}, quality='{self.quality}')>"
+
+
+class UploadSession(Base):
+    """
+    upload session model tracks a resumable upload in progress
+
+    design principles:
+        - one s3 multipart upload per session, each PATCH of the upload
+          protocol is one part, so a dropped connection costs at most the
+          chunk that was in flight
+        - nothing of the file is kept on the api servers
+        - sessions that stop receiving chunks expire, their multipart
+          upload is aborted so s3 stops charging for the parts
+        - a batch session is kept once complete, the batch upload
+          endpoint turns it into audio along with the rest of the batch
+    """
+
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(32), primary_key=True, comment="random hex, part of the url")
+
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+        comment="uploading user - cascades on delete",
+    )
+
+    s3_key = Column(Text, nullable=False, comment="key the file is assembled at")
+
+    s3_upload_id = Column(Text, nullable=False, comment="s3 multipart upload id")
+
+    filename = Column(String(255), nullable=False, comment="client file name")
+
+    title = Column(String(255), nullable=True, comment="from Upload-Metadata")
+
+    author = Column(String(255), nullable=True, comment="from Upload-Metadata")
+
+    upload_length = Column(BigInteger, nullable=False, comment="total bytes")
+
+    upload_offset = Column(
+        BigInteger,
+        nullable=False,
+        default=0,
+        server_default="0",
+        comment="bytes received so far",
+    )
+
+    part_etags = Column(
+        ARRAY(Text),
+        nullable=False,
+        default=list,
+        server_default="{}",
+        comment="etag of each part received, in order",
+    )
+
+    batch = Column(
+        Boolean,
+        nullable=False,
+        default=False,
+        server_default="false",
+        comment="kept once complete for a batch upload to claim, not added on its own",
+    )
+
+    expires_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        index=True,
+        comment="aborted after this, pushed back by every chunk",
+    )
+
+    # metadata
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+        comment="session creation timestamp",
+    )
+
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+        comment="last update timestamp",
+    )
+
+    __table_args__ = (
+        CheckConstraint(
+            "upload_offset >= 0 AND upload_offset <= upload_length",
+            name="valid_upload_offset",
+        ),
+    )
+
+    def __repr__(self):
+        return f"<UploadSession(id='{self.id}', offset={self.upload_offset}/{self.upload_length})>"
@@ -1,51 +1,134 @@
-from typing import Annotated, Optional
-
-from database.db import get_db
-from fastapi import APIRouter, status, Depends, UploadFile, File, Form, HTTPException
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Annotated, List, Optional
+
+from database.db import SessionLocal, get_db
+from fastapi import (
+    APIRouter,
+    status,
+    Depends,
+    UploadFile,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from models.audio import AudioFile
+from models.audio import (
+    AudioFile,
+    AudioRendition,
+    AudioSeekIndex,
+    IngestJob,
+    PlaybackProgress,
+    UploadSession,
+)
 from schemas.audio import (
+    AudioBatchRequest,
+    AudioBatchResponse,
     AudioDeleteResponse,
     AudioLibraryResponse,
     AudioResponse,
     AudioUpdateRequest,
+    AudioUploadBatchResponse,
+    AudioUploadResult,
+    IngestStatusResponse,
+    PlaybackProgressResponse,
+    PlaybackProgressUpdate,
+    SeekIndexResponse,
+    SeekPositionResponse,
+    StreamQuality,
+)
+from utils.cache import (
+    cached_response,
+    library_namespace,
+    playlists_namespace,
 )
 from utils.dependencies import CurrentUser
-from utils.storage import delete_audio_file, save_audio_file, validate_audio_file
+from utils.events import publish_event
+from utils.ingest import add_uploaded_audio, add_uploaded_audios
+from utils.invalidation import invalidate_on_commit
+from utils.metadata import file_reader, title_and_author
+from utils.play_queue import drop_audio_from_queue
+from utils.playlist_counters import detach_audio_from_playlists
+from utils.progress_buffer import progress_buffer
+from utils.seek_index import seek_entry, unpack_offsets
+from utils.serialization import (
+    NEGOTIATED_RESPONSES,
+    FieldsQuery,
+    encode_json,
+    negotiated_response,
+    parse_fields,
+    rows_to_dicts,
+    schema_columns,
+)
+from utils.singleflight import single_flight
+from utils.storage import (
+    delete_audio_file,
+    s3_url_from_key,
+    store_audio_file,
+    stored_file_reader,
+    validate_audio_file,
+)
 
 router = APIRouter()
 
+# columns selected for read responses, keyed by AudioResponse field
+AUDIO_RESPONSE_FIELDS = list(AudioResponse.model_fields)
+AUDIO_RESPONSE_COLUMNS = dict(
+    zip(AUDIO_RESPONSE_FIELDS, schema_columns(AudioResponse, AudioFile))
+)
+
+# rows fetched per round trip when streaming an export
+EXPORT_BATCH_SIZE = 1000
+
+# most ids one batch request may ask for
+AUDIO_BATCH_MAX = int(os.environ.get("AUDIO_BATCH_MAX", "500"))
+
+# most files one batch upload may carry
+UPLOAD_BATCH_MAX = int(os.environ.get("UPLOAD_BATCH_MAX", "100"))
+
+# files of a batch upload sent to s3 at once
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "8"))
+
 
 @router.post(
     "/upload",
     response_model=AudioResponse,
-    status_code=status.HTTP_201_CREATED,
+    status_code=status.HTTP_202_ACCEPTED,
     summary="upload audio file",
-    description="upload mp3 file with metadata",
+    description="upload mp3 file with metadata, duration and checksum are filled in by background processing, poll /{audio_id}/ingest or wait for the audio.ready event",
 )
-async def upload_audio(
+def upload_audio(
     current_user: CurrentUser,
     db: Annotated[Session, Depends(get_db)],
     file: UploadFile = File(..., description="MP3 audio file"),
-    title: str = Form(..., description="audio title"),
-    author: str = Form(..., description="author name"),
+    title: Optional[str] = Form(
+        None, description="audio title, defaults to the file's tag or name"
+    ),
+    author: Optional[str] = Form(
+        None, description="author name, defaults to the file's artist tag"
+    ),
 ):
     validate_audio_file(file)
 
-    file_url, duration, file_size = save_audio_file(file, current_user.id)
-
-    # create db record
-    new_audio = AudioFile(
-        user_id=current_user.id,
-        title=title,
-        author=author,
-        file_url=file_url,
-        duration=duration,
-        file_size=file_size,
+    # a few small reads of the spooled upload, not a parse of all of it
+    file.file.seek(0, os.SEEK_END)
+    title, author = title_and_author(
+        title, author, file_reader(file.file), file.file.tell(), file.filename
     )
 
+    # sync route so the s3 upload runs in the threadpool, not on the loop
+    file_url, file_size = store_audio_file(file, current_user.id)
+
     try:
-        db.add(new_audio)
+        # the ingest job fills in the rest
+        new_audio = add_uploaded_audio(
+            db, current_user.id, title, author, file_url, file_size
+        )
         db.commit()
         db.refresh(new_audio)
     except Exception as e:
@@ -61,50 +144,363 @@ async def upload_audio(
     return AudioResponse.model_validate(new_audio)
 
 
+def store_batch_file(file: UploadFile, user_id: int) -> dict:
+    """
+    runs in the batch upload's pool, validation, tags and the s3 upload
+    """
+    validate_audio_file(file)
+
+    file.file.seek(0, os.SEEK_END)
+    title, author = title_and_author(
+        None, None, file_reader(file.file), file.file.tell(), file.filename
+    )
+    file_url, file_size = store_audio_file(file, user_id)
+
+    return {
+        "title": title,
+        "author": author,
+        "file_url": file_url,
+        "file_size": file_size,
+    }
+
+
+def claim_batch_session(session: UploadSession) -> dict:
+    """
+    runs in the batch upload's pool, the file is already in s3 so only
+    its tags are read
+    """
+    file_url = s3_url_from_key(session.s3_key)
+    title, author = title_and_author(
+        session.title,
+        session.author,
+        stored_file_reader(file_url),
+        session.upload_length,
+        session.filename,
+    )
+
+    return {
+        "title": title,
+        "author": author,
+        "file_url": file_url,
+        "file_size": session.upload_length,
+    }
+
+
+@router.post(
+    "/upload/batch",
+    response_model=AudioUploadBatchResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="upload many audio files",
+    description="mp3 files and/or ids of finished batch resumable uploads, stored in parallel and added in one transaction. titles and authors come from each file's tags or name, results are per file",
+)
+def upload_audio_batch(
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+    files: List[UploadFile] = File([], description="MP3 audio files"),
+    upload_ids: List[str] = Form(
+        [], description="resumable uploads created with batch in Upload-Metadata"
+    ),
+):
+    if not files and not upload_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="no files to upload"
+        )
+
+    upload_ids = list(dict.fromkeys(upload_ids))
+    if len(files) + len(upload_ids) > UPLOAD_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"at most {UPLOAD_BATCH_MAX} files per batch",
+        )
+
+    results = [
+        AudioUploadResult(filename=file.filename, status_code=0) for file in files
+    ]
+    work = [partial(store_batch_file, file, current_user.id) for file in files]
+
+    sessions = {}
+    if upload_ids:
+        # locked until the batch commits, a second claim sees them as missing
+        sessions = {
+            session.id: session
+            for session in db.query(UploadSession)
+            .filter(
+                UploadSession.id.in_(upload_ids),
+                UploadSession.user_id == current_user.id,
+            )
+            .with_for_update(skip_locked=True)
+        }
+
+    for upload_id in upload_ids:
+        session = sessions.get(upload_id)
+        result = AudioUploadResult(upload_id=upload_id, status_code=0)
+
+        if session is None:
+            result.status_code = status.HTTP_404_NOT_FOUND
+            result.detail = "upload not found"
+        elif session.upload_offset < session.upload_length:
+            result.status_code = status.HTTP_409_CONFLICT
+            result.detail = "upload is not finished"
+
+        results.append(result)
+        work.append(partial(claim_batch_session, session) if session else None)
+
+    # wall clock near the slowest file rather than the sum of them
+    stored: list[Optional[dict]] = [None] * len(work)
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as pool:
+        futures = {
+            index: pool.submit(task)
+            for index, task in enumerate(work)
+            if task is not None and not results[index].status_code
+        }
+        for index, future in futures.items():
+            try:
+                stored[index] = future.result()
+            except HTTPException as e:
+                results[index].status_code = e.status_code
+                results[index].detail = e.detail
+            except Exception as e:
+                results[index].status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+                results[index].detail = f"failed to save file: {str(e)}"
+
+    added = [index for index, upload in enumerate(stored) if upload is not None]
+    claimed = [results[index].upload_id for index in added if index >= len(files)]
+
+    if not added:
+        db.rollback()
+        return AudioUploadBatchResponse(results=results, added=0, failed=len(results))
+
+    try:
+        audio_ids = add_uploaded_audios(
+            db, current_user.id, [stored[index] for index in added]
+        )
+        if claimed:
+            db.query(UploadSession).filter(UploadSession.id.in_(claimed)).delete(
+                synchronize_session=False
+            )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        # clean the files this request stored, claimed uploads keep theirs
+        for index in added:
+            if index < len(files):
+                delete_audio_file(stored[index]["file_url"])
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"failed to save audio metadata: {str(e)}",
+        )
+
+    audios = {
+        audio.id: audio
+        for audio in db.query(AudioFile).filter(AudioFile.id.in_(audio_ids))
+    }
+    for index, audio_id in zip(added, audio_ids):
+        results[index].status_code = status.HTTP_202_ACCEPTED
+        results[index].audio = AudioResponse.model_validate(audios[audio_id])
+
+    return AudioUploadBatchResponse(
+        results=results, added=len(added), failed=len(results) - len(added)
+    )
+
+
 @router.get(
     "/library",
     response_model=AudioLibraryResponse,
+    responses=NEGOTIATED_RESPONSES,
     summary="get users audio library",
     description="get all audio files for authenticated user",
 )
 def get_library(
+    request: Request,
     current_user: CurrentUser,
     db: Annotated[Session, Depends(get_db)],
+    fields: FieldsQuery = None,
 ):
-    query = db.query(AudioFile).filter(AudioFile.user_id == current_user.id)
+    names = parse_fields(fields, AUDIO_RESPONSE_FIELDS)
+
+    def build():
+        # plain column tuples, no ORM objects or per row validation
+        query = db.query(*(AUDIO_RESPONSE_COLUMNS[name] for name in names)).filter(
+            AudioFile.user_id == current_user.id
+        )
+
+        # alphabetical order based on author name
+        query = query.order_by(AudioFile.author)
 
-    # alphabetical order based on author name
-    query = query.order_by(AudioFile.author)
+        audios = rows_to_dicts(names, query.all())
 
-    audios = query.all()
+        return {"audios": audios, "total": len(audios)}
 
-    return AudioLibraryResponse(
-        audios=[AudioResponse.model_validate(audio) for audio in audios],
-        total=len(audios),
+    return cached_response(request, library_namespace(current_user.id), build)
+
+
+def export_library_lines(user_id: int, names: list[str]):
+    """
+    yields batches of ndjson lines read through a server side cursor
+
+    owns its session so the cursor stays open while the response streams,
+    memory holds one batch at a time however large the library is
+    """
+    db = SessionLocal()
+
+    try:
+        result = db.execute(
+            select(*(AUDIO_RESPONSE_COLUMNS[name] for name in names))
+            .where(AudioFile.user_id == user_id)
+            .order_by(AudioFile.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+
+        for rows in result.partitions():
+            yield b"".join(
+                encode_json(audio) + b"\n" for audio in rows_to_dicts(names, rows)
+            )
+    finally:
+        db.close()
+
+
+@router.get(
+    "/export",
+    summary="export audio library",
+    description="stream every audio file as newline delimited json, one AudioResponse per line",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+def export_library(current_user: CurrentUser, fields: FieldsQuery = None):
+    # checked before streaming starts so a bad field is still a 400
+    names = parse_fields(fields, AUDIO_RESPONSE_FIELDS)
+
+    return StreamingResponse(
+        export_library_lines(current_user.id, names),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Disposition": 'attachment; filename="library.ndjson"',
+        },
+    )
+
+
+def parse_ids(ids: str) -> list[int]:
+    """
+    comma separated ?ids= value as ints
+    """
+    try:
+        return [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be comma separated integers",
+        )
+
+
+def audio_batch(db: Session, user_id: int, ids: list[int], names: list[str]) -> dict:
+    """
+    owned audio files for ids from one IN query, in request order
+    """
+    # repeats are answered once, first occurrence keeps its place
+    ids = list(dict.fromkeys(ids))
+
+    if not ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="no ids given"
+        )
+    if len(ids) > AUDIO_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"at most {AUDIO_BATCH_MAX} ids per request",
+        )
+
+    # id is always in names, it keys the rows back into request order
+    rows = (
+        db.query(*(AUDIO_RESPONSE_COLUMNS[name] for name in names))
+        .filter(AudioFile.id.in_(ids), AudioFile.user_id == user_id)
+        .all()
+    )
+    found = {row.id: row for row in rows}
+
+    return {
+        "audios": [dict(zip(names, found[i])) for i in ids if i in found],
+        "missing": [i for i in ids if i not in found],
+    }
+
+
+@router.get(
+    "/batch",
+    response_model=AudioBatchResponse,
+    responses=NEGOTIATED_RESPONSES,
+    summary="get audio files by id",
+    description=f"get up to {AUDIO_BATCH_MAX} audio files in one request, in the order asked for",
+)
+def get_audio_batch(
+    request: Request,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+    ids: str = Query(..., description="comma separated audio file ids"),
+    fields: FieldsQuery = None,
+):
+    names = parse_fields(fields, AUDIO_RESPONSE_FIELDS)
+    ids = parse_ids(ids)
+
+    return cached_response(
+        request,
+        library_namespace(current_user.id),
+        lambda: audio_batch(db, current_user.id, ids, names),
+    )
+
+
+@router.post(
+    "/batch",
+    response_model=AudioBatchResponse,
+    responses=NEGOTIATED_RESPONSES,
+    summary="get audio files by id",
+    description="same as GET /batch with the ids in the body, for long lists",
+)
+def post_audio_batch(
+    batch: AudioBatchRequest,
+    request: Request,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+    fields: FieldsQuery = None,
+):
+    names = parse_fields(fields, AUDIO_RESPONSE_FIELDS)
+
+    # not cached, the ids are in the body and not part of the cache key
+    return negotiated_response(
+        request, audio_batch(db, current_user.id, batch.ids, names)
     )
 
 
 @router.get(
     "/{audio_id}",
     response_model=AudioResponse,
+    responses=NEGOTIATED_RESPONSES,
     summary="get single audio file",
     description="get details of a specific audio file",
 )
 def get_audio(
-    audio_id: int, current_user: CurrentUser, db: Annotated[Session, Depends(get_db)]
+    audio_id: int,
+    request: Request,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+    fields: FieldsQuery = None,
 ):
-    audio = (
-        db.query(AudioFile)
-        .filter(AudioFile.id == audio_id, AudioFile.user_id == current_user.id)
-        .first()
-    )
+    names = parse_fields(fields, AUDIO_RESPONSE_FIELDS)
 
-    if not audio:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="audio file not found"
+    def build():
+        audio = (
+            db.query(*(AUDIO_RESPONSE_COLUMNS[name] for name in names))
+            .filter(AudioFile.id == audio_id, AudioFile.user_id == current_user.id)
+            .first()
         )
 
-    return AudioResponse.model_validate(audio)
+        if not audio:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="audio file not found"
+            )
+
+        return dict(zip(names, audio))
+
+    return cached_response(request, library_namespace(current_user.id), build)
 
 
 @router.get(
@@ -113,34 +509,59 @@ def get_audio(
     description="get temp presigned url for streaming audio",
 )
 def get_stream_url(
-    audio_id: int, current_user: CurrentUser, db: Annotated[Session, Depends(get_db)]
+    audio_id: int,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+    quality: StreamQuality = Query(
+        StreamQuality.ORIGINAL,
+        description="low for metered connections, the original is served when there is no rendition",
+    ),
 ):
     """
     get presigned url for streaming audio
     """
-    audio = (
-        db.query(AudioFile)
-        .filter(AudioFile.id == audio_id, AudioFile.user_id == current_user.id)
-        .first()
-    )
-    if not audio:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="audio file not found"
-        )
 
-    from utils.storage import generate_presigned_url
-
-    stream_url = generate_presigned_url(audio.file_url, expiration=3600)
-
-    return {
-        "stream_url": stream_url,
-        "expires_in": 3600,
-        "audio_id": audio_id,
-        "title": audio.title,
-        "author": audio.author,
-        "duation": audio.duration,
-        "file_size": audio.file_size,
-    }
+    def presign():
+        audio = (
+            db.query(AudioFile)
+            .filter(AudioFile.id == audio_id, AudioFile.user_id == current_user.id)
+            .first()
+        )
+        if not audio:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="audio file not found"
+            )
+
+        rendition = None
+        if quality != StreamQuality.ORIGINAL:
+            rendition = (
+                db.query(AudioRendition)
+                .filter(
+                    AudioRendition.audio_id == audio_id,
+                    AudioRendition.quality == quality.value,
+                )
+                .first()
+            )
+
+        from utils.storage import generate_presigned_url
+
+        file_url = rendition.file_url if rendition else audio.file_url
+        stream_url = generate_presigned_url(file_url, expiration=3600)
+
+        return {
+            "stream_url": stream_url,
+            "expires_in": 3600,
+            "audio_id": audio_id,
+            "title": audio.title,
+            "author": audio.author,
+            "duation": audio.duration,
+            "file_size": rendition.file_size if rendition else audio.file_size,
+            # the seek index is for the original, renditions are constant bitrate
+            "quality": rendition.quality if rendition else StreamQuality.ORIGINAL.value,
+        }
+
+    # devices opening the same track together share one lookup and presign
+    return single_flight.do(("stream", current_user.id, audio_id, quality), presign)
 
 
 @router.get(
@@ -182,6 +603,223 @@ def get_stream_url(
     }
 
 
+def presigned_derived_file(
+    db: Session, audio_id: int, user_id: int, column, name: str
+) -> dict:
+    row = (
+        db.query(column)
+        .filter(AudioFile.id == audio_id, AudioFile.user_id == user_id)
+        .first()
+    )
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="audio file not found"
+        )
+
+    # still processing, or nothing to make one from
+    if row[0] is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"{name} not available"
+        )
+
+    from utils.storage import generate_presigned_url
+
+    return {
+        f"{name}_url": generate_presigned_url(row[0], expiration=3600),
+        "expires_in": 3600,
+        "audio_id": audio_id,
+    }
+
+
+@router.get(
+    "/{audio_id}/preview",
+    summary="get preview url",
+    description="get temp presigned url for a short clip of the audio, for browsing",
+)
+def get_preview_url(
+    audio_id: int, current_user: CurrentUser, db: Annotated[Session, Depends(get_db)]
+):
+    return presigned_derived_file(
+        db, audio_id, current_user.id, AudioFile.preview_url, "preview"
+    )
+
+
+@router.get(
+    "/{audio_id}/cover",
+    summary="get cover url",
+    description="get temp presigned url for the cover art thumbnail",
+)
+def get_cover_url(
+    audio_id: int, current_user: CurrentUser, db: Annotated[Session, Depends(get_db)]
+):
+    return presigned_derived_file(
+        db, audio_id, current_user.id, AudioFile.cover_url, "cover"
+    )
+
+
+@router.get(
+    "/{audio_id}/ingest",
+    response_model=IngestStatusResponse,
+    summary="get processing status",
+    description="background processing state of an uploaded file",
+)
+def get_ingest_status(
+    audio_id: int, current_user: CurrentUser, db: Annotated[Session, Depends(get_db)]
+):
+    row = (
+        db.query(
+            AudioFile.status,
+            IngestJob.status.label("job_status"),
+            IngestJob.attempts,
+            IngestJob.last_error,
+            IngestJob.updated_at,
+        )
+        .outerjoin(IngestJob, IngestJob.audio_id == AudioFile.id)
+        .filter(AudioFile.id == audio_id, AudioFile.user_id == current_user.id)
+        .first()
+    )
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="audio file not found"
+        )
+
+    return IngestStatusResponse(
+        audio_id=audio_id,
+        status=row.status,
+        job_status=row.job_status,
+        attempts=row.attempts or 0,
+        last_error=row.last_error,
+        updated_at=row.updated_at,
+    )
+
+
+def load_seek_index(db: Session, audio_id: int, user_id: int) -> AudioSeekIndex:
+    seek_index = (
+        db.query(AudioSeekIndex)
+        .join(AudioFile, AudioFile.id == AudioSeekIndex.audio_id)
+        .filter(AudioSeekIndex.audio_id == audio_id, AudioFile.user_id == user_id)
+        .first()
+    )
+
+    # also while the upload is still processing
+    if not seek_index:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="seek index not available"
+        )
+
+    return seek_index
+
+
+@router.get(
+    "/{audio_id}/seek-index",
+    response_model=SeekIndexResponse,
+    responses=NEGOTIATED_RESPONSES,
+    summary="get seek index",
+    description="byte offset for every second of the file, fetch once and seek with exact Range requests",
+)
+def get_seek_index(
+    audio_id: int,
+    request: Request,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+):
+    def build():
+        seek_index = load_seek_index(db, audio_id, current_user.id)
+
+        return {
+            "audio_id": audio_id,
+            "interval_seconds": seek_index.interval_seconds,
+            "offsets": unpack_offsets(seek_index.offsets).tolist(),
+        }
+
+    return cached_response(request, library_namespace(current_user.id), build)
+
+
+@router.get(
+    "/{audio_id}/seek",
+    response_model=SeekPositionResponse,
+    summary="get offset for a time",
+    description="byte offset to request to play from t seconds, for clients that do not keep the seek index",
+)
+def get_seek_position(
+    audio_id: int,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+    t: float = Query(..., ge=0, description="seconds from the start"),
+):
+    seek_index = load_seek_index(db, audio_id, current_user.id)
+    offsets = unpack_offsets(seek_index.offsets)
+    interval = seek_index.interval_seconds
+
+    entry = seek_entry(offsets, interval, t)
+    offset = offsets[entry]
+
+    return SeekPositionResponse(
+        audio_id=audio_id,
+        seconds=entry * interval,
+        offset=offset,
+        range=f"bytes={offset}-",
+    )
+
+
+@router.put(
+    "/{audio_id}/progress",
+    response_model=PlaybackProgressResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="record playback progress",
+    description="heartbeat with the current position, written to the database in batches",
+)
+def record_progress(
+    audio_id: int,
+    progress: PlaybackProgressUpdate,
+    current_user: CurrentUser,
+):
+    """
+    only touches the in-process buffer, ownership is enforced when the
+    buffer is flushed
+    """
+    received_at = progress_buffer.record(current_user.id, audio_id, progress.position)
+
+    return PlaybackProgressResponse(
+        audio_id=audio_id, position=progress.position, updated_at=received_at
+    )
+
+
+@router.get(
+    "/{audio_id}/progress",
+    response_model=PlaybackProgressResponse,
+    summary="get playback progress",
+    description="get resume position for an audio file",
+)
+def get_progress(
+    audio_id: int, current_user: CurrentUser, db: Annotated[Session, Depends(get_db)]
+):
+    # a heartbeat still waiting in this worker's buffer is the newest
+    pending = progress_buffer.peek(current_user.id, audio_id)
+    if pending:
+        position, received_at = pending
+        return PlaybackProgressResponse(
+            audio_id=audio_id, position=position, updated_at=received_at
+        )
+
+    progress = (
+        db.query(PlaybackProgress)
+        .filter(
+            PlaybackProgress.user_id == current_user.id,
+            PlaybackProgress.audio_id == audio_id,
+        )
+        .first()
+    )
+    if not progress:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="no progress recorded"
+        )
+
+    return PlaybackProgressResponse(
+        audio_id=audio_id, position=progress.position, updated_at=progress.updated_at
+    )
+
+
 @router.put(
     "/{audio_id}",
     response_model=AudioResponse,
@@ -211,6 +849,11 @@ def update_audio(
         setattr(audio, field, value)
 
     try:
+        publish_event(db, current_user.id, "audio.updated", audio_id=audio_id)
+        # playlist details show titles and authors too
+        invalidate_on_commit(
+            db, library_namespace(current_user.id), playlists_namespace(current_user.id)
+        )
         db.commit()
         db.refresh(audio)
     except Exception as e:
@@ -245,10 +888,25 @@ def delete_audio(
             status_code=status.HTTP_NOT_FOUND, detail="audio file not found"
         )
 
-    delete_audio_file(audio.file_url)
+    renditions = db.query(AudioRendition.file_url).filter(
+        AudioRendition.audio_id == audio_id
+    )
+    for file_url in [audio.file_url, audio.preview_url, audio.cover_url] + [
+        row.file_url for row in renditions
+    ]:
+        if file_url:
+            delete_audio_file(file_url)
 
     try:
+        # playlist items cascade away with the audio file
+        detach_audio_from_playlists(db, audio)
+        drop_audio_from_queue(db, current_user.id, audio_id)
         db.delete(audio)
+        # also means it left every playlist it was in
+        publish_event(db, current_user.id, "audio.deleted", audio_id=audio_id)
+        invalidate_on_commit(
+            db, library_namespace(current_user.id), playlists_namespace(current_user.id)
+        )
         db.commit()
     except Exception as e:
         db.rollback()
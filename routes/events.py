@@ -0,0 +1,125 @@
+"""
+server sent events stream of library changes
+
+one long lived GET per device. events are compact, the type and the
+ids that changed, clients refetch what they need (the batch endpoint
+takes a list of ids). a resync event means events were dropped and the
+client should refetch everything it shows, which it should also do
+after reconnecting
+"""
+
+import json
+import os
+import time
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from database.db import SessionLocal
+from models.audio import User
+from utils.events import broadcaster
+from utils.jwt import verify_token
+
+router = APIRouter()
+
+# comment line sent when idle so proxies and clients keep the connection
+HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# client reconnect delay, milliseconds
+RETRY_MS = 5000
+
+optional_bearer = HTTPBearer(auto_error=False)
+
+
+def event_stream_user(
+    credentials: Annotated[
+        Optional[HTTPAuthorizationCredentials], Depends(optional_bearer)
+    ],
+    access_token: Optional[str] = Query(
+        None, description="token for clients that cannot send headers (EventSource)"
+    ),
+) -> tuple[int, float]:
+    """
+    user id and token expiry
+
+    does not use CurrentUser, its session would stay checked out for as
+    long as the stream is open
+    """
+    token = credentials.credentials if credentials else access_token
+    if token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    payload = verify_token(token)
+    user_id = int(payload["sub"])
+
+    db = SessionLocal()
+    try:
+        exists = db.query(User.id).filter(User.id == user_id).first()
+    finally:
+        db.close()
+
+    if exists is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="user not found",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return user_id, float(payload["exp"])
+
+
+def sse(event: dict) -> str:
+    return (
+        f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+    )
+
+
+async def event_lines(request: Request, user_id: int, expires_at: float):
+    subscriber = broadcaster.subscribe(user_id)
+
+    try:
+        yield f"retry: {RETRY_MS}\n" + sse({"type": "ready"})
+
+        # ends with the token, the client reconnects with a fresh one
+        while time.time() < expires_at:
+            timeout = min(HEARTBEAT_SECONDS, max(expires_at - time.time(), 0))
+            event = await subscriber.next(timeout)
+
+            if event is None:
+                if await request.is_disconnected():
+                    break
+                yield ": heartbeat\n\n"
+            else:
+                yield sse(event)
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+@router.get(
+    "/",
+    summary="stream library changes",
+    description="server sent events for uploads, edits, deletes and playlist changes from any device",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+async def stream_events(
+    request: Request,
+    user: Annotated[tuple[int, float], Depends(event_stream_user)],
+):
+    user_id, expires_at = user
+
+    return StreamingResponse(
+        event_lines(request, user_id, expires_at),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # stops nginx from buffering the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
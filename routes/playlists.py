@@ -1,22 +1,94 @@
-from typing import Annotated
+from typing import Annotated, Optional
 from database.db import get_db
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    status,
+)
 from models.audio import AudioFile, Playlist, PlaylistItem
 from schemas.playlist import (
-    AudioInPlaylist,
     PlaylistCreate,
     PlaylistDetailResponse,
     PlaylistItemAdd,
+    PlaylistItemsBatch,
+    PlaylistItemsBatchResponse,
     PlaylistListResponse,
     PlaylistResponse,
     PlaylistUpdate,
 )
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import case, delete, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from utils.cache import cached_response, playlists_namespace
 from utils.dependencies import CurrentUser
+from utils.events import publish_event
+from utils.invalidation import invalidate_on_commit
+from utils.playlist_counters import adjust_playlist_counters
+from utils.ordering import (
+    PlaylistOrder,
+    order_for_position,
+    rebalance_playlist_task,
+)
+from utils.serialization import (
+    NEGOTIATED_RESPONSES,
+    FieldsQuery,
+    parse_fields,
+    rows_to_dicts,
+)
 
 router = APIRouter()
 
+# columns selected for playlist list responses, keyed by PlaylistResponse field
+PLAYLIST_RESPONSE_COLUMNS = {
+    "id": Playlist.id,
+    "user_id": Playlist.user_id,
+    "name": Playlist.name,
+    "audio_count": Playlist.item_count,
+    "total_duration": Playlist.total_duration,
+    "total_size": Playlist.total_size,
+    "created_at": Playlist.created_at,
+    "updated_at": Playlist.updated_at,
+}
+PLAYLIST_RESPONSE_FIELDS = list(PLAYLIST_RESPONSE_COLUMNS)
+
+# columns selected for playlist items, keyed by AudioInPlaylist field,
+# position is worked out from the window offset
+PLAYLIST_ITEM_COLUMNS = {
+    "id": AudioFile.id,
+    "title": AudioFile.title,
+    "author": AudioFile.author,
+    "duration": AudioFile.duration,
+    "file_size": AudioFile.file_size,
+    "position": None,
+    "added_at": PlaylistItem.added_at,
+}
+PLAYLIST_ITEM_FIELDS = list(PLAYLIST_ITEM_COLUMNS)
+
+
+def encode_cursor(order: int, item_id: int, position: int) -> str:
+    """
+    opaque keyset cursor, sort key and id of the last item and its index
+
+    sort keys are not unique, midpoint inserts can tie, so the id is part
+    of the key the same way it breaks ties in the page order
+    """
+    return f"{order}.{item_id}.{position}"
+
+
+def decode_cursor(cursor: str) -> tuple[int, int, int]:
+    try:
+        order, item_id, position = (int(part) for part in cursor.split("."))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="invalid cursor"
+        )
+
+    return order, item_id, position
+
 
 @router.post(
     "/",
@@ -37,6 +109,11 @@ def create_playlist(
 
     try:
         db.add(new_playlist)
+        db.flush()
+        publish_event(
+            db, current_user.id, "playlist.created", playlist_id=new_playlist.id
+        )
+        invalidate_on_commit(db, playlists_namespace(current_user.id))
         db.commit()
         db.refresh(new_playlist)
     except Exception as e:
@@ -51,7 +128,9 @@ def create_playlist(
         id=new_playlist.id,
         user_id=new_playlist.user_id,
         name=new_playlist.name,
-        audio_count=0,
+        audio_count=new_playlist.item_count,
+        total_duration=new_playlist.total_duration,
+        total_size=new_playlist.total_size,
         created_at=new_playlist.created_at,
         updated_at=new_playlist.updated_at,
     )
@@ -60,86 +139,137 @@ def create_playlist(
 @router.get(
     "/",
     response_model=PlaylistListResponse,
+    responses=NEGOTIATED_RESPONSES,
     summary="get users playlists",
     description="get all playlists for authenticated user",
 )
-def get_playlists(current_user: CurrentUser, db: Annotated[Session, Depends(get_db)]):
-    # returns list of tuples (Playlist object, audio_count number)
-    playlists = (
-        db.query(Playlist, func.count(PlaylistItem.id).label("audio_count"))
-        .outerjoin(PlaylistItem, Playlist.id == PlaylistItem.playlist_id)
-        .filter(Playlist.user_id == current_user.id)
-        .group_by(Playlist.id)
-        .order_by(Playlist.created_at.desc())
-        .all()
-    )
-
-    # tuple unpacking
-    playlist_responses = [
-        PlaylistResponse(
-            id=playlist.id,
-            user_id=playlist.user_id,
-            name=playlist.name,
-            audio_count=count,
-            created_at=playlist.created_at,
-            updated_at=playlist.updated_at,
+def get_playlists(
+    request: Request,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+    fields: FieldsQuery = None,
+):
+    names = parse_fields(fields, PLAYLIST_RESPONSE_FIELDS)
+
+    def build():
+        # counters are stored on the playlist row, no join or group by needed
+        playlists = rows_to_dicts(
+            names,
+            db.query(*(PLAYLIST_RESPONSE_COLUMNS[name] for name in names))
+            .filter(Playlist.user_id == current_user.id)
+            .order_by(Playlist.created_at.desc())
+            .all(),
         )
-        for playlist, count in playlists
-    ]
 
-    return PlaylistListResponse(
-        playlists=playlist_responses, total=len(playlist_responses)
-    )
+        return {"playlists": playlists, "total": len(playlists)}
+
+    return cached_response(request, playlists_namespace(current_user.id), build)
 
 
 @router.get(
     "/{playlist_id}",
     response_model=PlaylistDetailResponse,
+    responses=NEGOTIATED_RESPONSES,
     summary="get playlist details",
-    description="get playlist with all audio items",
+    description="get a window of playlist items by offset, around a position or after a cursor",
 )
 def get_playlist(
-    playlist_id: int, current_user: CurrentUser, db: Annotated[Session, Depends(get_db)]
+    playlist_id: int,
+    request: Request,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+    offset: int = Query(0, ge=0, description="index of the first item"),
+    limit: int = Query(100, ge=1, le=500, description="max items to return"),
+    around: Optional[int] = Query(
+        None, ge=0, description="center the window on this position"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="next_cursor of a previous page, continues after it"
+    ),
+    fields: FieldsQuery = None,
 ):
-    playlist = (
-        db.query(Playlist)
-        .filter(Playlist.id == playlist_id, Playlist.user_id == current_user.id)
-        .first()
-    )
-    if not playlist:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="playlist not found"
-        )
+    # applies to audio_items, the playlist itself is a single row
+    names = parse_fields(fields, PLAYLIST_ITEM_FIELDS)
+    columns = [
+        PLAYLIST_ITEM_COLUMNS[name].label(name)
+        for name in names
+        if PLAYLIST_ITEM_COLUMNS[name] is not None
+    ]
 
-    items = (
-        db.query(PlaylistItem, AudioFile)
-        .join(AudioFile, PlaylistItem.audio_id == AudioFile.id)
-        .filter(PlaylistItem.playlist_id == playlist_id)
-        .order_by(PlaylistItem.order)
-        .all()
-    )
+    def build():
+        start = offset
 
-    audio_items = [
-        AudioInPlaylist(
-            id=audio.id,
-            title=audio.title,
-            author=audio.author,
-            duration=audio.duration,
-            file_size=audio.file_size,
-            position=item.order,
-            added_at=item.added_at,
+        playlist = (
+            db.query(Playlist)
+            .filter(Playlist.id == playlist_id, Playlist.user_id == current_user.id)
+            .first()
+        )
+        if not playlist:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="playlist not found"
+            )
+
+        query = (
+            db.query(
+                *columns,
+                PlaylistItem.order.label("sort_key"),
+                PlaylistItem.id.label("item_key"),
+            )
+            .select_from(PlaylistItem)
+            .join(AudioFile, PlaylistItem.audio_id == AudioFile.id)
+            .filter(PlaylistItem.playlist_id == playlist_id)
+            .order_by(PlaylistItem.order, PlaylistItem.id)
         )
-        for item, audio in items
-    ]
 
-    return PlaylistDetailResponse(
-        id=playlist.id,
-        user_id=playlist.user_id,
-        name=playlist.name,
-        audio_items=audio_items,
-        created_at=playlist.created_at,
-        updated_at=playlist.updated_at,
-    )
+        if cursor is not None:
+            # keyset on idx_playlist_items_playlist, cost does not grow with depth
+            after_order, after_id, after_position = decode_cursor(cursor)
+            query = query.filter(
+                PlaylistItem.order >= after_order,
+                tuple_(PlaylistItem.order, PlaylistItem.id) > (after_order, after_id),
+            )
+            start = after_position + 1
+        else:
+            if around is not None:
+                start = max(around - limit // 2, 0)
+            query = query.offset(start)
+
+        # one extra row tells us whether there is another page
+        items = query.limit(limit + 1).all()
+        has_more = len(items) > limit
+        items = items[:limit]
+
+        # order is a sparse sort key, clients get the index
+        audio_items = [
+            {
+                name: start + index if name == "position" else getattr(item, name)
+                for name in names
+            }
+            for index, item in enumerate(items)
+        ]
+
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor(
+                items[-1].sort_key, items[-1].item_key, start + len(items) - 1
+            )
+
+        return {
+            "id": playlist.id,
+            "user_id": playlist.user_id,
+            "name": playlist.name,
+            "audio_count": playlist.item_count,
+            "total_duration": playlist.total_duration,
+            "total_size": playlist.total_size,
+            "audio_items": audio_items,
+            "offset": start,
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "created_at": playlist.created_at,
+            "updated_at": playlist.updated_at,
+        }
+
+    return cached_response(request, playlists_namespace(current_user.id), build)
 
 
 @router.put(
@@ -172,6 +302,8 @@ def update_playlist(
         setattr(playlist, field, value)
 
     try:
+        publish_event(db, current_user.id, "playlist.updated", playlist_id=playlist_id)
+        invalidate_on_commit(db, playlists_namespace(current_user.id))
         db.commit()
         db.refresh(playlist)
     except Exception as e:
@@ -182,17 +314,13 @@ def update_playlist(
             detail=f"failed to update playlist: {str(e)}",
         )
 
-    audio_count = (
-        db.query(func.count(PlaylistItem.id))
-        .filter(PlaylistItem.playlist_id == playlist_id)
-        .scalar()
-    )
-
     return PlaylistResponse(
         id=playlist.id,
         user_id=playlist.user_id,
         name=playlist.name,
-        audio_count=audio_count,
+        audio_count=playlist.item_count,
+        total_duration=playlist.total_duration,
+        total_size=playlist.total_size,
         created_at=playlist.created_at,
         updated_at=playlist.updated_at,
     )
@@ -209,10 +337,13 @@ def add_audio_to_playlist(
     item_data: PlaylistItemAdd,
     current_user: CurrentUser,
     db: Annotated[Session, Depends(get_db)],
+    background_tasks: BackgroundTasks,
 ):
+    # row lock keeps concurrent appends to this playlist from sharing a key
     playlist = (
         db.query(Playlist)
         .filter(Playlist.id == playlist_id, Playlist.user_id == current_user.id)
+        .with_for_update()
         .first()
     )
     if not playlist:
@@ -246,24 +377,22 @@ def add_audio_to_playlist(
             status_code=status.HTTP_409_CONFLICT, detail="audio already in playlist"
         )
 
-    # determine position
-    if item_data.position is not None:
-        position = item_data.position
-
-    else:
-        max_position = (
-            db.query(func.max(PlaylistItem.order))
-            .filter(PlaylistItem.playlist_id == playlist_id)
-            .scalar()
-        )
-        position = (max_position + 1) if max_position is not None else 0
+    # sort key between the new neighbours, only this row is written
+    order, crowded = order_for_position(db, playlist_id, item_data.position)
 
     new_item = PlaylistItem(
-        playlist_id=playlist_id, audio_id=item_data.audio_id, order=position
+        playlist_id=playlist_id, audio_id=item_data.audio_id, order=order
     )
 
+    # atomic increments, rendered as SET item_count = item_count + 1
+    playlist.item_count = Playlist.item_count + 1
+    playlist.total_duration = Playlist.total_duration + (audio.duration or 0)
+    playlist.total_size = Playlist.total_size + (audio.file_size or 0)
+
     try:
         db.add(new_item)
+        publish_event(db, current_user.id, "playlist.items", playlist_id=playlist_id)
+        invalidate_on_commit(db, playlists_namespace(current_user.id))
         db.commit()
 
     except Exception as e:
@@ -274,6 +403,9 @@ def add_audio_to_playlist(
             detail=f"failed to add audio to playlist: {str(e)}",
         )
 
+    if crowded:
+        background_tasks.add_task(rebalance_playlist_task, playlist_id)
+
     return {
         "message": "Audio added to playlist",
         "playlist_id": playlist_id,
@@ -295,6 +427,7 @@ def remove_audio_from_playlist(
     playlist = (
         db.query(Playlist)
         .filter(Playlist.id == playlist_id, Playlist.user_id == current_user.id)
+        .with_for_update()
         .first()
     )
     if not playlist:
@@ -316,6 +449,9 @@ def remove_audio_from_playlist(
 
     try:
         db.delete(item)
+        adjust_playlist_counters(db, playlist_id, [audio_id], sign=-1)
+        publish_event(db, current_user.id, "playlist.items", playlist_id=playlist_id)
+        invalidate_on_commit(db, playlists_namespace(current_user.id))
         db.commit()
     except Exception as e:
         db.rollback()
@@ -328,6 +464,157 @@ def remove_audio_from_playlist(
     return {"message": "audio removed from playlist"}
 
 
+@router.patch(
+    "/{playlist_id}/items",
+    response_model=PlaylistItemsBatchResponse,
+    summary="batch edit playlist items",
+    description="add, remove and reorder many audio files in one transaction",
+)
+def batch_edit_playlist_items(
+    playlist_id: int,
+    batch: PlaylistItemsBatch,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+    background_tasks: BackgroundTasks,
+):
+    """
+    runs a fixed number of statements regardless of batch size
+    """
+    # row lock serialises concurrent edits of the same playlist only
+    playlist = (
+        db.query(Playlist)
+        .filter(Playlist.id == playlist_id, Playlist.user_id == current_user.id)
+        .with_for_update()
+        .first()
+    )
+    if not playlist:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="playlist not found"
+        )
+
+    add_ids = list(dict.fromkeys(item.audio_id for item in batch.add))
+    move_ids = [item.audio_id for item in batch.move]
+
+    # verify ownership of every referenced audio file with one IN query
+    requested = set(add_ids) | set(move_ids)
+    if requested:
+        owned = set(
+            db.scalars(
+                select(AudioFile.id).where(
+                    AudioFile.id.in_(requested), AudioFile.user_id == current_user.id
+                )
+            )
+        )
+        missing = sorted(requested - owned)
+        if missing:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"audio files not found: {missing}",
+            )
+
+    removed, moved, added = [], [], []
+    crowded = False
+
+    try:
+        if batch.remove:
+            removed = list(
+                db.scalars(
+                    delete(PlaylistItem)
+                    .where(
+                        PlaylistItem.playlist_id == playlist_id,
+                        PlaylistItem.audio_id.in_(batch.remove),
+                    )
+                    .returning(PlaylistItem.audio_id)
+                )
+            )
+            adjust_playlist_counters(db, playlist_id, removed, sign=-1)
+
+        if batch.move or batch.add:
+            # read the sort keys once and place every item in memory
+            order = PlaylistOrder(
+                db.query(PlaylistItem.audio_id, PlaylistItem.order)
+                .filter(PlaylistItem.playlist_id == playlist_id)
+                .order_by(PlaylistItem.order, PlaylistItem.id)
+                .all()
+            )
+
+            for item in batch.move:
+                if item.audio_id in order:
+                    order.remove(item.audio_id)
+                    order.place(item.audio_id, item.position)
+                    moved.append(item.audio_id)
+
+            new_orders = order.add((item.audio_id, item.position) for item in batch.add)
+
+            # only moved rows change key unless the playlist was respaced
+            changed = {
+                audio_id: key
+                for audio_id, key in zip(order.audio_ids, order.keys)
+                if audio_id not in new_orders and (order.respaced or audio_id in moved)
+            }
+            if changed:
+                db.execute(
+                    update(PlaylistItem)
+                    .where(
+                        PlaylistItem.playlist_id == playlist_id,
+                        PlaylistItem.audio_id.in_(changed),
+                    )
+                    .values(order=case(changed, value=PlaylistItem.audio_id))
+                    .execution_options(synchronize_session=False)
+                )
+
+            if new_orders:
+                # duplicates are skipped by the unique (playlist_id, audio_id) index
+                added = list(
+                    db.scalars(
+                        insert(PlaylistItem)
+                        .values(
+                            [
+                                {
+                                    "playlist_id": playlist_id,
+                                    "audio_id": audio_id,
+                                    "order": key,
+                                }
+                                for audio_id, key in new_orders.items()
+                            ]
+                        )
+                        .on_conflict_do_nothing(
+                            index_elements=["playlist_id", "audio_id"]
+                        )
+                        .returning(PlaylistItem.audio_id)
+                    )
+                )
+                adjust_playlist_counters(db, playlist_id, added)
+
+            crowded = order.crowded()
+
+        publish_event(db, current_user.id, "playlist.items", playlist_id=playlist_id)
+        invalidate_on_commit(db, playlists_namespace(current_user.id))
+        db.commit()
+
+    except Exception as e:
+        db.rollback()
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"failed to edit playlist items: {str(e)}",
+        )
+
+    if crowded:
+        background_tasks.add_task(rebalance_playlist_task, playlist_id)
+
+    added_set = set(added)
+
+    return PlaylistItemsBatchResponse(
+        playlist_id=playlist_id,
+        added=[audio_id for audio_id in add_ids if audio_id in added_set],
+        skipped=[audio_id for audio_id in add_ids if audio_id not in added_set],
+        removed=removed,
+        moved=moved,
+    )
+
+
 @router.delete(
     "/{playlist_id}",
     summary="delete playlist",
@@ -348,6 +635,8 @@ def delete_playlist(
 
     try:
         db.delete(playlist)
+        publish_event(db, current_user.id, "playlist.deleted", playlist_id=playlist_id)
+        invalidate_on_commit(db, playlists_namespace(current_user.id))
         db.commit()
     except Exception as e:
         db.rollback()
@@ -0,0 +1,306 @@
+"""
+play queue routes
+
+the queue lives on the server so every device shares it, and each read
+returns presigned stream urls for the current and next tracks so the
+player can prefetch without another round trip per track change
+"""
+
+import secrets
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from database.db import get_db
+from models.audio import AudioFile, Playlist, PlaylistItem, PlayQueue
+from schemas.queue import (
+    PlayQueueAdvance,
+    PlayQueueCreate,
+    PlayQueueResponse,
+    PlayQueueUpdate,
+    QueueTrack,
+    RepeatMode,
+)
+from utils.dependencies import CurrentUser
+from utils.play_queue import play_order, step_index, upcoming_indexes
+from utils.storage import generate_presigned_url
+
+router = APIRouter()
+
+STREAM_URL_EXPIRES = 3600
+
+
+def queue_response(db: Session, queue: PlayQueue, prefetch: int) -> PlayQueueResponse:
+    """
+    current track plus the next prefetch tracks, metadata in one IN query
+    """
+    length = len(queue.audio_ids)
+    repeat = RepeatMode(queue.repeat)
+    index = queue.current_index
+
+    upcoming = upcoming_indexes(index, prefetch, length, repeat)
+    indexes = ([index] if index < length else []) + upcoming
+
+    audios = {
+        audio.id: audio
+        for audio in db.query(
+            AudioFile.id,
+            AudioFile.title,
+            AudioFile.author,
+            AudioFile.duration,
+            AudioFile.file_size,
+            AudioFile.file_url,
+        ).filter(
+            AudioFile.id.in_({queue.audio_ids[i] for i in indexes}),
+            AudioFile.user_id == queue.user_id,
+        )
+    }
+
+    def track(position: int):
+        audio = audios.get(queue.audio_ids[position])
+        if audio is None:
+            return None
+
+        return QueueTrack(
+            id=audio.id,
+            title=audio.title,
+            author=audio.author,
+            duration=audio.duration,
+            file_size=audio.file_size,
+            position=position,
+            stream_url=generate_presigned_url(
+                audio.file_url, expiration=STREAM_URL_EXPIRES
+            ),
+        )
+
+    upcoming_tracks = [track(position) for position in upcoming]
+
+    return PlayQueueResponse(
+        id=queue.id,
+        playlist_id=queue.playlist_id,
+        author=queue.author,
+        shuffle=queue.shuffle,
+        seed=queue.seed,
+        repeat=repeat,
+        position=index,
+        length=length,
+        expires_in=STREAM_URL_EXPIRES,
+        current=track(index) if index < length else None,
+        upcoming=[t for t in upcoming_tracks if t is not None],
+        updated_at=queue.updated_at,
+    )
+
+
+def get_user_queue(db: Session, user_id: int, for_update: bool = False) -> PlayQueue:
+    query = db.query(PlayQueue).filter(PlayQueue.user_id == user_id)
+    if for_update:
+        query = query.with_for_update()
+
+    queue = query.first()
+    if not queue:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="no play queue"
+        )
+
+    return queue
+
+
+@router.put(
+    "/",
+    response_model=PlayQueueResponse,
+    summary="start play queue",
+    description="build a play queue from a playlist or the library, replacing the current one",
+)
+def start_queue(
+    queue_data: PlayQueueCreate,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+):
+    if queue_data.playlist_id is not None:
+        playlist = (
+            db.query(Playlist)
+            .filter(
+                Playlist.id == queue_data.playlist_id,
+                Playlist.user_id == current_user.id,
+            )
+            .first()
+        )
+        if not playlist:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="playlist not found"
+            )
+
+        source = (
+            select(PlaylistItem.audio_id)
+            .where(PlaylistItem.playlist_id == queue_data.playlist_id)
+            .order_by(PlaylistItem.order, PlaylistItem.id)
+        )
+    else:
+        # same order as the library screen
+        source = (
+            select(AudioFile.id)
+            .where(AudioFile.user_id == current_user.id)
+            .order_by(AudioFile.author, AudioFile.id)
+        )
+        if queue_data.author is not None:
+            source = source.where(AudioFile.author == queue_data.author)
+
+    audio_ids = list(db.scalars(source))
+    if not audio_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="nothing to play"
+        )
+
+    start = queue_data.start_audio_id
+    if start is not None and start not in audio_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="audio not in queue source"
+        )
+
+    seed = None
+    if queue_data.shuffle:
+        seed = queue_data.seed if queue_data.seed is not None else secrets.randbits(31)
+
+    order = play_order(audio_ids, queue_data.shuffle, seed, start)
+    current_index = order.index(start) if start is not None else 0
+
+    values = {
+        "playlist_id": queue_data.playlist_id,
+        "author": queue_data.author,
+        "audio_ids": order,
+        "shuffle": queue_data.shuffle,
+        "seed": seed,
+        "repeat": queue_data.repeat.value,
+        "current_index": current_index,
+    }
+
+    try:
+        # one queue per user, a new queue replaces the old one
+        queue = db.scalars(
+            insert(PlayQueue)
+            .values(user_id=current_user.id, **values)
+            .on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={**values, "updated_at": func.now()},
+            )
+            .returning(PlayQueue),
+            execution_options={"populate_existing": True},
+        ).one()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"failed to start play queue: {str(e)}",
+        )
+
+    return queue_response(db, queue, queue_data.prefetch)
+
+
+@router.get(
+    "/",
+    response_model=PlayQueueResponse,
+    summary="get play queue",
+    description="current track and prefetch urls for the next tracks",
+)
+def get_queue(
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+    prefetch: int = Query(3, ge=0, le=10, description="stream urls to prefetch"),
+):
+    queue = get_user_queue(db, current_user.id)
+
+    return queue_response(db, queue, prefetch)
+
+
+@router.post(
+    "/advance",
+    response_model=PlayQueueResponse,
+    summary="advance play queue",
+    description="move to the next or previous track, honouring repeat mode",
+)
+def advance_queue(
+    advance: PlayQueueAdvance,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+):
+    # row lock so two devices advancing at once both count
+    queue = get_user_queue(db, current_user.id, for_update=True)
+
+    queue.current_index = step_index(
+        queue.current_index,
+        advance.steps,
+        len(queue.audio_ids),
+        RepeatMode(queue.repeat),
+        advance.skip,
+    )
+
+    try:
+        db.commit()
+        db.refresh(queue)
+    except Exception as e:
+        db.rollback()
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"failed to advance play queue: {str(e)}",
+        )
+
+    return queue_response(db, queue, advance.prefetch)
+
+
+@router.patch(
+    "/",
+    response_model=PlayQueueResponse,
+    summary="update play queue",
+    description="change repeat mode",
+)
+def update_queue(
+    queue_data: PlayQueueUpdate,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+    prefetch: int = Query(3, ge=0, le=10, description="stream urls to prefetch"),
+):
+    queue = get_user_queue(db, current_user.id, for_update=True)
+
+    if queue_data.repeat is not None:
+        queue.repeat = queue_data.repeat.value
+
+    try:
+        db.commit()
+        db.refresh(queue)
+    except Exception as e:
+        db.rollback()
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"failed to update play queue: {str(e)}",
+        )
+
+    return queue_response(db, queue, prefetch)
+
+
+@router.delete(
+    "/",
+    summary="clear play queue",
+    description="delete the current play queue",
+)
+def clear_queue(current_user: CurrentUser, db: Annotated[Session, Depends(get_db)]):
+    queue = get_user_queue(db, current_user.id)
+
+    try:
+        db.delete(queue)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"failed to clear play queue: {str(e)}",
+        )
+
+    return {"message": "play queue cleared"}
@@ -0,0 +1,464 @@
+"""
+resumable uploads, the tus 1.0 core protocol with the creation,
+termination and expiration extensions
+
+    POST   /api/uploads/       Upload-Length, Upload-Metadata -> Location
+    HEAD   /api/uploads/{id}   -> Upload-Offset, where to carry on from
+    PATCH  /api/uploads/{id}   Upload-Offset + a chunk of the file
+    DELETE /api/uploads/{id}   give up
+
+every chunk is one part of an s3 multipart upload, so chunks before the
+last must be at least 5MB. after a dropped connection the client asks
+HEAD for the offset and resends from there, losing at most one chunk.
+the last chunk completes the upload and answers with the new audio's id
+in Upload-Audio-Id, from there it is processed like any other upload.
+if that fails after the chunk was stored, HEAD answers Upload-Offset =
+Upload-Length and a PATCH with an empty body at that offset finishes it.
+an upload created with "batch" in its Upload-Metadata is only stored,
+its id is then sent with others to /api/audio/upload/batch
+"""
+
+import base64
+import os
+import secrets
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from pathlib import Path
+from typing import Annotated, Optional
+
+from botocore.exceptions import ClientError
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from database.db import get_db
+from models.audio import UploadSession
+from utils.dependencies import CurrentUser
+from utils.ingest import add_uploaded_audio
+from utils.metadata import title_and_author
+from utils.mpeg import looks_like_mp3
+from utils.storage import (
+    ALLOWED_EXTENSIONS,
+    SNIFF_BYTES,
+    abort_multipart_upload,
+    complete_multipart_upload,
+    new_audio_key,
+    s3_url_from_key,
+    start_multipart_upload,
+    stored_file_reader,
+    upload_part,
+)
+from utils.upload_guard import UPLOAD_MAX_BYTES, storage_left
+from utils.upload_sessions import discard_upload, upload_expiry
+
+router = APIRouter()
+
+TUS_VERSION = "1.0.0"
+
+# s3 rejects smaller parts except the last one
+UPLOAD_CHUNK_MIN_BYTES = 5 * 1024 * 1024
+
+# a chunk is held in memory while it is sent on to s3
+UPLOAD_CHUNK_MAX_BYTES = int(
+    os.environ.get("UPLOAD_CHUNK_MAX_BYTES", str(64 * 1024 * 1024))
+)
+
+CHUNK_CONTENT_TYPE = "application/offset+octet-stream"
+
+
+def tus_headers(session: Optional[UploadSession] = None, **headers) -> dict:
+    headers = {"Tus-Resumable": TUS_VERSION, **headers}
+    if session is not None:
+        headers["Upload-Offset"] = str(session.upload_offset)
+        headers["Upload-Length"] = str(session.upload_length)
+        headers["Upload-Expires"] = format_datetime(session.expires_at, usegmt=True)
+    return headers
+
+
+def check_tus_version(request: Request) -> None:
+    version = request.headers.get("tus-resumable")
+    if version is not None and version != TUS_VERSION:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=f"unsupported tus version {version}",
+            headers={"Tus-Version": TUS_VERSION},
+        )
+
+
+def int_header(request: Request, name: str) -> int:
+    value = request.headers.get(name, "")
+    if not value.isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{name} header must be a non negative integer",
+        )
+    return int(value)
+
+
+def parse_upload_metadata(header: str) -> dict[str, str]:
+    """
+    "key base64value,key base64value", values are optional
+    """
+    metadata = {}
+    for pair in filter(None, (pair.strip() for pair in header.split(","))):
+        key, _, value = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value).decode() if value else ""
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Upload-Metadata value for {key} is not base64",
+            )
+    return metadata
+
+
+def get_session(
+    db: Session, upload_id: str, user_id: int, lock: bool = False
+) -> UploadSession:
+    query = db.query(UploadSession).filter(
+        UploadSession.id == upload_id, UploadSession.user_id == user_id
+    )
+
+    if lock:
+        try:
+            # a second PATCH of the same upload must not interleave
+            query = query.with_for_update(nowait=True)
+            session = query.first()
+        except OperationalError:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="another request is writing to this upload",
+            )
+    else:
+        session = query.first()
+
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="upload not found"
+        )
+
+    return session
+
+
+@router.options(
+    "/",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="upload capabilities",
+    description="tus versions, extensions and size limit supported",
+)
+def upload_options():
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT,
+        headers=tus_headers(
+            **{
+                "Tus-Version": TUS_VERSION,
+                "Tus-Extension": "creation,termination,expiration",
+                "Tus-Max-Size": str(UPLOAD_MAX_BYTES),
+            }
+        ),
+    )
+
+
+@router.post(
+    "/",
+    status_code=status.HTTP_201_CREATED,
+    summary="start resumable upload",
+    description="Upload-Length is the file size, Upload-Metadata may carry filename, title, author and batch. the upload url is in Location",
+)
+def create_upload(
+    request: Request,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+):
+    check_tus_version(request)
+
+    upload_length = int_header(request, "upload-length")
+    metadata = parse_upload_metadata(request.headers.get("upload-metadata", ""))
+    filename = metadata.get("filename") or "audio.mp3"
+
+    if Path(filename).suffix.lower() not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"invalid file type. only mp3 files are allowed. got: {filename}",
+        )
+
+    if upload_length == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="file is empty"
+        )
+
+    if upload_length > UPLOAD_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"upload is larger than the {UPLOAD_MAX_BYTES} byte limit",
+        )
+
+    left = storage_left(current_user.id)
+    if left is not None and upload_length > left:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"upload would exceed your storage quota, {left} bytes left",
+        )
+
+    s3_key = new_audio_key(current_user.id, filename)
+    s3_upload_id = start_multipart_upload(s3_key, current_user.id, filename)
+
+    session = UploadSession(
+        id=secrets.token_hex(16),
+        user_id=current_user.id,
+        s3_key=s3_key,
+        s3_upload_id=s3_upload_id,
+        filename=filename[:255],
+        title=(metadata.get("title") or None),
+        author=(metadata.get("author") or None),
+        batch="batch" in metadata,
+        upload_length=upload_length,
+        upload_offset=0,
+        part_etags=[],
+        expires_at=upload_expiry(),
+    )
+
+    try:
+        db.add(session)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        abort_multipart_upload(s3_key, s3_upload_id)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"failed to start upload: {str(e)}",
+        )
+
+    return Response(
+        status_code=status.HTTP_201_CREATED,
+        headers=tus_headers(
+            session, Location=f"{request.url.path.rstrip('/')}/{session.id}"
+        ),
+    )
+
+
+@router.head(
+    "/{upload_id}",
+    summary="get upload offset",
+    description="bytes received so far, resume the upload from Upload-Offset",
+)
+def get_upload_offset(
+    upload_id: str,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+):
+    session = get_session(db, upload_id, current_user.id)
+
+    return Response(headers=tus_headers(session, **{"Cache-Control": "no-store"}))
+
+
+def write_chunk(
+    db: Session, upload_id: str, user_id: int, offset: int, chunk: bytes
+) -> dict:
+    """
+    sends chunk on as the next part, completes the upload with the last
+
+    returns:
+        response headers
+    """
+    session = get_session(db, upload_id, user_id, lock=True)
+
+    if session.expires_at < datetime.now(timezone.utc):
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE, detail="upload has expired"
+        )
+
+    if offset != session.upload_offset:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload-Offset {offset} does not match the {session.upload_offset} bytes received",
+            headers=tus_headers(session),
+        )
+
+    if not chunk and offset == session.upload_length:
+        # every part is stored, an earlier request failed to finish
+        return finish_upload(db, session, user_id)
+
+    end = offset + len(chunk)
+    if not chunk or end > session.upload_length:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="chunk is empty or runs past Upload-Length",
+        )
+
+    if end < session.upload_length and len(chunk) < UPLOAD_CHUNK_MIN_BYTES:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"chunks before the last must be at least {UPLOAD_CHUNK_MIN_BYTES} bytes",
+        )
+
+    if offset == 0 and not looks_like_mp3(chunk[:SNIFF_BYTES]):
+        discard_upload(session)
+        db.delete(session)
+        db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="file is not an mp3, no ID3 tag or mpeg audio frames at its start",
+        )
+
+    try:
+        # a retried chunk gets the same part number and replaces the part
+        etag = upload_part(
+            session.s3_key,
+            session.s3_upload_id,
+            len(session.part_etags) + 1,
+            chunk,
+        )
+
+        session.part_etags = session.part_etags + [etag]
+        session.upload_offset = end
+        session.expires_at = upload_expiry()
+        headers = tus_headers(session)
+        finished = end == session.upload_length
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"failed to store chunk: {str(e)}",
+        )
+
+    if not finished:
+        return headers
+
+    # the parts are recorded, if finishing fails a retry picks up from here
+    session = get_session(db, upload_id, user_id, lock=True)
+    return finish_upload(db, session, user_id)
+
+
+def finish_upload(db: Session, session: UploadSession, user_id: int) -> dict:
+    """
+    completes the multipart upload of a session holding every part and,
+    unless a batch upload claims it, adds the audio and drops the session
+    in one transaction. on failure the session is left as it was
+
+    returns:
+        response headers
+    """
+    try:
+        try:
+            complete_multipart_upload(
+                session.s3_key, session.s3_upload_id, session.part_etags
+            )
+        except ClientError as e:
+            # completed by an earlier request that failed to commit
+            if e.response["Error"]["Code"] != "NoSuchUpload":
+                raise
+
+        headers = tus_headers(session)
+
+        if session.batch:
+            # claimed by a batch upload before it expires
+            db.commit()
+            return headers
+
+        file_url = s3_url_from_key(session.s3_key)
+        title, author = title_and_author(
+            session.title,
+            session.author,
+            stored_file_reader(file_url),
+            session.upload_length,
+            session.filename,
+        )
+        audio = add_uploaded_audio(
+            db, user_id, title, author, file_url, session.upload_length
+        )
+        db.delete(session)
+        db.commit()
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"failed to finish upload: {str(e)}",
+        )
+
+    headers["Upload-Audio-Id"] = str(audio.id)
+    return headers
+
+
+@router.patch(
+    "/{upload_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="upload chunk",
+    description="body is the file from Upload-Offset on, content type application/offset+octet-stream",
+)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+):
+    check_tus_version(request)
+
+    if request.headers.get("content-type") != CHUNK_CONTENT_TYPE:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"chunks must be sent as {CHUNK_CONTENT_TYPE}",
+        )
+
+    offset = int_header(request, "upload-offset")
+
+    # checked before the body is read
+    if "content-length" not in request.headers:
+        raise HTTPException(
+            status_code=status.HTTP_411_LENGTH_REQUIRED,
+            detail="chunks need a Content-Length",
+        )
+    if int_header(request, "content-length") > UPLOAD_CHUNK_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"chunks may be at most {UPLOAD_CHUNK_MAX_BYTES} bytes",
+        )
+
+    chunk = await request.body()
+
+    # s3 and the database block, keep them off the event loop
+    headers = await run_in_threadpool(
+        write_chunk, db, upload_id, current_user.id, offset, chunk
+    )
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=headers)
+
+
+@router.delete(
+    "/{upload_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="cancel upload",
+    description="abort a resumable upload and drop the parts received",
+)
+def cancel_upload(
+    upload_id: str,
+    request: Request,
+    current_user: CurrentUser,
+    db: Annotated[Session, Depends(get_db)],
+):
+    check_tus_version(request)
+
+    session = get_session(db, upload_id, current_user.id, lock=True)
+
+    discard_upload(session)
+
+    try:
+        db.delete(session)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"failed to cancel upload: {str(e)}",
+        )
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=tus_headers())
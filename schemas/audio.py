@@ -16,6 +16,21 @@ class AudioCategory(str, Enum):
     REMINDER = "reminder"
 
 
+class AudioStatus(str, Enum):
+    """ingest state of an uploaded file"""
+
+    PROCESSING = "processing"
+    READY = "ready"
+    FAILED = "failed"
+
+
+class StreamQuality(str, Enum):
+    """original upload or one of the renditions in utils.renditions"""
+
+    ORIGINAL = "original"
+    LOW = "low"
+
+
 class AudioUploadRequest(BaseModel):
     """
     schema for audio upload metadata
@@ -75,10 +90,22 @@ class AudioResponse(BaseModel):
 
     file_url: str = Field(..., description="cloud storage url for audio file")
 
+    preview_url: Optional[str] = Field(
+        None, description="storage url of a short clip, get it with /{id}/preview"
+    )
+
+    cover_url: Optional[str] = Field(
+        None, description="storage url of the cover thumbnail, get it with /{id}/cover"
+    )
+
     duration: Optional[int] = Field(None, description="duration in seconds", ge=0)
 
     file_size: Optional[int] = Field(None, description="file size in bytes", ge=0)
 
+    status: AudioStatus = Field(
+        AudioStatus.READY, description="processing until ingest has filled in duration"
+    )
+
     created_at: datetime = Field(..., description="creation timestamps")
 
     updated_at: datetime = Field(..., description="last updated timestamp")
@@ -92,8 +119,11 @@ class AudioResponse(BaseModel):
                 "title": "Surah Al-Baqarah",
                 "author": "Sheikh Mustafa Al-Shaybani",
                 "file_url": "https://storage.example.com/audio/abc123.mp3",
+                "preview_url": "https://storage.example.com/audio/abc123.preview.mp3",
+                "cover_url": "https://storage.example.com/audio/abc123.cover.jpg",
                 "duration": 3600,
                 "file_size": 52428800,
+                "status": "ready",
                 "created_at": "2025-01-10T12:00:00Z",
                 "updated_at": "2025-01-10T12:00:00Z",
             }
@@ -123,6 +153,7 @@ class AudioLibraryResponse(BaseModel):
                         "file_url": "https://storage.example.com/audio/abc123.mp3",
                         "duration": 3600,
                         "file_size": 52428800,
+                        "status": "ready",
                         "created_at": "2025-01-10T12:00:00Z",
                         "updated_at": "2025-01-10T12:00:00Z",
                     },
@@ -134,6 +165,7 @@ class AudioLibraryResponse(BaseModel):
                         "file_url": "https://storage.example.com/audio/def456.mp3",
                         "duration": 2700,
                         "file_size": 41943040,
+                        "status": "ready",
                         "created_at": "2025-01-09T10:30:00Z",
                         "updated_at": "2025-01-09T10:30:00Z",
                     },
@@ -143,6 +175,31 @@ class AudioLibraryResponse(BaseModel):
         }
 
 
+class AudioBatchRequest(BaseModel):
+    """
+    ids to fetch in one request, for lists too long for a query string
+    """
+
+    ids: List[int] = Field(..., min_length=1, description="audio file ids")
+
+    class Config:
+        json_schema_extra = {"example": {"ids": [3, 1, 2]}}
+
+
+class AudioBatchResponse(BaseModel):
+    """
+    audio files in the order the ids were asked for
+    """
+
+    audios: List[AudioResponse] = Field(
+        ..., description="owned audio files in request order"
+    )
+
+    missing: List[int] = Field(
+        ..., description="requested ids that do not exist or belong to someone else"
+    )
+
+
 class AudioUploadResponse(BaseModel):
     """
     response after successful audio upload
@@ -169,6 +226,86 @@ class AudioUploadResponse(BaseModel):
         }
 
 
+class AudioUploadResult(BaseModel):
+    """
+    outcome of one file of a batch upload
+    """
+
+    filename: Optional[str] = Field(None, description="uploaded file name")
+
+    upload_id: Optional[str] = Field(None, description="resumable upload claimed")
+
+    status_code: int = Field(
+        ..., description="202 when added, otherwise the error status"
+    )
+
+    detail: Optional[str] = Field(None, description="why the file was not added")
+
+    audio: Optional[AudioResponse] = Field(None, description="the audio added")
+
+
+class AudioUploadBatchResponse(BaseModel):
+    """
+    one result per file, uploaded files first then upload ids, each in
+    request order
+    """
+
+    results: List[AudioUploadResult] = Field(..., description="per file outcome")
+
+    added: int = Field(..., description="files added", ge=0)
+
+    failed: int = Field(..., description="files rejected", ge=0)
+
+
+class IngestStatusResponse(BaseModel):
+    """
+    progress of the background processing of an upload
+    """
+
+    audio_id: int = Field(..., description="audio file id")
+
+    status: AudioStatus = Field(..., description="audio file status")
+
+    job_status: Optional[str] = Field(
+        None, description="queued, running, done or failed"
+    )
+
+    attempts: int = Field(0, description="processing runs so far", ge=0)
+
+    last_error: Optional[str] = Field(None, description="error of the last failed run")
+
+    updated_at: Optional[datetime] = Field(None, description="last job update")
+
+
+class SeekIndexResponse(BaseModel):
+    """
+    byte offset of the frame playing at every interval of an audio file
+    """
+
+    audio_id: int = Field(..., description="audio file id")
+
+    interval_seconds: int = Field(..., description="seconds between entries", gt=0)
+
+    offsets: list[int] = Field(
+        ...,
+        description="entry n is where playback from n * interval_seconds starts, request bytes=offset-",
+    )
+
+
+class SeekPositionResponse(BaseModel):
+    """
+    where to start reading to play from a point in time
+    """
+
+    audio_id: int = Field(..., description="audio file id")
+
+    seconds: float = Field(..., description="time of the frame at offset", ge=0)
+
+    offset: int = Field(..., description="byte offset of that frame", ge=0)
+
+    range: str = Field(..., description="Range header value for the request")
+
+
 class AudioDeleteResponse(BaseModel):
     """
     response after successful audio deletion
@@ -186,6 +323,35 @@ class AudioDeleteResponse(BaseModel):
         }
 
 
+class PlaybackProgressUpdate(BaseModel):
+    """
+    playback heartbeat sent every few seconds while listening
+    """
+
+    position: int = Field(..., ge=0, description="current position in seconds")
+
+
+class PlaybackProgressResponse(BaseModel):
+    """
+    resume position for an audio file
+    """
+
+    audio_id: int = Field(..., description="audio file id")
+
+    position: int = Field(..., description="resume position in seconds", ge=0)
+
+    updated_at: datetime = Field(..., description="when the position was recorded")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "audio_id": 1,
+                "position": 1834,
+                "updated_at": "2025-01-10T12:00:00Z",
+            }
+        }
+
+
 class ErrorResponse(BaseModel):
     """
     standard error response format
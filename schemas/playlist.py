@@ -18,6 +18,35 @@ class PlaylistItemAdd(BaseModel):
     )
 
 
+class PlaylistItemMove(BaseModel):
+    audio_id: int = Field(..., description="audio file id to move")
+    position: int = Field(..., ge=0, description="new position in playlist")
+
+
+class PlaylistItemsBatch(BaseModel):
+    """
+    bulk playlist edit, applied in one transaction as removes, moves then adds
+    """
+
+    add: List[PlaylistItemAdd] = Field(
+        default_factory=list, max_length=1000, description="audio files to add"
+    )
+    remove: List[int] = Field(
+        default_factory=list, max_length=1000, description="audio file ids to remove"
+    )
+    move: List[PlaylistItemMove] = Field(
+        default_factory=list, max_length=1000, description="audio files to reorder"
+    )
+
+
+class PlaylistItemsBatchResponse(BaseModel):
+    playlist_id: int
+    added: List[int] = Field(..., description="audio ids added to playlist")
+    skipped: List[int] = Field(..., description="audio ids already in playlist")
+    removed: List[int] = Field(..., description="audio ids removed from playlist")
+    moved: List[int] = Field(..., description="audio ids moved within playlist")
+
+
 class AudioInPlaylist(BaseModel):
     id: int
     title: str
@@ -35,6 +64,8 @@ class PlaylistResponse(BaseModel):
     user_id: int
     name: str
     audio_count: int
+    total_duration: int = Field(0, description="sum of item durations in seconds")
+    total_size: int = Field(0, description="sum of item file sizes in bytes")
     created_at: datetime
     updated_at: datetime
 
@@ -45,7 +76,17 @@ class PlaylistDetailResponse(BaseModel):
     id: int
     user_id: int
     name: str
-    audio_items: List[AudioInPlaylist]
+    audio_count: int = Field(..., description="total items in playlist")
+    total_duration: int = Field(0, description="sum of item durations in seconds")
+    total_size: int = Field(0, description="sum of item file sizes in bytes")
+    audio_items: List[AudioInPlaylist] = Field(
+        ..., description="window of items starting at offset"
+    )
+    offset: int = Field(0, description="position of the first returned item")
+    limit: int = Field(..., description="max items per window")
+    next_cursor: Optional[str] = Field(
+        None, description="pass as cursor to fetch the next window, null at the end"
+    )
     created_at: datetime
     updated_at: datetime
 
@@ -0,0 +1,77 @@
+from typing import Optional, List
+from datetime import datetime
+from pydantic import BaseModel, Field, model_validator
+from enum import Enum
+
+
+class RepeatMode(str, Enum):
+    """repeat modes for the play queue"""
+
+    OFF = "off"
+    ALL = "all"
+    ONE = "one"
+
+
+class PlayQueueCreate(BaseModel):
+    """
+    build a queue from a playlist or the library (optionally one author)
+    """
+
+    playlist_id: Optional[int] = Field(None, description="source playlist")
+    author: Optional[str] = Field(
+        None, max_length=255, description="library author filter"
+    )
+    start_audio_id: Optional[int] = Field(None, description="track to start with")
+    shuffle: bool = Field(False, description="shuffle play order")
+    seed: Optional[int] = Field(
+        None, ge=0, description="shuffle seed, random when not given"
+    )
+    repeat: RepeatMode = Field(RepeatMode.OFF, description="repeat mode")
+    prefetch: int = Field(3, ge=0, le=10, description="stream urls to prefetch")
+
+    @model_validator(mode="after")
+    def validate_source(self):
+        if self.playlist_id is not None and self.author is not None:
+            raise ValueError("use either playlist_id or author, not both")
+        return self
+
+
+class PlayQueueUpdate(BaseModel):
+    repeat: Optional[RepeatMode] = Field(None, description="repeat mode")
+
+
+class PlayQueueAdvance(BaseModel):
+    steps: int = Field(1, ge=-100, le=100, description="tracks to move, -1 goes back")
+    skip: bool = Field(
+        False, description="user pressed next or previous, overrides repeat one"
+    )
+    prefetch: int = Field(3, ge=0, le=10, description="stream urls to prefetch")
+
+
+class QueueTrack(BaseModel):
+    id: int
+    title: str
+    author: str
+    duration: Optional[int]
+    file_size: Optional[int]
+    position: int = Field(..., description="index in play order")
+    stream_url: str = Field(..., description="presigned streaming url")
+
+
+class PlayQueueResponse(BaseModel):
+    id: int
+    playlist_id: Optional[int]
+    author: Optional[str]
+    shuffle: bool
+    seed: Optional[int]
+    repeat: RepeatMode
+    position: int = Field(..., description="index of the current track")
+    length: int = Field(..., description="tracks in queue")
+    expires_in: int = Field(..., description="stream url lifetime in seconds")
+    current: Optional[QueueTrack] = Field(
+        None, description="track to play now, null once the queue has ended"
+    )
+    upcoming: List[QueueTrack] = Field(
+        ..., description="next tracks with stream urls for prefetching"
+    )
+    updated_at: datetime
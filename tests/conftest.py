@@ -0,0 +1,39 @@
+import os
+
+# database.db needs a url at import, only the db fixture connects to it
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/idaeho_test")
+
+# utils.storage needs credentials at import, nothing here calls s3
+for name, value in (
+    ("AWS_ACCESS_KEY_ID", "test"),
+    ("AWS_SECRET_ACCESS_KEY", "test"),
+    ("AWS_S3_BUCKET", "idaeho-test"),
+):
+    os.environ.setdefault(name, value)
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+
+@pytest.fixture
+def db():
+    """
+    session on a migrated database at DATABASE_URL, rolled back after the
+    test, skipped when there is none
+    """
+    from database.db import engine
+
+    try:
+        connection = engine.connect()
+    except OperationalError:
+        pytest.skip("needs a migrated database at DATABASE_URL")
+
+    transaction = connection.begin()
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
@@ -0,0 +1,97 @@
+import threading
+
+from starlette.requests import Request
+
+from utils.cache import LRUCache, ResponseCache, cached_response, response_cache
+
+
+def request(path: str = "/api/audio/library", query: str = "") -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "query_string": query.encode(),
+            "headers": [],
+        }
+    )
+
+
+def test_set_skipped_after_invalidate():
+    cache = LRUCache(10, 1024, 60)
+    generation = cache.generation("library:1")
+
+    cache.invalidate("library:1")
+    cache.set("library:1", "k", b"stale", generation)
+
+    assert cache.get("library:1", "k") is None
+
+    cache.set("library:1", "k", b"fresh", cache.generation("library:1"))
+    assert cache.get("library:1", "k") == b"fresh"
+
+
+def test_clear_moves_every_generation():
+    cache = LRUCache(10, 1024, 60)
+    generation = cache.generation("library:1")
+
+    cache.clear()
+    cache.set("library:1", "k", b"stale", generation)
+
+    assert cache.get("library:1", "k") is None
+
+
+def test_miss_after_write_does_not_join_older_build():
+    namespace = "library:test-flight"
+    rows = ["old"]
+    started = threading.Event()
+    release = threading.Event()
+    bodies = {}
+
+    def slow_build():
+        # reads the rows, then waits while the write commits
+        seen = list(rows)
+        started.set()
+        release.wait(5)
+        return {"rows": seen}
+
+    leader = threading.Thread(
+        target=lambda: bodies.setdefault(
+            "leader", cached_response(request(), namespace, slow_build).body
+        )
+    )
+    leader.start()
+    started.wait(5)
+
+    rows[0] = "new"
+    response_cache.invalidate(namespace)
+
+    follower = cached_response(request(), namespace, lambda: {"rows": list(rows)})
+    release.set()
+    leader.join()
+
+    assert b"new" in follower.body
+    assert b"old" in bodies["leader"]
+    # the older build was not stored over the newer one
+    assert b"new" in cached_response(request(), namespace, slow_build).body
+
+
+def test_counters_add_up_across_threads():
+    cache = ResponseCache(LRUCache(1, 1024, 60))
+    cache.local.set("library:1", "hit", b"v")
+
+    def lookups():
+        for _ in range(2000):
+            cache.get("library:1", "hit")
+            cache.get("library:1", "miss")
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert (stats["local_hits"], stats["misses"]) == (16000, 16000)
+
+    cache.local.set("library:1", "other", b"v")
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,22 @@
+from database.import_audio import import_key
+
+
+def test_import_key_is_stable_across_runs(tmp_path, monkeypatch):
+    path = tmp_path / "lectures" / "one.mp3"
+
+    monkeypatch.chdir(tmp_path)
+    relative = import_key("lectures/one.mp3", 1)
+
+    assert relative == import_key(str(path), 1)
+    assert relative.startswith("users/1/audio/import-") and relative.endswith(".mp3")
+
+
+def test_import_key_differs_by_source_and_user():
+    keys = {
+        import_key("/music/one.mp3", 1),
+        import_key("/music/two.mp3", 1),
+        import_key("/music/one.mp3", 2),
+        import_key("s3://bucket/music/one.mp3", 1),
+    }
+
+    assert len(keys) == 4
@@ -0,0 +1,42 @@
+import io
+
+from mutagen.id3 import ID3, TIT2, TPE1
+
+from utils.metadata import file_reader, title_and_author
+
+# one 128 kbps 44.1 kHz mpeg 1 layer III frame
+FRAME = bytes([0xFF, 0xFB, 0x90, 0x00]) + bytes(413)
+
+
+def tagged_mp3(title: str, artist: str) -> bytes:
+    tag = ID3()
+    tag.add(TIT2(encoding=3, text=title))
+    tag.add(TPE1(encoding=3, text=artist))
+    buffer = io.BytesIO()
+    tag.save(buffer)
+    return buffer.getvalue() + FRAME * 20
+
+
+def test_title_and_author_from_tags_fit_the_columns():
+    data = tagged_mp3("t" * 400, "a" * 300)
+
+    title, author = title_and_author(
+        None, None, file_reader(io.BytesIO(data)), len(data), "x.mp3"
+    )
+
+    assert title == "t" * 255
+    assert author == "a" * 255
+
+
+def test_title_and_author_given_values_are_cut_too():
+    title, author = title_and_author("t" * 300, "a", None, 0, "x.mp3")
+
+    assert (title, author) == ("t" * 255, "a")
+
+
+def test_title_and_author_falls_back_to_file_name():
+    data = FRAME * 20
+
+    assert title_and_author(
+        None, None, file_reader(io.BytesIO(data)), len(data), "talk.mp3"
+    ) == ("talk", "unknown")
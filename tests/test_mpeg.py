@@ -0,0 +1,117 @@
+import struct
+
+from utils.mpeg import (
+    XING_BYTES,
+    XING_FRAMES,
+    XING_TOC,
+    find_frame,
+    id3v2_size,
+    looks_like_mp3,
+    parse_frame_header,
+    parse_vbr_header,
+    xing_frame,
+)
+
+# mpeg 1 layer III, 128 kbps, 44.1 kHz, stereo, no padding
+HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+FRAME = HEADER + bytes(413)
+
+
+def test_frame_length_mpeg1():
+    header = parse_frame_header(HEADER)
+
+    assert (header.version, header.bitrate, header.sample_rate) == (1, 128000, 44100)
+    assert header.samples == 1152
+    assert header.length == 417
+
+
+def test_frame_length_counts_padding():
+    assert parse_frame_header(bytes([0xFF, 0xFB, 0x92, 0x00])).length == 418
+
+
+def test_frame_length_mpeg2():
+    # version bits 10, 80 kbps at index 9, 22.05 kHz
+    header = parse_frame_header(bytes([0xFF, 0xF3, 0x90, 0x00]))
+
+    assert (header.version, header.bitrate, header.sample_rate) == (2, 80000, 22050)
+    assert header.samples == 576
+    assert header.length == 261
+
+
+def test_side_info_size_by_channel_mode():
+    assert parse_frame_header(HEADER).side_info_size == 32
+    assert parse_frame_header(bytes([0xFF, 0xFB, 0x90, 0xC0])).side_info_size == 17
+
+
+def test_rejects_bad_headers():
+    assert parse_frame_header(b"\xff\xfb") is None
+    # layer II
+    assert parse_frame_header(bytes([0xFF, 0xFD, 0x90, 0x00])) is None
+    # free format and the invalid bitrate index
+    assert parse_frame_header(bytes([0xFF, 0xFB, 0x00, 0x00])) is None
+    assert parse_frame_header(bytes([0xFF, 0xFB, 0xF0, 0x00])) is None
+    # reserved sample rate
+    assert parse_frame_header(bytes([0xFF, 0xFB, 0x9C, 0x00])) is None
+
+
+def test_find_frame_skips_false_sync():
+    data = b"\x00\xff\xfb\x90" + bytes(20) + FRAME * 2
+
+    offset, header = find_frame(data)
+
+    assert offset == 24
+    assert header.length == 417
+
+
+def test_looks_like_mp3():
+    assert looks_like_mp3(FRAME * 2)
+    assert looks_like_mp3(b"ID3\x04\x00\x00\x00\x00\x02\x01")
+    assert not looks_like_mp3(bytes(4096))
+    # one frame and then something else is not enough
+    assert not looks_like_mp3(FRAME + bytes(417))
+
+
+def test_id3v2_size():
+    assert id3v2_size(b"ID3\x04\x00\x00\x00\x00\x02\x01") == 10 + 257
+    # footer flag adds another 10 bytes
+    assert id3v2_size(b"ID3\x04\x00\x10\x00\x00\x02\x01") == 20 + 257
+    assert id3v2_size(FRAME) == 0
+
+
+def test_xing_header_with_toc():
+    toc = bytes(range(100))
+    frame = bytearray(FRAME)
+    # stereo side info is 32 bytes, so the tag starts at 36
+    frame[36:52] = b"Xing" + struct.pack(
+        ">III", XING_FRAMES | XING_BYTES | XING_TOC, 1000, 417000
+    )
+    frame[52:152] = toc
+
+    vbr = parse_vbr_header(bytes(frame), parse_frame_header(HEADER))
+
+    assert (vbr.tag, vbr.frames, vbr.size) == ("Xing", 1000, 417000)
+    assert vbr.toc == toc
+
+
+def test_vbri_header():
+    frame = bytearray(FRAME)
+    frame[36:40] = b"VBRI"
+    frame[46:54] = struct.pack(">II", 417000, 1000)
+
+    vbr = parse_vbr_header(bytes(frame), parse_frame_header(HEADER))
+
+    assert (vbr.tag, vbr.frames, vbr.size) == ("VBRI", 1000, 417000)
+    assert vbr.toc is None
+
+
+def test_plain_frame_has_no_vbr_header():
+    assert parse_vbr_header(FRAME, parse_frame_header(HEADER)) is None
+
+
+def test_xing_frame_round_trip():
+    frame = xing_frame(FRAME, 50, 50 * 417)
+
+    assert len(frame) == 417
+    vbr = parse_vbr_header(frame, parse_frame_header(frame))
+    # the byte count covers the Xing frame too
+    assert (vbr.tag, vbr.frames, vbr.size) == ("Xing", 50, 51 * 417)
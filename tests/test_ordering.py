@@ -0,0 +1,38 @@
+from utils.ordering import ORDER_GAP, PlaylistOrder
+
+
+def ordered(order: PlaylistOrder, keys: dict[int, int]) -> list[int]:
+    # existing rows at their in memory key, added rows at the key inserted
+    rows = dict(zip(order.audio_ids, order.keys)) | keys
+    return sorted(rows, key=rows.get)
+
+
+def test_add_appends_in_gaps():
+    order = PlaylistOrder([(1, ORDER_GAP), (2, 2 * ORDER_GAP)])
+
+    keys = order.add([(3, None), (4, 1)])
+
+    assert not order.respaced
+    assert ordered(order, keys) == [1, 4, 2, 3]
+
+
+def test_add_respace_mid_batch_rekeys_earlier_adds():
+    # no room between 1 and 2, the second add respaces the playlist after
+    # the first has been given a key
+    order = PlaylistOrder([(1, 1), (2, 2)])
+
+    keys = order.add([(10, None), (11, 1)])
+
+    assert order.respaced
+    assert keys == {10: order.key_of(10), 11: order.key_of(11)}
+    assert ordered(order, keys) == [1, 11, 2, 10]
+    assert order.keys == sorted(order.keys)
+
+
+def test_add_skips_items_already_in_playlist():
+    order = PlaylistOrder([(1, ORDER_GAP)])
+
+    keys = order.add([(1, 0), (2, None), (2, 0)])
+
+    assert list(keys) == [2]
+    assert order.audio_ids == [1, 2]
@@ -0,0 +1,54 @@
+from schemas.queue import RepeatMode
+from utils.play_queue import play_order, step_index, upcoming_indexes
+
+IDS = list(range(1, 21))
+
+
+def test_order_kept_without_shuffle():
+    assert play_order(IDS, False, 7, start_audio_id=5) == IDS
+
+
+def test_shuffle_is_seeded():
+    order = play_order(IDS, True, 7)
+
+    assert order == play_order(IDS, True, 7)
+    assert order != play_order(IDS, True, 8)
+    assert sorted(order) == IDS
+
+
+def test_start_track_moved_first():
+    order = play_order(IDS, True, 7)
+
+    started = play_order(IDS, True, 7, start_audio_id=order[10])
+
+    # the rest keeps its seeded order
+    assert started == [order[10]] + order[:10] + order[11:]
+
+
+def test_step_without_repeat_stops_at_end():
+    assert step_index(2, 1, 5, RepeatMode.OFF, False) == 3
+    assert step_index(4, 1, 5, RepeatMode.OFF, False) == 5
+    assert step_index(0, -1, 5, RepeatMode.OFF, False) == 0
+
+
+def test_step_repeat_all_wraps():
+    assert step_index(4, 1, 5, RepeatMode.ALL, False) == 0
+    assert step_index(0, -1, 5, RepeatMode.ALL, True) == 4
+
+
+def test_step_repeat_one_holds_unless_skipped():
+    assert step_index(2, 1, 5, RepeatMode.ONE, False) == 2
+    assert step_index(2, 1, 5, RepeatMode.ONE, True) == 3
+
+
+def test_step_empty_queue():
+    assert step_index(0, 1, 0, RepeatMode.ALL, True) == 0
+
+
+def test_upcoming():
+    assert upcoming_indexes(3, 3, 5, RepeatMode.OFF) == [4]
+    assert upcoming_indexes(3, 3, 5, RepeatMode.ONE) == [4]
+    assert upcoming_indexes(3, 3, 5, RepeatMode.ALL) == [4, 0, 1]
+    # repeat all lists each other track once
+    assert upcoming_indexes(0, 10, 3, RepeatMode.ALL) == [1, 2]
+    assert upcoming_indexes(0, 10, 0, RepeatMode.ALL) == []
@@ -0,0 +1,67 @@
+import json
+from types import SimpleNamespace
+
+from models.audio import AudioFile, Playlist, PlaylistItem, User
+from routes.playlists import decode_cursor, encode_cursor, get_playlist
+from tests.test_cache import request
+
+
+def playlist_with_orders(db, orders: list[int]) -> tuple[int, int]:
+    user = User(email="pages@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+
+    playlist = Playlist(user_id=user.id, name="pages")
+    db.add(playlist)
+    db.flush()
+
+    for index, order in enumerate(orders):
+        audio = AudioFile(
+            user_id=user.id,
+            title=f"t{index}",
+            author="a",
+            file_url=f"https://example.com/{index}.mp3",
+        )
+        db.add(audio)
+        db.flush()
+        db.add(PlaylistItem(playlist_id=playlist.id, audio_id=audio.id, order=order))
+
+    db.flush()
+    return user.id, playlist.id
+
+
+def page(db, user_id: int, playlist_id: int, cursor=None) -> dict:
+    response = get_playlist(
+        playlist_id,
+        # the cache is keyed by the query string, not the arguments
+        request(f"/api/playlists/{playlist_id}", f"limit=2&cursor={cursor or ''}"),
+        SimpleNamespace(id=user_id),
+        db,
+        offset=0,
+        limit=2,
+        around=None,
+        cursor=cursor,
+        fields=None,
+    )
+    return json.loads(response.body)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(1024, 7, 3)) == (1024, 7, 3)
+
+
+def test_cursor_pages_through_tied_sort_keys(db):
+    # a page ends in the middle of the three items sharing 2048
+    user_id, playlist_id = playlist_with_orders(db, [1024, 2048, 2048, 2048, 4096])
+
+    titles, positions, cursor = [], [], None
+    for _ in range(5):
+        body = page(db, user_id, playlist_id, cursor)
+        titles += [item["title"] for item in body["audio_items"]]
+        positions += [item["position"] for item in body["audio_items"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert titles == ["t0", "t1", "t2", "t3", "t4"]
+    assert positions == [0, 1, 2, 3, 4]
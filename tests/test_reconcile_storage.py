@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+from database.reconcile_storage import database_keys, merge_orphans
+from models.audio import UploadSession, User
+
+
+def test_merge_orphans_reports_both_sides():
+    objects = iter([("a", 1), ("b", 2), ("d", 4)])
+    keys = iter(["b", "c", "d", "e"])
+
+    assert list(merge_orphans(objects, keys)) == [
+        ("storage", "a", 1),
+        ("database", "c", None),
+        ("database", "e", None),
+    ]
+
+
+def test_merge_orphans_one_side_empty():
+    assert list(merge_orphans(iter([]), iter(["a"]))) == [("database", "a", None)]
+    assert list(merge_orphans(iter([("a", 1)]), iter([]))) == [("storage", "a", 1)]
+
+
+def test_database_keys_leave_out_uploads_in_progress(db):
+    user = User(email="reconcile@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+
+    prefix = f"users/{user.id}/audio/"
+    expires = datetime.now(timezone.utc) + timedelta(hours=1)
+    for name, offset in (("complete", 100), ("receiving", 40)):
+        db.add(
+            UploadSession(
+                id=f"reconcile{name}",
+                user_id=user.id,
+                s3_key=f"{prefix}{name}.mp3",
+                s3_upload_id=name,
+                filename=f"{name}.mp3",
+                upload_length=100,
+                upload_offset=offset,
+                expires_at=expires,
+            )
+        )
+    db.flush()
+
+    assert list(database_keys(db, prefix)) == [f"{prefix}complete.mp3"]
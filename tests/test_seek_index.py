@@ -0,0 +1,80 @@
+from array import array
+
+from utils.mpeg import xing_frame
+from utils.seek_index import (
+    SeekIndexBuilder,
+    pack_offsets,
+    seek_entry,
+    seek_index_from_toc,
+    unpack_offsets,
+)
+
+# mpeg 1 layer III, 128 kbps, 44.1 kHz, 417 bytes
+FRAME = bytes([0xFF, 0xFB, 0x90, 0x00]) + bytes(413)
+
+
+def build(data: bytes, audio_start: int, chunk_size: int) -> SeekIndexBuilder:
+    builder = SeekIndexBuilder(audio_start, len(data))
+    for i in range(0, len(data), chunk_size):
+        builder.feed(data[i : i + chunk_size])
+    return builder
+
+
+def test_pack_round_trip():
+    offsets = array("I", [0, 417, 2**32 - 1])
+
+    data = pack_offsets(offsets)
+
+    assert data[:8] == bytes([0, 0, 0, 0, 0xA1, 0x01, 0, 0])
+    assert unpack_offsets(data) == offsets
+
+
+def test_builder_indexes_frame_at_each_second():
+    # 1152 samples a frame at 44.1 kHz, seconds 1 and 2 play in frames 38 and 76
+    tag = bytes(100)
+    data = tag + FRAME * 100
+
+    for chunk_size in (7, 416, 4096):
+        builder = build(data, len(tag), chunk_size)
+
+        assert list(builder.offsets) == [100, 100 + 38 * 417, 100 + 76 * 417]
+        assert builder.frames == 100
+        assert builder.duration == 100 * 1152 / 44100
+
+
+def test_builder_skips_xing_frame():
+    data = xing_frame(FRAME, 100, 100 * 417) + FRAME * 100
+
+    builder = build(data, 0, 1000)
+
+    assert builder.frames == 100
+    assert list(builder.offsets) == [417, 417 + 38 * 417, 417 + 76 * 417]
+
+
+def test_builder_resyncs_after_junk():
+    data = FRAME * 10 + bytes(50) + FRAME * 90
+
+    builder = build(data, 0, 333)
+
+    assert builder.frames == 100
+    assert builder.offsets[1] == 38 * 417 + 50
+
+
+def test_index_from_toc():
+    # a straight line toc, n% of the time at n% of the bytes
+    toc = bytes(int(i * 2.56) for i in range(100))
+
+    offsets = seek_index_from_toc(toc, 10.0, 1000, 11000, 1)
+
+    assert len(offsets) == 10
+    assert offsets[0] == 1000
+    assert all(abs(offsets[i] - (1000 + i * 1000)) < 40 for i in range(10))
+
+
+def test_seek_entry_clamps():
+    offsets = array("I", [0, 417, 834])
+
+    assert seek_entry(offsets, 1, 1.5) == 1
+    assert seek_entry(offsets, 1, 60) == 2
+    assert seek_entry(offsets, 1, -5) == 0
+    assert seek_entry(offsets, 2, 3.9) == 1
@@ -0,0 +1,72 @@
+import pytest
+from fastapi import HTTPException
+
+from utils.serialization import (
+    COMPRESSORS,
+    ENCODERS,
+    JSON_MEDIA_TYPE,
+    negotiate_content_encoding,
+    negotiate_media_type,
+    parse_fields,
+)
+
+ALLOWED = ("id", "title", "author", "duration")
+
+needs_msgpack = pytest.mark.skipif(
+    "application/msgpack" not in ENCODERS, reason="msgpack not installed"
+)
+needs_brotli = pytest.mark.skipif(
+    "br" not in COMPRESSORS, reason="brotli not installed"
+)
+
+
+def test_fields_default_to_all():
+    assert parse_fields(None, ALLOWED) == list(ALLOWED)
+    assert parse_fields(" ", ALLOWED) == list(ALLOWED)
+
+
+def test_fields_in_response_order_with_id():
+    assert parse_fields("duration, title", ALLOWED) == ["id", "title", "duration"]
+    assert parse_fields("author,author,", ALLOWED) == ["id", "author"]
+
+
+def test_unknown_field_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        parse_fields("title,file_url", ALLOWED)
+
+    assert error.value.status_code == 400
+    assert "file_url" in error.value.detail
+
+
+def test_media_type_defaults_to_json():
+    assert negotiate_media_type(None) == JSON_MEDIA_TYPE
+    assert negotiate_media_type("*/*") == JSON_MEDIA_TYPE
+    assert negotiate_media_type("text/html") == JSON_MEDIA_TYPE
+
+
+@needs_msgpack
+def test_media_type_by_q():
+    assert negotiate_media_type("application/msgpack") == "application/msgpack"
+    assert (
+        negotiate_media_type("application/json;q=0.5, application/msgpack")
+        == "application/msgpack"
+    )
+    # a wildcard listed first wins the tie
+    assert negotiate_media_type("*/*, application/msgpack") == JSON_MEDIA_TYPE
+    # q=0 rules a type out
+    assert negotiate_media_type("application/msgpack;q=0") == JSON_MEDIA_TYPE
+
+
+def test_content_encoding():
+    assert negotiate_content_encoding(None) is None
+    assert negotiate_content_encoding("gzip") == "gzip"
+    assert negotiate_content_encoding("identity") is None
+    assert negotiate_content_encoding("gzip;q=0, deflate") is None
+
+
+@needs_brotli
+def test_brotli_preferred_on_ties():
+    assert negotiate_content_encoding("gzip, br") == "br"
+    assert negotiate_content_encoding("*") == "br"
+    assert negotiate_content_encoding("br;q=0.5, gzip") == "gzip"
+    assert negotiate_content_encoding("*, br;q=0") == "gzip"
@@ -0,0 +1,432 @@
+"""
+response cache for read endpoints
+
+two tiers, an in process LRU with a ttl in front of an optional shared
+tier on anything that speaks the redis protocol (REDIS_URL). entries are
+finished response bodies, one per path, query and negotiated encoding,
+grouped in per user namespaces:
+
+    library:{user_id}    library, single audio and batch reads
+    playlists:{user_id}  playlist list and detail
+
+writes drop whole namespaces once they have committed, the ttl bounds
+how stale an entry can get through a path that does not. other workers
+drop their local entries when the write's NOTIFY reaches them, see
+utils.invalidation
+
+every drop bumps the namespace's generation, a counter in the local
+tier and a random token next to the hash in the shared one. a miss
+notes both before building and only stores the body in a tier whose
+generation has not moved, so a build that read the rows before a write
+committed is not cached after the write's drop, by this worker or any
+other
+
+optional package:
+    redis  shared tier, without it or REDIS_URL only the local tier is used
+"""
+
+import os
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+
+from utils.serialization import encode_body, encoded_response, negotiate
+from utils.singleflight import single_flight
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+REDIS_URL = os.environ.get("REDIS_URL")
+
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", "60"))
+CACHE_LOCAL_TTL_SECONDS = float(
+    os.environ.get("CACHE_LOCAL_TTL_SECONDS", CACHE_TTL_SECONDS)
+)
+
+# local tier bounds, whichever is hit first evicts the least recently used
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "2048"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# how long to stop using the shared tier after it fails
+SHARED_RETRY_SECONDS = 30
+
+# expiry stamp in front of every shared value
+_EXPIRES = struct.Struct("!d")
+
+# shared generation tokens outlive any build that noted them
+SHARED_GENERATION_TTL_SECONDS = 24 * 3600
+
+
+def library_namespace(user_id: int) -> str:
+    return f"library:{user_id}"
+
+
+def playlists_namespace(user_id: int) -> str:
+    return f"playlists:{user_id}"
+
+
+class LRUCache:
+    """
+    thread safe LRU of bytes values that expire after ttl seconds
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        # (namespace, key) -> (expires at, value), oldest first
+        self.entries: OrderedDict[tuple[str, str], tuple[float, bytes]] = OrderedDict()
+        self.namespaces: dict[str, set[str]] = {}
+        self.size = 0
+        self.lock = threading.Lock()
+
+        # bumped by invalidate, clear bumps the epoch for every namespace
+        self.generations: dict[str, int] = {}
+        self.epoch = 0
+
+        # entries pushed out by the bounds
+        self.evictions = 0
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        with self.lock:
+            entry = self.entries.get((namespace, key))
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires <= time.monotonic():
+                self._remove((namespace, key))
+                return None
+
+            self.entries.move_to_end((namespace, key))
+            return value
+
+    def generation(self, namespace: str) -> tuple[int, int]:
+        with self.lock:
+            return self.epoch, self.generations.get(namespace, 0)
+
+    def set(
+        self,
+        namespace: str,
+        key: str,
+        value: bytes,
+        generation: Optional[tuple[int, int]] = None,
+    ) -> None:
+        """
+        with a generation from before the value was built, nothing is
+        stored if the namespace was dropped since
+        """
+        if len(value) > self.max_bytes:
+            return
+
+        with self.lock:
+            if generation is not None and generation != (
+                self.epoch,
+                self.generations.get(namespace, 0),
+            ):
+                return
+
+            if (namespace, key) in self.entries:
+                self._remove((namespace, key))
+
+            self.entries[(namespace, key)] = (time.monotonic() + self.ttl, value)
+            self.namespaces.setdefault(namespace, set()).add(key)
+            self.size += len(value)
+
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, namespace: str) -> None:
+        with self.lock:
+            # one int per namespace ever written to, a few per user
+            self.generations[namespace] = self.generations.get(namespace, 0) + 1
+            for key in list(self.namespaces.get(namespace, ())):
+                self._remove((namespace, key))
+
+    def clear(self) -> None:
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
+            self.namespaces.clear()
+            self.size = 0
+
+    def _remove(self, entry_key: tuple[str, str]) -> None:
+        _, value = self.entries.pop(entry_key)
+        self.size -= len(value)
+
+        namespace, key = entry_key
+        keys = self.namespaces[namespace]
+        keys.discard(key)
+        if not keys:
+            del self.namespaces[namespace]
+
+
+class SharedCache:
+    """
+    shared tier, one redis hash per namespace so a write drops every
+    entry of the namespace with a single DEL, and one generation key
+    per namespace the same write replaces
+
+    failures are logged and treated as misses, the tier is skipped for
+    SHARED_RETRY_SECONDS so a down server does not slow every request
+    """
+
+    def __init__(self, client, ttl: float):
+        self.client = client
+        self.ttl = ttl
+        self.retry_at = 0.0
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self.retry_at
+
+    def _failed(self, action: str, e: Exception) -> None:
+        self.retry_at = time.monotonic() + SHARED_RETRY_SECONDS
+        print(f"warning: shared cache {action} failed, skipping it for a while: {e}")
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        if not self._available():
+            return None
+
+        try:
+            raw = self.client.hget(f"cache:{namespace}", key)
+        except Exception as e:
+            self._failed("read", e)
+            return None
+
+        if raw is None:
+            return None
+
+        (expires,) = _EXPIRES.unpack_from(raw)
+        if expires <= time.time():
+            return None
+
+        return raw[_EXPIRES.size :]
+
+    def generation(self, namespace: str) -> Optional[bytes]:
+        """
+        token to pass to set, None when it cannot be read
+        """
+        if not self._available():
+            return None
+
+        try:
+            return self.client.get(f"cachegen:{namespace}") or b""
+        except Exception as e:
+            self._failed("read", e)
+            return None
+
+    def set(
+        self, namespace: str, key: str, value: bytes, generation: Optional[bytes]
+    ) -> None:
+        """
+        stores only if the namespace's generation is still the one noted
+        before value was built, None stores nothing
+        """
+        if generation is None or not self._available():
+            return
+
+        try:
+            with self.client.pipeline() as pipe:
+                # a drop between the check and the write fails the write
+                pipe.watch(f"cachegen:{namespace}")
+                if (pipe.get(f"cachegen:{namespace}") or b"") != generation:
+                    return
+
+                pipe.multi()
+                pipe.hset(
+                    f"cache:{namespace}",
+                    key,
+                    _EXPIRES.pack(time.time() + self.ttl) + value,
+                )
+                # whole hash goes once nothing has been written to it for a ttl
+                pipe.expire(f"cache:{namespace}", int(self.ttl) + 1)
+                pipe.execute()
+        except redis.WatchError:
+            pass
+        except Exception as e:
+            self._failed("write", e)
+
+    def invalidate(self, namespace: str) -> None:
+        # not skipped while backing off, a missed invalidation serves stale data
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.set(
+                f"cachegen:{namespace}",
+                uuid.uuid4().hex,
+                ex=SHARED_GENERATION_TTL_SECONDS,
+            )
+            pipe.delete(f"cache:{namespace}")
+            pipe.execute()
+        except Exception as e:
+            self._failed("invalidate", e)
+
+    def memory(self) -> Optional[int]:
+        try:
+            return self.client.info("memory").get("used_memory")
+        except Exception:
+            return None
+
+
+class ResponseCache:
+    """
+    local tier in front of the optional shared one, counts hits per tier
+
+    routes run in the threadpool, the counters are only touched under the
+    local tier's lock
+    """
+
+    def __init__(self, local: LRUCache, shared: Optional[SharedCache] = None):
+        self.local = local
+        self.shared = shared
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        generation = self.local.generation(namespace)
+        value = self.local.get(namespace, key)
+        if value is not None:
+            with self.local.lock:
+                self.local_hits += 1
+            return value
+
+        if self.shared is not None:
+            value = self.shared.get(namespace, key)
+            if value is not None:
+                with self.local.lock:
+                    self.shared_hits += 1
+                self.local.set(namespace, key, value, generation)
+                return value
+
+        with self.local.lock:
+            self.misses += 1
+        return None
+
+    def generation(self, namespace: str) -> tuple:
+        """
+        note before building a value, pass to set
+        """
+        shared = self.shared.generation(namespace) if self.shared is not None else None
+        return self.local.generation(namespace), shared
+
+    def set(self, namespace: str, key: str, value: bytes, generation: tuple) -> None:
+        local, shared = generation
+        if local != self.local.generation(namespace):
+            # built from rows a write has changed since, keep it out of both tiers
+            return
+
+        self.local.set(namespace, key, value, local)
+        if self.shared is not None:
+            self.shared.set(namespace, key, value, shared)
+
+    def invalidate(self, *namespaces: str) -> None:
+        for namespace in namespaces:
+            self.local.invalidate(namespace)
+            if self.shared is not None:
+                self.shared.invalidate(namespace)
+
+    def stats(self) -> dict:
+        # one consistent snapshot of the counters
+        with self.local.lock:
+            local_hits, shared_hits, misses = (
+                self.local_hits,
+                self.shared_hits,
+                self.misses,
+            )
+            entries, size, evictions = (
+                len(self.local.entries),
+                self.local.size,
+                self.local.evictions,
+            )
+
+        hits = local_hits + shared_hits
+        lookups = hits + misses
+
+        return {
+            "hits": hits,
+            "local_hits": local_hits,
+            "shared_hits": shared_hits,
+            "misses": misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "entries": entries,
+            "bytes": size,
+            "evictions": evictions,
+            "max_entries": self.local.max_entries,
+            "max_bytes": self.local.max_bytes,
+            "shared": self.shared is not None,
+            "shared_bytes": self.shared.memory() if self.shared is not None else None,
+            "coalesced": single_flight.coalesced,
+        }
+
+
+def shared_cache_from_url(url: Optional[str]) -> Optional[SharedCache]:
+    if not url:
+        return None
+
+    if redis is None:
+        print("warning: REDIS_URL is set but redis is not installed, local cache only")
+        return None
+
+    return SharedCache(redis.Redis.from_url(url), CACHE_TTL_SECONDS)
+
+
+response_cache = ResponseCache(
+    LRUCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_LOCAL_TTL_SECONDS),
+    shared_cache_from_url(REDIS_URL),
+)
+
+
+def cache_key(request: Request, media_type: str, coding: Optional[str]) -> str:
+    # query parameters sorted so ?a=1&b=2 and ?b=2&a=1 share an entry
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{query}|{media_type}|{coding or 'identity'}"
+
+
+def cached_response(
+    request: Request, namespace: str, build: Callable[[], Any]
+) -> Response:
+    """
+    negotiated response for request from the cache, on a miss build()
+    makes the payload and the encoded body is stored
+
+    identical misses of the same generation running at the same time
+    share one build(), errors raised by it are not cached
+    """
+    media_type, coding = negotiate(request)
+    key = cache_key(request, media_type, coding)
+
+    cached = response_cache.get(namespace, key)
+    if cached is not None:
+        # stored as applied coding, NUL, body
+        applied, _, body = cached.partition(b"\0")
+        response = encoded_response(body, media_type, applied.decode() or None)
+        response.headers["X-Cache"] = "hit"
+        return response
+
+    # noted before the rows are read, a write committing meanwhile moves it
+    generation = response_cache.generation(namespace)
+
+    def fill():
+        body, applied = encode_body(build(), media_type, coding)
+        response_cache.set(
+            namespace, key, (applied or "").encode() + b"\0" + body, generation
+        )
+        return body, applied
+
+    # a miss arriving after a write has moved the generation does not
+    # join a build that may have read the rows before it
+    body, applied = single_flight.do((namespace, generation, key), fill)
+
+    response = encoded_response(body, media_type, applied)
+    response.headers["X-Cache"] = "miss"
+    return response
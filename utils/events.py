@@ -0,0 +1,125 @@
+"""
+per user change events for connected devices
+
+writes call publish_event inside their transaction, it rides the same
+LISTEN/NOTIFY connection as cache invalidation so every worker hears
+about every committed change and passes it on to its own subscribers
+
+each subscriber is one open /api/events stream with a bounded queue. a
+client that reads too slowly is not allowed to build up memory: once
+its queue is full further events are dropped and it is sent a single
+resync event telling it to refetch instead
+"""
+
+import asyncio
+import json
+import os
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from database.db import engine
+from utils.invalidation import on_channel
+
+EVENTS_CHANNEL = "library_events"
+
+# events held per connection before it is told to resync
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "64"))
+
+
+def publish_event(db: Session, user_id: int, event_type: str, **data) -> None:
+    """
+    args:
+        session of the write, the event is only sent if it commits
+        user whose devices should hear about it
+        event type e.g "audio.created", data is the ids that changed
+    """
+    if engine.dialect.name != "postgresql":
+        return
+
+    payload = json.dumps(
+        {"user_id": user_id, "type": event_type, **data}, separators=(",", ":")
+    )
+    db.execute(select(func.pg_notify(EVENTS_CHANNEL, payload)))
+
+
+class Subscriber:
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event: dict) -> None:
+        if self.overflowed:
+            return
+
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def next(self, timeout: float) -> Optional[dict]:
+        """
+        next event, a resync event after an overflow, None on timeout
+        """
+        if self.overflowed:
+            return self.resync()
+
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        # overflowed while we were waiting, what is queued is incomplete
+        if self.overflowed:
+            return self.resync()
+
+        return event
+
+    def resync(self) -> dict:
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.overflowed = False
+
+        return {"type": "resync"}
+
+
+class EventBroadcaster:
+    """
+    fan out of events to the subscribers of each user, lives on the
+    event loop so it needs no locking
+    """
+
+    def __init__(self):
+        self.subscribers: dict[int, set[Subscriber]] = {}
+
+    def subscribe(self, user_id: int) -> Subscriber:
+        subscriber = Subscriber(user_id)
+        self.subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self.subscribers.get(subscriber.user_id)
+        if subscribers is None:
+            return
+
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self.subscribers[subscriber.user_id]
+
+    def dispatch(self, payload: str) -> None:
+        event = json.loads(payload)
+        for subscriber in self.subscribers.get(event.pop("user_id"), ()):
+            subscriber.offer(event)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.subscribers),
+            "connections": sum(len(subs) for subs in self.subscribers.values()),
+        }
+
+
+broadcaster = EventBroadcaster()
+
+on_channel(EVENTS_CHANNEL, broadcaster.dispatch)
@@ -0,0 +1,588 @@
+"""
+asynchronous ingest of uploaded audio
+
+upload_audio stores the file, inserts the audio row as processing and
+queues an ingest job in the same transaction, then answers 202. workers
+claim jobs with FOR UPDATE SKIP LOCKED and run INGEST_STAGES over the
+stored file, each stage fills in columns of the audio row. when every
+stage succeeds the audio becomes ready, playlists it was added to in
+the meantime get its duration, and an audio.ready event goes out to the
+user's devices. failed runs are retried with backoff
+
+workers run as threads inside the api (INGEST_WORKERS, 0 turns them
+off) or on their own with python -m database.ingest_worker so heavy
+processing can scale apart from the api
+"""
+
+import hashlib
+import os
+import threading
+from array import array
+from concurrent.futures import CancelledError
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import and_, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from database.db import SessionLocal, engine
+from models.audio import AudioFile, AudioRendition, AudioSeekIndex, IngestJob
+from utils.cache import library_namespace, playlists_namespace
+from utils.events import publish_event
+from utils.invalidation import invalidate_on_commit, on_channel
+from utils.metadata import AudioMetadata, extract_metadata
+from utils.playlist_counters import adjust_audio_totals
+from utils.previews import cover_thumbnail, preview_clip, preview_range
+from utils.renditions import (
+    RENDITION_TIMEOUT_SECONDS,
+    RENDITIONS,
+    rendition_pool,
+    renditions_enabled,
+    shutdown_rendition_pool,
+    transcode,
+    wanted_renditions,
+)
+from utils.seek_index import (
+    SEEK_INDEX_INTERVAL_SECONDS,
+    SeekIndexBuilder,
+    pack_offsets,
+    seek_index_from_toc,
+)
+from utils.storage import (
+    generate_presigned_url,
+    open_audio_file,
+    store_derived_file,
+    stored_file_reader,
+)
+
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "2"))
+
+# idle workers look for jobs this often, new uploads also wake them
+INGEST_POLL_SECONDS = float(os.environ.get("INGEST_POLL_SECONDS", "5"))
+
+INGEST_MAX_ATTEMPTS = 5
+
+# a running job not renewed for this long is presumed abandoned and
+# claimed again, workers renew it between stages and while waiting on
+# a rendition
+INGEST_LEASE_SECONDS = 600
+
+# how often a long wait renews the lease, well inside it
+INGEST_RENEW_SECONDS = INGEST_LEASE_SECONDS / 4
+
+INGEST_CHANNEL = "ingest_jobs"
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+COVER_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp"}
+
+
+class IngestContext:
+    """
+    state shared by the stages of one job
+    """
+
+    def __init__(self, audio_id: int, file_url: str, file_size: Optional[int]):
+        self.audio_id = audio_id
+        self.file_url = file_url
+        self.file_size = file_size
+
+        # set by the metadata stage
+        self.metadata: Optional[AudioMetadata] = None
+
+        # audio columns to write once every stage is done
+        self.updates: dict = {}
+
+        # offsets for audio_seek_indexes, set by the scan stage
+        self.seek_offsets: Optional[array] = None
+
+        # audio_renditions rows to write
+        self.renditions: list[dict] = []
+
+        # keeps the job's lease, stages call it during long waits
+        self.renew_lease: Callable[[], None] = lambda: None
+
+
+def duration_column(seconds: float) -> Optional[int]:
+    # duration has a positive check, round sub second files up
+    return max(round(seconds), 1) if seconds > 0 else None
+
+
+def metadata_stage(ctx: IngestContext) -> None:
+    """
+    ranged reads of the file's head and tail, see utils.metadata
+    """
+    ctx.metadata = extract_metadata(stored_file_reader(ctx.file_url), ctx.file_size)
+    if ctx.metadata.duration is None:
+        raise ValueError("no mpeg audio frames found")
+
+    ctx.updates["duration"] = duration_column(ctx.metadata.duration)
+
+
+def scan_stage(ctx: IngestContext) -> None:
+    """
+    one streaming read of the stored file, hashes it and walks its frames
+    for the seek index, nothing is kept
+
+    the frame walk also gives the exact duration of a vbr file that has
+    no Xing header, where the metadata stage could only estimate it
+    """
+    metadata = ctx.metadata
+    digest = hashlib.sha256()
+    builder = SeekIndexBuilder(metadata.audio_start, metadata.audio_end)
+    body = open_audio_file(ctx.file_url)
+
+    for chunk in body.iter_chunks(READ_CHUNK_SIZE):
+        digest.update(chunk)
+        builder.feed(chunk)
+
+    ctx.updates["checksum"] = digest.hexdigest()
+
+    if builder.offsets:
+        ctx.seek_offsets = builder.offsets
+        ctx.updates["duration"] = duration_column(builder.duration)
+    elif metadata.toc is not None:
+        ctx.seek_offsets = seek_index_from_toc(
+            metadata.toc,
+            metadata.duration,
+            metadata.audio_start,
+            metadata.audio_end,
+        )
+
+
+def preview_stage(ctx: IngestContext) -> None:
+    """
+    copies PREVIEW_SECONDS of whole frames out of the stored file
+    """
+    if ctx.seek_offsets is None:
+        return
+
+    start, end = preview_range(
+        ctx.seek_offsets, SEEK_INDEX_INTERVAL_SECONDS, ctx.metadata.audio_end
+    )
+    frames = stored_file_reader(ctx.file_url)(start, end - start)
+
+    ctx.updates["preview_url"] = store_derived_file(
+        ctx.file_url,
+        "preview.mp3",
+        preview_clip(frames, ctx.metadata.vbr),
+        "audio/mpeg",
+    )
+
+
+def cover_stage(ctx: IngestContext) -> None:
+    if ctx.metadata.picture is None:
+        return
+
+    thumbnail = cover_thumbnail(ctx.metadata.picture, ctx.metadata.picture_mime)
+    if thumbnail is None:
+        return
+
+    image, content_type = thumbnail
+    extension = COVER_EXTENSIONS.get(content_type, "img")
+
+    ctx.updates["cover_url"] = store_derived_file(
+        ctx.file_url, f"cover.{extension}", image, content_type
+    )
+
+
+def rendition_stage(ctx: IngestContext) -> None:
+    """
+    optional, a failed encode is logged and the original streams instead
+    """
+    if not renditions_enabled():
+        return
+
+    # ffmpeg streams the original itself
+    source_url = generate_presigned_url(
+        ctx.file_url, expiration=RENDITION_TIMEOUT_SECONDS * 2
+    )
+
+    for quality in wanted_renditions(ctx.metadata.bitrate):
+        try:
+            future = rendition_pool().submit(transcode, source_url, quality)
+            # queued behind other jobs' encodes the wait can outlast the lease
+            while True:
+                try:
+                    path = future.result(timeout=INGEST_RENEW_SECONDS)
+                    break
+                except FutureTimeout:
+                    ctx.renew_lease()
+        except (BrokenProcessPool, CancelledError):
+            # pool stopped for shutdown, fail the run rather than finish it
+            # without renditions
+            raise
+        except Exception as e:
+            print(f"warning: {quality} rendition of audio {ctx.audio_id} failed: {e}")
+            continue
+
+        try:
+            file_size = os.path.getsize(path)
+            with open(path, "rb") as rendition:
+                file_url = store_derived_file(
+                    ctx.file_url, f"{quality}.mp3", rendition, "audio/mpeg"
+                )
+        finally:
+            os.unlink(path)
+
+        ctx.renditions.append(
+            {
+                "quality": quality,
+                "file_url": file_url,
+                "bitrate": RENDITIONS[quality]["bitrate"],
+                "file_size": file_size,
+            }
+        )
+
+
+# run in order, a stage raising fails the whole run
+INGEST_STAGES: list[tuple[str, Callable[[IngestContext], None]]] = [
+    ("metadata", metadata_stage),
+    ("scan", scan_stage),
+    ("preview", preview_stage),
+    ("cover", cover_stage),
+    ("renditions", rendition_stage),
+]
+
+
+def enqueue_ingest(db: Session, audio_id: int) -> None:
+    """
+    queue processing of an uploaded file, caller commits
+    """
+    db.add(IngestJob(audio_id=audio_id))
+
+    # wakes idle workers once the upload commits
+    if engine.dialect.name == "postgresql":
+        db.execute(select(func.pg_notify(INGEST_CHANNEL, str(audio_id))))
+
+
+def add_uploaded_audio(
+    db: Session,
+    user_id: int,
+    title: str,
+    author: str,
+    file_url: str,
+    file_size: int,
+) -> AudioFile:
+    """
+    processing audio row for a stored file plus its ingest job, the
+    event and cache invalidation, caller commits
+    """
+    audio = AudioFile(
+        user_id=user_id,
+        title=title,
+        author=author,
+        file_url=file_url,
+        file_size=file_size,
+        status="processing",
+    )
+    db.add(audio)
+    db.flush()
+
+    enqueue_ingest(db, audio.id)
+    publish_event(db, user_id, "audio.created", audio_id=audio.id)
+    invalidate_on_commit(db, library_namespace(user_id))
+
+    return audio
+
+
+def add_uploaded_audios(db: Session, user_id: int, uploads: list[dict]) -> list[int]:
+    """
+    add_uploaded_audio for many stored files, one insert for the audio
+    rows and one for their jobs however many there are, caller commits
+
+    args:
+        uploads: title, author, file_url and file_size of each file
+
+    returns:
+        audio ids in the order of uploads
+    """
+    # executemany with returning, sent as multi row inserts
+    audio_ids = list(
+        db.scalars(
+            insert(AudioFile).returning(AudioFile.id, sort_by_parameter_order=True),
+            [
+                {**upload, "user_id": user_id, "status": "processing"}
+                for upload in uploads
+            ],
+        )
+    )
+
+    db.execute(insert(IngestJob), [{"audio_id": id} for id in audio_ids])
+
+    # one wake up is enough, workers claim until the queue is empty
+    if engine.dialect.name == "postgresql":
+        db.execute(select(func.pg_notify(INGEST_CHANNEL, "")))
+
+    for audio_id in audio_ids:
+        publish_event(db, user_id, "audio.created", audio_id=audio_id)
+    invalidate_on_commit(db, library_namespace(user_id))
+
+    return audio_ids
+
+
+def claim_job(db: Session) -> Optional[IngestJob]:
+    """
+    oldest runnable job, marked running and committed, None when idle
+
+    SKIP LOCKED means concurrent workers each get a different job
+    instead of queueing behind the same row lock
+    """
+    lease_expired = func.now() - timedelta(seconds=INGEST_LEASE_SECONDS)
+
+    fail_abandoned_jobs(db, lease_expired)
+
+    job = db.execute(
+        select(IngestJob)
+        .where(
+            or_(
+                and_(IngestJob.status == "queued", IngestJob.run_after <= func.now()),
+                and_(
+                    IngestJob.status == "running",
+                    IngestJob.locked_at < lease_expired,
+                    IngestJob.attempts < INGEST_MAX_ATTEMPTS,
+                ),
+            )
+        )
+        .order_by(IngestJob.run_after)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).scalar_one_or_none()
+
+    if job is None:
+        db.rollback()
+        return None
+
+    job.status = "running"
+    job.locked_at = func.now()
+    job.attempts += 1
+    db.commit()
+
+    return job
+
+
+def fail_abandoned_jobs(db: Session, lease_expired) -> None:
+    """
+    jobs whose last allowed run lost its lease, the worker died or hung
+    on them every time, are failed rather than claimed again
+    """
+    jobs = (
+        db.execute(
+            select(IngestJob)
+            .where(
+                IngestJob.status == "running",
+                IngestJob.locked_at < lease_expired,
+                IngestJob.attempts >= INGEST_MAX_ATTEMPTS,
+            )
+            .with_for_update(skip_locked=True)
+        )
+        .scalars()
+        .all()
+    )
+
+    if not jobs:
+        db.rollback()
+        return
+
+    for job in jobs:
+        job.last_error = "lease expired, the worker stopped responding"
+        give_up_job(db, job)
+    db.commit()
+
+
+def renew_lease(db: Session, job_id: int, attempt: int) -> None:
+    """
+    push the job's lease forward, a no-op once another worker owns it
+    """
+    db.query(IngestJob).filter(
+        IngestJob.id == job_id,
+        IngestJob.attempts == attempt,
+        IngestJob.status == "running",
+    ).update({IngestJob.locked_at: func.now()}, synchronize_session=False)
+    db.commit()
+
+
+def complete_job(db: Session, job_id: int, attempt: int, ctx: IngestContext) -> None:
+    job = db.query(IngestJob).filter(IngestJob.id == job_id).with_for_update().first()
+
+    # audio deleted meanwhile (the job cascaded away) or the lease ran out
+    # and another worker owns the job now
+    if job is None or job.attempts != attempt:
+        db.rollback()
+        return
+
+    audio = db.query(AudioFile).filter(AudioFile.id == job.audio_id).first()
+    updates = ctx.updates
+
+    # playlists it joined while processing counted its duration as 0
+    if "duration" in updates:
+        adjust_audio_totals(
+            db,
+            audio.id,
+            duration_delta=(updates["duration"] or 0) - (audio.duration or 0),
+        )
+
+    for field, value in updates.items():
+        setattr(audio, field, value)
+    audio.status = "ready"
+
+    if ctx.seek_offsets is not None:
+        # replaces the index of an earlier run
+        db.merge(
+            AudioSeekIndex(
+                audio_id=audio.id,
+                interval_seconds=SEEK_INDEX_INTERVAL_SECONDS,
+                offsets=pack_offsets(ctx.seek_offsets),
+            )
+        )
+
+    if ctx.renditions:
+        db.query(AudioRendition).filter(AudioRendition.audio_id == audio.id).delete()
+        db.add_all(AudioRendition(audio_id=audio.id, **row) for row in ctx.renditions)
+
+    job.status = "done"
+    job.locked_at = None
+    job.last_error = None
+
+    publish_event(db, audio.user_id, "audio.ready", audio_id=audio.id)
+    invalidate_on_commit(
+        db, library_namespace(audio.user_id), playlists_namespace(audio.user_id)
+    )
+    db.commit()
+
+
+def fail_job(db: Session, job_id: int, attempt: int, error: str) -> None:
+    job = db.query(IngestJob).filter(IngestJob.id == job_id).with_for_update().first()
+    if job is None or job.attempts != attempt:
+        db.rollback()
+        return
+
+    job.last_error = error[:2000]
+    job.locked_at = None
+
+    if job.attempts < INGEST_MAX_ATTEMPTS:
+        job.status = "queued"
+        job.run_after = datetime.now(timezone.utc) + timedelta(
+            seconds=min(10 * 2**job.attempts, 3600)
+        )
+        db.commit()
+        return
+
+    give_up_job(db, job)
+    db.commit()
+
+
+def give_up_job(db: Session, job: IngestJob) -> None:
+    """
+    no more retries, the job and its audio are failed, caller commits
+    """
+    job.status = "failed"
+    job.locked_at = None
+
+    audio = db.query(AudioFile).filter(AudioFile.id == job.audio_id).first()
+    audio.status = "failed"
+
+    publish_event(db, audio.user_id, "audio.failed", audio_id=audio.id)
+    invalidate_on_commit(db, library_namespace(audio.user_id))
+
+
+def run_next_job() -> bool:
+    """
+    claim and process one job
+
+    returns:
+        False when there was nothing to do
+    """
+    db = SessionLocal()
+
+    try:
+        job = claim_job(db)
+        if job is None:
+            return False
+
+        job_id, attempt = job.id, job.attempts
+        audio = db.query(AudioFile).filter(AudioFile.id == job.audio_id).first()
+        if audio is None:
+            # deleted right after the claim, the job went with it
+            return True
+
+        ctx = IngestContext(audio.id, audio.file_url, audio.file_size)
+        ctx.renew_lease = lambda: renew_lease(db, job_id, attempt)
+
+        # no transaction is held while the stages run
+        db.rollback()
+
+        stage_name = None
+        try:
+            for stage_name, stage in INGEST_STAGES:
+                stage(ctx)
+                ctx.renew_lease()
+        except Exception as e:
+            print(
+                f"warning: ingest of audio {ctx.audio_id} failed at {stage_name}: {e}"
+            )
+            fail_job(db, job_id, attempt, f"{stage_name}: {e}")
+        else:
+            complete_job(db, job_id, attempt, ctx)
+
+        return True
+
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class IngestWorkerPool:
+    """
+    threads that keep claiming and running jobs until stopped
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS):
+        self.workers = workers
+        self.threads: list[threading.Thread] = []
+        self.stopping = threading.Event()
+        self.wake = threading.Event()
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self.run, name=f"ingest-worker-{i}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: float = 30) -> None:
+        """
+        finish jobs in progress, anything left is picked up after the lease
+        """
+        self.stopping.set()
+        self.wake.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads.clear()
+
+        shutdown_rendition_pool()
+
+    def notify(self, payload: str = "") -> None:
+        self.wake.set()
+
+    def run(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                worked = run_next_job()
+            except Exception as e:
+                print(f"warning: ingest worker error: {e}")
+                worked = False
+
+            if not worked:
+                self.wake.wait(INGEST_POLL_SECONDS)
+                self.wake.clear()
+
+
+ingest_workers = IngestWorkerPool()
+
+on_channel(INGEST_CHANNEL, ingest_workers.notify)
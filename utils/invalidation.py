@@ -0,0 +1,184 @@
+"""
+cache invalidation bus over postgres LISTEN/NOTIFY
+
+writes call invalidate_on_commit inside their transaction. it sends a
+NOTIFY with the affected cache namespaces, which postgres only delivers
+if the transaction commits, and drops the namespaces from this worker's
+cache and the shared tier right after the commit
+
+every worker runs listen_for_invalidations from the lifespan and drops
+the namespaces named by other workers' notifications from its local
+tier. if the listening connection drops, notifications sent meanwhile
+are lost, so the local tier is cleared whenever it reconnects
+
+other channels can share the listening connection through on_channel,
+see utils.events
+"""
+
+import asyncio
+import uuid
+from typing import Callable
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from database.db import engine
+from utils.cache import response_cache
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+except ImportError:
+    psycopg2 = None
+
+CHANNEL = "cache_invalidation"
+
+# tells this worker's own notifications apart, it has already acted on them
+ORIGIN = uuid.uuid4().hex[:12]
+
+# with no notification for this long the connection is checked
+LISTEN_IDLE_SECONDS = 60
+
+LISTEN_RETRY_MAX_SECONDS = 30
+
+# session.info key for namespaces waiting on commit
+_PENDING = "invalidate_namespaces"
+
+# channel -> handler(payload), called on the event loop
+CHANNEL_HANDLERS: dict[str, Callable[[str], None]] = {}
+
+
+def on_channel(channel: str, handler: Callable[[str], None]) -> None:
+    """
+    deliver notifications on channel to handler, register at import time,
+    the channels are LISTENed on when the listener connects
+    """
+    CHANNEL_HANDLERS[channel] = handler
+
+
+def invalidate_on_commit(db: Session, *namespaces: str) -> None:
+    """
+    drop namespaces from every worker's cache once db commits, nothing
+    happens if it rolls back. call before commit
+    """
+    db.info.setdefault(_PENDING, set()).update(namespaces)
+
+    if engine.dialect.name == "postgresql":
+        db.execute(select(func.pg_notify(CHANNEL, encode_event(namespaces))))
+
+
+def encode_event(namespaces) -> str:
+    # "origin ns,ns", well under the 8000 byte payload limit
+    return f"{ORIGIN} {','.join(sorted(namespaces))}"
+
+
+def decode_event(payload: str) -> tuple[str, list[str]]:
+    origin, _, namespaces = payload.partition(" ")
+    return origin, [namespace for namespace in namespaces.split(",") if namespace]
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    namespaces = session.info.pop(_PENDING, None)
+    if namespaces:
+        response_cache.invalidate(*namespaces)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING, None)
+
+
+def handle_event(payload: str) -> None:
+    origin, namespaces = decode_event(payload)
+    if origin == ORIGIN:
+        return
+
+    # the writer already dropped the shared tier
+    for namespace in namespaces:
+        response_cache.local.invalidate(namespace)
+
+
+on_channel(CHANNEL, handle_event)
+
+
+def listen_connection():
+    """
+    dedicated autocommit connection outside the pool, LISTEN holds it
+    """
+    url = engine.url.set(drivername="postgresql")
+    conn = psycopg2.connect(url.render_as_string(hide_password=False))
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+
+    with conn.cursor() as cursor:
+        for channel in CHANNEL_HANDLERS:
+            cursor.execute(f"LISTEN {channel}")
+
+    return conn
+
+
+def ping(conn) -> None:
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+async def listen_for_invalidations() -> None:
+    """
+    background task, applies other workers' invalidations until cancelled
+    reconnects with exponential backoff when the connection fails
+    """
+    if engine.dialect.name != "postgresql" or psycopg2 is None:
+        print(
+            "warning: cache invalidation bus needs postgres and psycopg2, not started"
+        )
+        return
+
+    loop = asyncio.get_running_loop()
+    delay = 1
+
+    while True:
+        conn = None
+        try:
+            conn = await loop.run_in_executor(None, listen_connection)
+
+            # anything published while we were not listening is gone
+            response_cache.local.clear()
+            delay = 1
+
+            readable = asyncio.Event()
+            fd = conn.fileno()
+            loop.add_reader(fd, readable.set)
+            try:
+                while True:
+                    try:
+                        await asyncio.wait_for(
+                            readable.wait(), timeout=LISTEN_IDLE_SECONDS
+                        )
+                    except asyncio.TimeoutError:
+                        # quiet for a while, make sure the server is still there
+                        await asyncio.to_thread(ping, conn)
+
+                    # psycopg2 blocks, a slow server must not stall the loop
+                    readable.clear()
+                    await asyncio.to_thread(conn.poll)
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            CHANNEL_HANDLERS[notify.channel](notify.payload)
+                        except Exception as e:
+                            print(f"warning: bad {notify.channel} notification: {e}")
+            finally:
+                loop.remove_reader(fd)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(
+                f"warning: cache invalidation listener failed, retrying in {delay}s: {e}"
+            )
+        finally:
+            if conn is not None:
+                conn.close()
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, LISTEN_RETRY_MAX_SECONDS)
@@ -0,0 +1,183 @@
+"""
+mp3 metadata from a few reads at the ends of a file
+
+duration and tags only need the ID3v2 tag at the start, the first audio
+frame (whose Xing/Info or VBRI header gives a vbr file's frame count)
+and the 128 byte ID3v1 tag at the end. everything is read through a
+read(offset, length) callable, a seek on an open file or a ranged GET
+on s3, so the cost is a handful of small reads whatever the file size
+and nothing is written to disk
+"""
+
+import io
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+
+from mutagen.id3 import ID3
+
+from utils.mpeg import (
+    ID3V1_SIZE,
+    find_frame,
+    id3v2_size,
+    parse_id3v1,
+    parse_vbr_header,
+)
+
+# read(offset, length) -> bytes, shorter at the end of the file
+Reader = Callable[[int, int], bytes]
+
+# first read, covers a small ID3v2 tag and the first frame in one go
+HEAD_BYTES = 64 * 1024
+
+# how far past the ID3v2 tag to look for the first frame
+FRAME_SEARCH_BYTES = 64 * 1024
+
+# what the head must hold past the tag to look there instead, two of the
+# largest frames so the frame after a candidate can be checked too
+FRAME_MIN_BYTES = 2 * 1441 + 4
+
+# ID3v2 tags larger than this (big embedded artwork) are not read, the
+# ID3v1 tag is used for title and artist instead and there is no cover
+ID3_MAX_BYTES = 4 * 1024 * 1024
+
+# ID3v2 text frames -> tag names
+ID3_FRAMES = {"TIT2": "title", "TPE1": "artist", "TALB": "album"}
+
+# APIC picture type of the front cover
+FRONT_COVER = 3
+
+
+class AudioMetadata:
+    def __init__(self):
+        # seconds, None when no audio frame was found
+        self.duration: Optional[float] = None
+        self.bitrate: Optional[int] = None
+        self.sample_rate: Optional[int] = None
+        self.vbr = False
+
+        # title, artist and album when tagged
+        self.tags: dict[str, str] = {}
+
+        # embedded cover art, image bytes and mime type
+        self.picture: Optional[bytes] = None
+        self.picture_mime: Optional[str] = None
+
+        # bytes of the file holding audio frames, tags excluded
+        self.audio_start = 0
+        self.audio_end = 0
+
+        # Xing seek table, 100 entries of byte position / 256
+        self.toc: Optional[bytes] = None
+
+
+def file_reader(file: BinaryIO) -> Reader:
+    def read(offset: int, length: int) -> bytes:
+        file.seek(offset)
+        return file.read(length)
+
+    return read
+
+
+def parse_id3v2(tag: bytes, metadata: AudioMetadata) -> None:
+    """
+    text tags and cover art, the front cover or else the first picture
+    """
+    try:
+        id3 = ID3(io.BytesIO(tag))
+    except Exception as e:
+        print(f"warning: could not parse id3 tag: {e}")
+        return
+
+    for frame_id, name in ID3_FRAMES.items():
+        frame = id3.get(frame_id)
+        if frame is not None and frame.text:
+            value = str(frame.text[0]).strip()
+            if value:
+                metadata.tags[name] = value
+
+    pictures = id3.getall("APIC")
+    if pictures:
+        picture = next((p for p in pictures if p.type == FRONT_COVER), pictures[0])
+        metadata.picture = picture.data
+        metadata.picture_mime = picture.mime
+
+
+def extract_metadata(read: Reader, file_size: int) -> AudioMetadata:
+    """
+    duration, tags and cover art of the mp3 that read() gives access to
+
+    the duration comes from the vbr header frame count when there is
+    one, otherwise from the audio size and the first frame's bitrate,
+    which is exact for constant bitrate files
+    """
+    metadata = AudioMetadata()
+    metadata.audio_end = file_size
+
+    head = read(0, HEAD_BYTES)
+
+    tag_size = id3v2_size(head)
+    if tag_size:
+        if tag_size <= len(head):
+            parse_id3v2(head[:tag_size], metadata)
+        elif tag_size <= ID3_MAX_BYTES:
+            parse_id3v2(head + read(len(head), tag_size - len(head)), metadata)
+
+    if file_size >= ID3V1_SIZE:
+        tail = read(file_size - ID3V1_SIZE, ID3V1_SIZE)
+        if tail[:3] == b"TAG":
+            metadata.audio_end = file_size - ID3V1_SIZE
+
+            # ID3v2 wins where both are present
+            for name, value in parse_id3v1(tail).items():
+                metadata.tags.setdefault(name, value)
+
+    if tag_size >= file_size:
+        return metadata
+    elif len(head) - tag_size >= min(FRAME_MIN_BYTES, file_size - tag_size):
+        window = head[tag_size:]
+    else:
+        window = read(tag_size, FRAME_SEARCH_BYTES)
+
+    found = find_frame(window)
+    if found is None:
+        return metadata
+
+    offset, header = found
+    metadata.audio_start = tag_size + offset
+    metadata.bitrate = header.bitrate
+    metadata.sample_rate = header.sample_rate
+
+    vbr = parse_vbr_header(window[offset : offset + header.length], header)
+
+    if vbr is not None and vbr.frames:
+        metadata.duration = vbr.frames * header.samples / header.sample_rate
+        metadata.toc = vbr.toc
+        metadata.vbr = vbr.tag != "Info"
+
+        if metadata.vbr and vbr.size:
+            # average over the file rather than the first frame's
+            metadata.bitrate = round(vbr.size * 8 / metadata.duration)
+    else:
+        audio_size = metadata.audio_end - metadata.audio_start
+        metadata.duration = audio_size * 8 / header.bitrate
+
+    return metadata
+
+
+def title_and_author(
+    title: Optional[str],
+    author: Optional[str],
+    read: Reader,
+    file_size: int,
+    filename: str,
+) -> tuple[str, str]:
+    """
+    fills in what an upload left out from the file's tags, then the file
+    name and "unknown", cut to fit the String(255) columns
+    """
+    if not (title and author):
+        tags = extract_metadata(read, file_size).tags
+        title = title or tags.get("title") or Path(filename).stem
+        author = author or tags.get("artist") or "unknown"
+
+    return title[:255], author[:255]
@@ -0,0 +1,267 @@
+"""
+mpeg audio layer 3 frame parsing
+
+just enough of the format to find the first audio frame, read the
+Xing/Info or VBRI header a vbr encoder puts in it and walk frames, all
+on byte strings so callers decide how much of a file to read
+"""
+
+import struct
+from typing import Optional
+
+# bitrate index -> kbit/s for layer 3, 0 is free format and 15 invalid
+BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# sample rate index -> Hz per mpeg version
+SAMPLE_RATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    2.5: (11025, 12000, 8000),
+}
+
+# version bits of the header, 1 is reserved
+VERSIONS = {0: 2.5, 2: 2, 3: 1}
+
+ID3V2_HEADER_SIZE = 10
+ID3V1_SIZE = 128
+
+XING_FRAMES = 0x1
+XING_BYTES = 0x2
+XING_TOC = 0x4
+
+
+class FrameHeader:
+    """
+    a decoded 4 byte frame header
+    """
+
+    def __init__(
+        self, version: float, bitrate: int, sample_rate: int, padding: int, mono: bool
+    ):
+        self.version = version
+        # bits per second
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.padding = padding
+        self.mono = mono
+
+    @property
+    def samples(self) -> int:
+        return 1152 if self.version == 1 else 576
+
+    @property
+    def length(self) -> int:
+        # bytes in the frame, header included
+        return self.samples // 8 * self.bitrate // self.sample_rate + self.padding
+
+    @property
+    def side_info_size(self) -> int:
+        if self.version == 1:
+            return 17 if self.mono else 32
+        return 9 if self.mono else 17
+
+
+class VBRHeader:
+    """
+    frame and byte counts from a Xing/Info or VBRI header, toc is the
+    Xing seek table when present, 100 entries of byte position / 256
+
+    tag is Xing, Info or VBRI, encoders write Info for constant bitrate
+    """
+
+    def __init__(
+        self,
+        tag: str,
+        frames: Optional[int],
+        size: Optional[int],
+        toc: Optional[bytes] = None,
+    ):
+        self.tag = tag
+        self.frames = frames
+        self.size = size
+        self.toc = toc
+
+
+def parse_frame_header(data: bytes, offset: int = 0) -> Optional[FrameHeader]:
+    """
+    the layer 3 frame header at offset, None if it is not one
+    """
+    if offset + 4 > len(data):
+        return None
+
+    (word,) = struct.unpack_from(">I", data, offset)
+
+    # 11 bit sync
+    if word & 0xFFE00000 != 0xFFE00000:
+        return None
+
+    version = VERSIONS.get((word >> 19) & 0x3)
+    layer = (word >> 17) & 0x3
+    bitrate_index = (word >> 12) & 0xF
+    sample_rate_index = (word >> 10) & 0x3
+
+    if version is None or layer != 1:
+        return None
+    if bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    return FrameHeader(
+        version=version,
+        bitrate=BITRATES[1 if version == 1 else 2][bitrate_index] * 1000,
+        sample_rate=SAMPLE_RATES[version][sample_rate_index],
+        padding=(word >> 9) & 0x1,
+        mono=(word >> 6) & 0x3 == 3,
+    )
+
+
+def find_frame(
+    data: bytes, start: int = 0, strict: bool = False
+) -> Optional[tuple[int, FrameHeader]]:
+    """
+    offset and header of the first frame at or after start
+
+    a sync pattern can turn up inside other data, a candidate counts
+    when the frame after it starts with a matching header too, or when
+    it runs past the end of data so that cannot be checked, unless strict
+    """
+    offset = data.find(b"\xff", start)
+
+    while offset != -1:
+        header = parse_frame_header(data, offset)
+        if header is not None:
+            following = offset + header.length
+            if following + 4 > len(data):
+                if not strict:
+                    return offset, header
+                offset = data.find(b"\xff", offset + 1)
+                continue
+
+            next_header = parse_frame_header(data, following)
+            if (
+                next_header is not None
+                and next_header.version == header.version
+                and next_header.sample_rate == header.sample_rate
+            ):
+                return offset, header
+
+        offset = data.find(b"\xff", offset + 1)
+
+    return None
+
+
+def looks_like_mp3(head: bytes) -> bool:
+    """
+    cheap check of the first few KB of a file, an ID3v2 tag or two
+    consecutive layer 3 frame headers
+    """
+    if head[:3] == b"ID3":
+        # version 2.2 to 2.4, syncsafe size bytes
+        return (
+            len(head) >= ID3V2_HEADER_SIZE
+            and head[3] in (2, 3, 4)
+            and all(byte < 0x80 for byte in head[6:10])
+        )
+
+    return find_frame(head, strict=True) is not None
+
+
+def parse_vbr_header(frame: bytes, header: FrameHeader) -> Optional[VBRHeader]:
+    """
+    Xing/Info or VBRI header in the first frame, None for a plain frame
+    """
+    offset = 4 + header.side_info_size
+    tag = frame[offset : offset + 4]
+
+    if tag in (b"Xing", b"Info") and len(frame) >= offset + 8:
+        (flags,) = struct.unpack_from(">I", frame, offset + 4)
+        position = offset + 8
+        frames = size = toc = None
+
+        if flags & XING_FRAMES:
+            (frames,) = struct.unpack_from(">I", frame, position)
+            position += 4
+        if flags & XING_BYTES:
+            (size,) = struct.unpack_from(">I", frame, position)
+            position += 4
+        if flags & XING_TOC and len(frame) >= position + 100:
+            toc = frame[position : position + 100]
+
+        return VBRHeader(tag.decode(), frames, size, toc)
+
+    # fixed position, 32 bytes after the header whatever the channel mode
+    if frame[36:40] == b"VBRI" and len(frame) >= 54:
+        size, frames = struct.unpack_from(">II", frame, 46)
+        return VBRHeader("VBRI", frames, size)
+
+    return None
+
+
+def xing_frame(first: bytes, frames: int, size: int) -> Optional[bytes]:
+    """
+    a Xing frame to put in front of frames cut from a vbr
+    file, players take its frame count for the duration instead of
+    guessing from the first frame's bitrate
+
+    args:
+        header bytes of the first frame that follows, frames and bytes
+        after this one
+    """
+    header = parse_frame_header(first)
+    if header is None:
+        return None
+
+    offset = 4 + header.side_info_size
+    if header.length < offset + 16:
+        return None
+
+    # no crc, so the side info starts right after the header
+    frame = bytearray(header.length)
+    frame[:4] = first[:4]
+    frame[1] |= 0x01
+    frame[offset : offset + 16] = b"Xing" + struct.pack(
+        ">III", XING_FRAMES | XING_BYTES, frames, size + header.length
+    )
+
+    return bytes(frame)
+
+
+def id3v2_size(header: bytes) -> int:
+    """
+    bytes taken by the ID3v2 tag the data starts with, 0 if there is none
+    """
+    if len(header) < ID3V2_HEADER_SIZE or header[:3] != b"ID3":
+        return 0
+
+    # syncsafe, 7 bits per byte
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+
+    # footer flag
+    if header[5] & 0x10:
+        size += ID3V2_HEADER_SIZE
+
+    return ID3V2_HEADER_SIZE + size
+
+
+def parse_id3v1(tail: bytes) -> dict:
+    """
+    title, artist and album from the 128 byte ID3v1 tag at the end of a
+    file, empty if there is none
+    """
+    if len(tail) < ID3V1_SIZE or tail[-ID3V1_SIZE:][:3] != b"TAG":
+        return {}
+
+    tag = tail[-ID3V1_SIZE:]
+    fields = {"title": tag[3:33], "artist": tag[33:63], "album": tag[63:93]}
+
+    tags = {}
+    for name, raw in fields.items():
+        value = raw.split(b"\0", 1)[0].decode("latin-1").strip()
+        if value:
+            tags[name] = value
+
+    return tags
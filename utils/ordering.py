@@ -0,0 +1,263 @@
+"""
+gap based sort keys for playlist items
+
+items are spaced ORDER_GAP apart so inserting or moving an item only
+writes that one row, it takes the midpoint between its new neighbours.
+when two neighbours run out of room the playlist is respaced in one
+UPDATE, this is rare and can also be done in the background once gaps
+get small
+"""
+
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from database.db import SessionLocal
+from models.audio import Playlist, PlaylistItem
+from utils.cache import playlists_namespace
+from utils.invalidation import invalidate_on_commit
+
+ORDER_GAP = 1024
+
+# order column is a 32 bit integer
+ORDER_MAX = 2**31 - 1
+
+# neighbours closer than this get respaced in the background
+ORDER_MIN_GAP = 8
+
+
+def order_between(before: Optional[int], after: Optional[int]) -> Optional[int]:
+    """
+    args:
+        sort key of the item that should come before, None at the start
+        sort key of the item that should come after, None at the end
+
+    returns:
+        sort key strictly between the two, None when there is no room left
+    """
+    if after is None:
+        key = (before + ORDER_GAP) if before is not None else ORDER_GAP
+        return key if key <= ORDER_MAX else None
+
+    low = before if before is not None else -1
+    if after - low < 2:
+        return None
+
+    return (low + after) // 2
+
+
+def order_at(keys: Sequence[int], position: int) -> Optional[int]:
+    """
+    sort key for inserting at index position of an already sorted key list
+    """
+    position = min(position, len(keys))
+    before = keys[position - 1] if position > 0 else None
+    after = keys[position] if position < len(keys) else None
+
+    return order_between(before, after)
+
+
+def is_crowded(before: Optional[int], key: int, after: Optional[int]) -> bool:
+    """
+    true when a new key sits too close to a neighbour for future inserts
+    """
+    if before is not None and key - before < ORDER_MIN_GAP:
+        return True
+    if after is not None and after - key < ORDER_MIN_GAP:
+        return True
+
+    return False
+
+
+def neighbour_orders(
+    db: Session,
+    playlist_id: int,
+    position: int,
+    exclude_audio_id: Optional[int] = None,
+) -> tuple[Optional[int], Optional[int]]:
+    """
+    sort keys either side of index position, walks idx_playlist_items_playlist
+
+    exclude_audio_id leaves out the item being moved so it does not count
+    as its own neighbour
+    """
+    query = db.query(PlaylistItem.order).filter(PlaylistItem.playlist_id == playlist_id)
+    if exclude_audio_id is not None:
+        query = query.filter(PlaylistItem.audio_id != exclude_audio_id)
+
+    if position == 0:
+        first = query.order_by(PlaylistItem.order).limit(1).scalar()
+        return None, first
+
+    rows = [
+        row[0]
+        for row in query.order_by(PlaylistItem.order)
+        .offset(position - 1)
+        .limit(2)
+        .all()
+    ]
+    if not rows:
+        # position is past the end, append after the last item
+        last = query.with_entities(func.max(PlaylistItem.order)).scalar()
+        return last, None
+
+    return rows[0], rows[1] if len(rows) > 1 else None
+
+
+def order_for_position(
+    db: Session,
+    playlist_id: int,
+    position: Optional[int],
+    exclude_audio_id: Optional[int] = None,
+) -> tuple[int, bool]:
+    """
+    work out the sort key for placing one item, position None appends
+
+    returns:
+        sort key and whether the playlist should be respaced soon
+    """
+    if position is None:
+        before = (
+            db.query(func.max(PlaylistItem.order))
+            .filter(PlaylistItem.playlist_id == playlist_id)
+            .scalar()
+        )
+        after = None
+    else:
+        before, after = neighbour_orders(db, playlist_id, position, exclude_audio_id)
+
+    key = order_between(before, after)
+    if key is None:
+        # out of room, respace now and look again
+        rebalance_playlist(db, playlist_id)
+        before, after = neighbour_orders(
+            db,
+            playlist_id,
+            position if position is not None else ORDER_MAX,
+            exclude_audio_id,
+        )
+        key = order_between(before, after)
+        if key is None:
+            raise ValueError("playlist has no room for more items")
+
+    return key, is_crowded(before, key, after)
+
+
+class PlaylistOrder:
+    """
+    in memory copy of one playlist's sort keys
+
+    used by batch edits to place many items against a single read of the
+    keys, then write back only the rows whose key changed
+    """
+
+    def __init__(self, rows: Sequence[tuple[int, int]]):
+        # rows of (audio_id, order) sorted by order
+        self.audio_ids = [audio_id for audio_id, _ in rows]
+        self.keys = [order for _, order in rows]
+        self.respaced = False
+
+    def __contains__(self, audio_id: int) -> bool:
+        return audio_id in self.audio_ids
+
+    def remove(self, audio_id: int) -> None:
+        index = self.audio_ids.index(audio_id)
+        del self.audio_ids[index]
+        del self.keys[index]
+
+    def place(self, audio_id: int, position: Optional[int] = None) -> int:
+        """
+        insert audio_id at index position, None appends, returns its key
+        """
+        if position is None:
+            position = len(self.keys)
+        position = min(position, len(self.keys))
+
+        key = order_at(self.keys, position)
+        if key is None:
+            self.keys = [(i + 1) * ORDER_GAP for i in range(len(self.keys))]
+            self.respaced = True
+            key = order_at(self.keys, position)
+
+        self.audio_ids.insert(position, audio_id)
+        self.keys.insert(position, key)
+
+        return key
+
+    def add(self, items: Iterable[tuple[int, Optional[int]]]) -> dict[int, int]:
+        """
+        place each (audio_id, position) not already in the playlist
+
+        returns:
+            sort key of each item placed, read once all are placed since a
+            respace part way through moves the keys handed out before it
+        """
+        placed = []
+        for audio_id, position in items:
+            if audio_id not in self:
+                self.place(audio_id, position)
+                placed.append(audio_id)
+
+        return {audio_id: self.key_of(audio_id) for audio_id in placed}
+
+    def key_of(self, audio_id: int) -> int:
+        return self.keys[self.audio_ids.index(audio_id)]
+
+    def crowded(self) -> bool:
+        return any(
+            after - before < ORDER_MIN_GAP
+            for before, after in zip(self.keys, self.keys[1:])
+        )
+
+
+def rebalance_playlist(db: Session, playlist_id: int) -> None:
+    """
+    respace every item of a playlist ORDER_GAP apart keeping current order
+
+    single UPDATE ... FROM, caller commits
+    """
+    ranked = (
+        select(
+            PlaylistItem.id,
+            (
+                func.row_number().over(order_by=(PlaylistItem.order, PlaylistItem.id))
+                * ORDER_GAP
+            ).label("new_order"),
+        )
+        .where(PlaylistItem.playlist_id == playlist_id)
+        .subquery()
+    )
+
+    db.execute(
+        update(PlaylistItem)
+        .where(PlaylistItem.id == ranked.c.id)
+        .values(order=ranked.c.new_order)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rebalance_playlist_task(playlist_id: int) -> None:
+    """
+    background task version of rebalance_playlist with its own session
+    """
+    db = SessionLocal()
+
+    try:
+        # same row lock the item mutation paths take
+        playlist = (
+            db.query(Playlist)
+            .filter(Playlist.id == playlist_id)
+            .with_for_update()
+            .first()
+        )
+        if playlist:
+            rebalance_playlist(db, playlist_id)
+            # cached pages carry cursors made from the old keys
+            invalidate_on_commit(db, playlists_namespace(playlist.user_id))
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"warning: failed to rebalance playlist {playlist_id}: {e}")
+    finally:
+        db.close()
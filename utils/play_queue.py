@@ -0,0 +1,99 @@
+"""
+play queue ordering and stepping
+
+pure functions so the same seed and repeat mode always give the same
+track order on every device
+"""
+
+import random
+from typing import Optional, Sequence
+
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import Session
+
+from models.audio import PlayQueue
+from schemas.queue import RepeatMode
+
+
+def play_order(
+    audio_ids: Sequence[int],
+    shuffle: bool,
+    seed: Optional[int],
+    start_audio_id: Optional[int] = None,
+) -> list[int]:
+    """
+    args:
+        audio ids in source order
+        whether to shuffle
+        shuffle seed, same seed gives same order
+        audio id to play first, if any
+
+    returns:
+        audio ids in play order
+    """
+    order = list(audio_ids)
+
+    if shuffle:
+        random.Random(seed).shuffle(order)
+
+        # keep the chosen track first, the rest stays seeded
+        if start_audio_id is not None and start_audio_id in order:
+            order.remove(start_audio_id)
+            order.insert(0, start_audio_id)
+
+    return order
+
+
+def step_index(
+    index: int, steps: int, length: int, repeat: RepeatMode, skip: bool
+) -> int:
+    """
+    index after moving steps tracks, length means the queue has ended
+
+    repeat one holds the current track unless the user skipped
+    """
+    if length == 0:
+        return 0
+
+    if repeat == RepeatMode.ONE and not skip:
+        return min(index, length - 1)
+
+    if repeat == RepeatMode.ALL:
+        return (index + steps) % length
+
+    return min(max(index + steps, 0), length)
+
+
+def upcoming_indexes(
+    index: int, count: int, length: int, repeat: RepeatMode
+) -> list[int]:
+    """
+    indexes of the next count tracks after index, wrapping for repeat all
+    """
+    if repeat == RepeatMode.ALL and length:
+        count = min(count, length - 1)
+        return [(index + offset) % length for offset in range(1, count + 1)]
+
+    return list(range(index + 1, min(index + 1 + count, length)))
+
+
+def drop_audio_from_queue(db: Session, user_id: int, audio_id: int) -> None:
+    """
+    remove a deleted audio file from the user's queue in one UPDATE,
+    shifting the current index back if the track was before it
+    """
+    # 1 based, null when the audio is not in the queue
+    found_at = func.array_position(PlayQueue.audio_ids, audio_id)
+
+    db.execute(
+        update(PlayQueue)
+        .where(PlayQueue.user_id == user_id, found_at.isnot(None))
+        .values(
+            audio_ids=func.array_remove(PlayQueue.audio_ids, audio_id),
+            current_index=case(
+                (found_at - 1 < PlayQueue.current_index, PlayQueue.current_index - 1),
+                else_=PlayQueue.current_index,
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,142 @@
+"""
+denormalised playlist counters
+
+item_count, total_duration and total_size on playlists are adjusted in
+the same transaction as the playlist item writes, so listing playlists
+needs no join or aggregation. refresh_playlist_counters recomputes them
+from scratch if they ever drift
+"""
+
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from models.audio import AudioFile, Playlist, PlaylistItem
+
+
+def adjust_playlist_counters(
+    db: Session, playlist_id: int, audio_ids: Iterable[int], sign: int = 1
+) -> None:
+    """
+    add (sign=1) or subtract (sign=-1) the given audio files from a
+    playlist's counters in one UPDATE, caller commits
+    """
+    audio_ids = list(audio_ids)
+    if not audio_ids:
+        return
+
+    def total(column):
+        return select(column).where(AudioFile.id.in_(audio_ids)).scalar_subquery()
+
+    db.execute(
+        update(Playlist)
+        .where(Playlist.id == playlist_id)
+        .values(
+            item_count=Playlist.item_count + sign * total(func.count(AudioFile.id)),
+            total_duration=Playlist.total_duration
+            + sign * total(func.coalesce(func.sum(AudioFile.duration), 0)),
+            total_size=Playlist.total_size
+            + sign * total(func.coalesce(func.sum(AudioFile.file_size), 0)),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def adjust_audio_totals(
+    db: Session,
+    audio_id: int,
+    duration_delta: int = 0,
+    size_delta: int = 0,
+    count_delta: int = 0,
+) -> None:
+    """
+    apply a change of one audio file to every playlist that contains it
+
+    used when an audio file is deleted (its items cascade away) or its
+    duration/size changes after it was added to playlists, caller commits
+    """
+    if not (duration_delta or size_delta or count_delta):
+        return
+
+    db.execute(
+        update(Playlist)
+        .where(
+            Playlist.id == PlaylistItem.playlist_id,
+            PlaylistItem.audio_id == audio_id,
+        )
+        .values(
+            item_count=Playlist.item_count + count_delta,
+            total_duration=Playlist.total_duration + duration_delta,
+            total_size=Playlist.total_size + size_delta,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def detach_audio_from_playlists(db: Session, audio: AudioFile) -> None:
+    """
+    take a soon to be deleted audio file out of its playlists' counters
+    """
+    adjust_audio_totals(
+        db,
+        audio.id,
+        duration_delta=-(audio.duration or 0),
+        size_delta=-(audio.file_size or 0),
+        count_delta=-1,
+    )
+
+
+def refresh_playlist_counters(
+    db: Session, playlist_ids: Optional[Iterable[int]] = None
+) -> int:
+    """
+    recompute counters from playlist_items, all playlists when no ids given
+
+    returns:
+        number of playlists whose counters were wrong and got fixed
+    """
+    totals = (
+        select(
+            PlaylistItem.playlist_id,
+            func.count(PlaylistItem.id).label("count"),
+            func.coalesce(func.sum(AudioFile.duration), 0).label("duration"),
+            func.coalesce(func.sum(AudioFile.file_size), 0).label("size"),
+        )
+        .join(AudioFile, PlaylistItem.audio_id == AudioFile.id)
+        .group_by(PlaylistItem.playlist_id)
+        .subquery()
+    )
+
+    expected = (
+        select(
+            Playlist.id,
+            func.coalesce(totals.c.count, 0).label("count"),
+            func.coalesce(totals.c.duration, 0).label("duration"),
+            func.coalesce(totals.c.size, 0).label("size"),
+        )
+        .outerjoin(totals, totals.c.playlist_id == Playlist.id)
+        .where(
+            (Playlist.item_count != func.coalesce(totals.c.count, 0))
+            | (Playlist.total_duration != func.coalesce(totals.c.duration, 0))
+            | (Playlist.total_size != func.coalesce(totals.c.size, 0))
+        )
+    )
+    if playlist_ids is not None:
+        expected = expected.where(Playlist.id.in_(list(playlist_ids)))
+    expected = expected.subquery()
+
+    result = db.execute(
+        update(Playlist)
+        .where(Playlist.id == expected.c.id)
+        .values(
+            item_count=expected.c.count,
+            total_duration=expected.c.duration,
+            total_size=expected.c.size,
+            # a repair is not a user edit
+            updated_at=Playlist.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    return result.rowcount
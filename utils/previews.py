@@ -0,0 +1,102 @@
+"""
+browse mode previews and cover thumbnails, made during ingest
+
+a preview is a run of whole mpeg frames copied out of the file, found
+with the seek index, so it plays anywhere without decoding or encoding
+anything. the cover is the embedded ID3 picture shrunk to a thumbnail.
+both are stored next to the original and handed out as presigned urls,
+a library screen loads kilobytes per item instead of the whole file
+
+optional package:
+    Pillow  downscales covers, without it a small enough picture is
+            stored as is and larger ones are skipped
+"""
+
+import io
+import os
+from array import array
+from typing import Optional
+
+from utils.mpeg import xing_frame
+from utils.seek_index import SeekIndexBuilder
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+PREVIEW_SECONDS = int(os.environ.get("PREVIEW_SECONDS", "20"))
+
+# skip intros, moved earlier for files too short to start this late
+PREVIEW_START_SECONDS = int(os.environ.get("PREVIEW_START_SECONDS", "30"))
+
+COVER_SIZE = int(os.environ.get("COVER_SIZE", "300"))
+COVER_QUALITY = 80
+
+# largest picture stored unscaled when Pillow is not installed
+COVER_MAX_BYTES = 256 * 1024
+
+
+def preview_range(
+    offsets: array, interval: int, audio_end: int
+) -> Optional[tuple[int, int]]:
+    """
+    byte range of the frames to copy, start inclusive, end exclusive
+    """
+    if not offsets:
+        return None
+
+    entries = len(offsets)
+    length = -(-PREVIEW_SECONDS // interval)
+    start = max(min(PREVIEW_START_SECONDS // interval, entries - length), 0)
+    end = start + length
+
+    # seek index entries are frame starts, so is the next one
+    return offsets[start], offsets[end] if end < entries else audio_end
+
+
+def preview_clip(frames: bytes, vbr: bool) -> bytes:
+    """
+    the copied frames, behind a Xing header when they came from a vbr
+    file, otherwise players guess its length from the first frame
+    """
+    if not vbr:
+        return frames
+
+    walk = SeekIndexBuilder(0, len(frames))
+    walk.feed(frames)
+
+    header = xing_frame(frames[:4], walk.frames, len(frames))
+    if header is None:
+        return frames
+
+    return header + frames
+
+
+def cover_thumbnail(picture: bytes, mime: Optional[str]) -> Optional[tuple[bytes, str]]:
+    """
+    jpeg no larger than COVER_SIZE on either side, None when there is
+    nothing usable
+
+    returns:
+        image bytes and content type
+    """
+    if Image is None:
+        if len(picture) > COVER_MAX_BYTES or not (mime or "").startswith("image/"):
+            return None
+        return picture, mime
+
+    try:
+        with Image.open(io.BytesIO(picture)) as image:
+            # draft lets the jpeg decoder scale down while decoding
+            image.draft("RGB", (COVER_SIZE, COVER_SIZE))
+            image = image.convert("RGB")
+            image.thumbnail((COVER_SIZE, COVER_SIZE))
+
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=COVER_QUALITY, optimize=True)
+    except Exception as e:
+        print(f"warning: could not make cover thumbnail: {e}")
+        return None
+
+    return output.getvalue(), "image/jpeg"
@@ -0,0 +1,153 @@
+"""
+write-behind buffer for playback progress heartbeats
+
+heartbeats only update an in-process dict keyed by (user_id, audio_id),
+so repeated heartbeats for the same track collapse into one entry. a
+background task flushes the dict every few seconds with a single bulk
+upsert, so database writes scale with active listeners per interval
+rather than heartbeat frequency. pending entries are flushed on shutdown
+"""
+
+import asyncio
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import DateTime, Integer, column, select, values
+from sqlalchemy.dialects.postgresql import insert
+
+from database.db import SessionLocal
+from models.audio import AudioFile, PlaybackProgress
+
+PROGRESS_FLUSH_SECONDS = float(os.environ.get("PROGRESS_FLUSH_SECONDS", "5"))
+
+# rows per upsert statement
+FLUSH_BATCH_SIZE = 5000
+
+
+class ProgressBuffer:
+    """
+    last write wins per (user_id, audio_id), safe to use from any thread
+    """
+
+    def __init__(self):
+        self._pending: dict[tuple[int, int], tuple[int, datetime]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, user_id: int, audio_id: int, position: int) -> datetime:
+        received_at = datetime.now(timezone.utc)
+
+        with self._lock:
+            self._pending[(user_id, audio_id)] = (position, received_at)
+
+        return received_at
+
+    def peek(self, user_id: int, audio_id: int) -> Optional[tuple[int, datetime]]:
+        """
+        pending (position, received_at) not yet written to the database
+        """
+        with self._lock:
+            return self._pending.get((user_id, audio_id))
+
+    def _drain(self) -> dict[tuple[int, int], tuple[int, datetime]]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        return pending
+
+    def _restore(self, pending: dict[tuple[int, int], tuple[int, datetime]]) -> None:
+        # put failed rows back without clobbering newer heartbeats
+        with self._lock:
+            for key, entry in pending.items():
+                newer = self._pending.get(key)
+                if newer is None or newer[1] < entry[1]:
+                    self._pending[key] = entry
+
+    def flush(self) -> int:
+        """
+        write all pending entries, returns the number of entries flushed
+        """
+        pending = self._drain()
+        if not pending:
+            return 0
+
+        rows = [
+            (user_id, audio_id, position, received_at)
+            for (user_id, audio_id), (position, received_at) in pending.items()
+        ]
+
+        db = SessionLocal()
+
+        try:
+            for start in range(0, len(rows), FLUSH_BATCH_SIZE):
+                db.execute(upsert_statement(rows[start : start + FLUSH_BATCH_SIZE]))
+            db.commit()
+
+        except Exception as e:
+            db.rollback()
+            self._restore(pending)
+            print(f"warning: failed to flush playback progress: {e}")
+
+            return 0
+
+        finally:
+            db.close()
+
+        return len(rows)
+
+
+def upsert_statement(rows: list[tuple[int, int, int, datetime]]):
+    """
+    INSERT ... SELECT FROM (VALUES ...) ON CONFLICT DO UPDATE
+
+    joining audio_files drops heartbeats for audio the user does not own
+    or that was deleted, and the conflict guard keeps the newest position
+    when several workers flush the same row
+    """
+    pending = values(
+        column("user_id", Integer),
+        column("audio_id", Integer),
+        column("position", Integer),
+        column("updated_at", DateTime(timezone=True)),
+        name="pending",
+    ).data(rows)
+
+    source = select(
+        pending.c.user_id,
+        pending.c.audio_id,
+        pending.c.position,
+        pending.c.updated_at,
+    ).join(
+        AudioFile,
+        (AudioFile.id == pending.c.audio_id) & (AudioFile.user_id == pending.c.user_id),
+    )
+
+    stmt = insert(PlaybackProgress).from_select(
+        ["user_id", "audio_id", "position", "updated_at"], source
+    )
+
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "audio_id"],
+        set_={
+            "position": stmt.excluded.position,
+            "updated_at": stmt.excluded.updated_at,
+        },
+        where=PlaybackProgress.updated_at < stmt.excluded.updated_at,
+    )
+
+
+progress_buffer = ProgressBuffer()
+
+
+async def flush_progress_periodically(interval: float = PROGRESS_FLUSH_SECONDS):
+    """
+    background task started from the app lifespan
+    """
+    while True:
+        await asyncio.sleep(interval)
+        await run_in_threadpool(progress_buffer.flush)
@@ -0,0 +1,165 @@
+"""
+low bitrate renditions for metered connections
+
+ingest transcodes each upload into the RENDITIONS profiles with a local
+ffmpeg, for spoken word 48 kbps mono sounds the same as the 192-320 kbps
+originals at a fraction of the bytes. /stream?quality= picks one
+
+encoding is cpu bound so it runs in a small process pool, apart from the
+api and the ingest threads. ffmpeg reads the original over a presigned
+url and writes to a temp file the ingest worker uploads and removes
+
+optional binary:
+    ffmpeg  on PATH or FFMPEG_PATH, without it no renditions are made
+            and every stream is the original
+"""
+
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Optional
+
+FFMPEG_PATH = os.environ.get("FFMPEG_PATH") or shutil.which("ffmpeg")
+
+# encoder processes, each runs one ffmpeg at a time
+RENDITION_WORKERS = int(os.environ.get("RENDITION_WORKERS", "1"))
+
+# a long lecture takes a few seconds, this catches a stuck encoder
+RENDITION_TIMEOUT_SECONDS = 600
+
+# quality name -> encoder settings, lame picks the mpeg version that
+# fits the sample rate
+RENDITIONS = {
+    "low": {"bitrate": 48000, "channels": 1, "sample_rate": 24000},
+}
+
+# not worth a rendition unless the original is this much larger
+MIN_SAVING_RATIO = 1.5
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def renditions_enabled() -> bool:
+    return FFMPEG_PATH is not None and RENDITION_WORKERS > 0
+
+
+def _exit_on_terminate() -> None:
+    # SIGTERM unwinds the encoder, subprocess.run kills ffmpeg and
+    # transcode removes its temp file before the process exits
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+
+
+def rendition_pool() -> ProcessPoolExecutor:
+    """
+    started on first use, spawned rather than forked so the workers do
+    not inherit the ingest threads' database connections
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=RENDITION_WORKERS,
+                mp_context=get_context("spawn"),
+                initializer=_exit_on_terminate,
+            )
+        return _pool
+
+
+def shutdown_rendition_pool() -> None:
+    """
+    does not wait for encodes in progress, a long one would outlast the
+    server's graceful shutdown. their jobs fail and run again later. the
+    encoder processes are stopped too, the interpreter waits for them at
+    exit otherwise
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            # no public way to reach them before python 3.14
+            processes = list((_pool._processes or {}).values())
+            _pool.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.terminate()
+            _pool = None
+
+
+def wanted_renditions(source_bitrate: Optional[int]) -> list[str]:
+    """
+    qualities worth making for an original of source_bitrate bits/s
+    """
+    if source_bitrate is None:
+        return list(RENDITIONS)
+
+    return [
+        quality
+        for quality, profile in RENDITIONS.items()
+        if source_bitrate >= profile["bitrate"] * MIN_SAVING_RATIO
+    ]
+
+
+def transcode(source_url: str, quality: str) -> str:
+    """
+    runs in a pool process
+
+    returns:
+        path of a temp mp3, the caller removes it
+    """
+    profile = RENDITIONS[quality]
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as output:
+        path = output.name
+
+    try:
+        subprocess.run(
+            [
+                FFMPEG_PATH,
+                "-nostdin",
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-i",
+                source_url,
+                # audio only, cover art streams are dropped
+                "-map",
+                "0:a:0",
+                "-map_metadata",
+                "-1",
+                "-ac",
+                str(profile["channels"]),
+                "-ar",
+                str(profile["sample_rate"]),
+                "-c:a",
+                "libmp3lame",
+                "-b:a",
+                str(profile["bitrate"]),
+                "-y",
+                path,
+            ],
+            check=True,
+            capture_output=True,
+            timeout=RENDITION_TIMEOUT_SECONDS,
+        )
+    except subprocess.CalledProcessError as e:
+        os.unlink(path)
+        raise RuntimeError(
+            f"ffmpeg failed: {e.stderr.decode(errors='replace').strip()[-500:]}"
+        )
+    except SystemExit:
+        # terminated by shutdown_rendition_pool, ffmpeg has been killed on
+        # the way here. the pool process would carry on with the next call
+        os.unlink(path)
+        os._exit(1)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+    return path
@@ -0,0 +1,155 @@
+"""
+time -> byte offset tables for mp3 files
+
+guessing a position from duration and file size lands in the wrong
+place in a vbr file. the index holds the offset of the frame playing
+at every whole interval, so a player seeks with one exact Range request
+
+built by walking every frame header during ingest's streaming read of
+the file, or failing that estimated from the Xing table of contents.
+stored packed, 4 little endian bytes per entry, about 28KB for two hours
+"""
+
+import math
+import sys
+from array import array
+from typing import Optional
+
+from utils.mpeg import find_frame, parse_frame_header, parse_vbr_header
+
+SEEK_INDEX_INTERVAL_SECONDS = 1
+
+
+def pack_offsets(offsets: array) -> bytes:
+    if sys.byteorder == "big":
+        offsets = array("I", offsets)
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+def unpack_offsets(data: bytes) -> array:
+    offsets = array("I")
+    offsets.frombytes(data)
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    return offsets
+
+
+class SeekIndexBuilder:
+    """
+    walks the frames of a file fed to it in order, in chunks of any size,
+    keeps only the bytes of a partly received frame between chunks
+
+    args:
+        offset of the first frame and end of the audio, from utils.metadata
+    """
+
+    def __init__(
+        self,
+        audio_start: int,
+        audio_end: int,
+        interval: int = SEEK_INDEX_INTERVAL_SECONDS,
+    ):
+        self.audio_end = audio_end
+        self.interval = interval
+
+        # absolute offset of the next frame and of buffer[0]
+        self.position = audio_start
+        self.buffer = bytearray()
+        self.buffer_start = 0
+
+        self.offsets = array("I")
+        self.samples = 0
+        self.sample_rate: Optional[int] = None
+        self.frames = 0
+        self.first = True
+
+    def feed(self, chunk: bytes) -> None:
+        self.buffer += chunk
+
+        while self.position + 4 <= self.audio_end:
+            start = self.position - self.buffer_start
+            if start + 4 > len(self.buffer):
+                break
+
+            header = parse_frame_header(self.buffer, start)
+
+            if header is None:
+                found = find_frame(self.buffer, start + 1)
+                if found is None:
+                    # the next frame may start in the last few bytes
+                    self.position = self.buffer_start + max(len(self.buffer) - 3, start)
+                    break
+                self.position = self.buffer_start + found[0]
+                continue
+
+            end = start + header.length
+            if self.first:
+                # the whole frame is needed to see if it is a vbr header
+                if end > len(self.buffer):
+                    break
+                self.first = False
+
+                # Xing/Info/VBRI frames hold no audio
+                if parse_vbr_header(self.buffer[start:end], header) is not None:
+                    self.position += header.length
+                    continue
+
+            if self.sample_rate is None:
+                self.sample_rate = header.sample_rate
+
+            # every interval boundary this frame plays through
+            frame_end = self.samples + header.samples
+            while len(self.offsets) * self.interval * self.sample_rate < frame_end:
+                self.offsets.append(self.position)
+
+            self.samples = frame_end
+            self.frames += 1
+            self.position += header.length
+
+        # drop what has been walked past
+        consumed = min(self.position - self.buffer_start, len(self.buffer))
+        if consumed > 0:
+            del self.buffer[:consumed]
+            self.buffer_start += consumed
+
+    @property
+    def duration(self) -> Optional[float]:
+        if not self.frames:
+            return None
+        return self.samples / self.sample_rate
+
+
+def seek_index_from_toc(
+    toc: bytes,
+    duration: float,
+    audio_start: int,
+    audio_end: int,
+    interval: int = SEEK_INDEX_INTERVAL_SECONDS,
+) -> array:
+    """
+    offsets estimated from a Xing table of contents, entry n is the
+    position at n% of the duration in 256ths of the audio size
+
+    offsets land near but not on frame boundaries, decoders resync
+    """
+    size = audio_end - audio_start
+    offsets = array("I")
+
+    for i in range(math.ceil(duration / interval)):
+        percent = min(i * interval / duration * 100, 99.999)
+        entry = int(percent)
+        low = toc[entry]
+        high = toc[entry + 1] if entry < 99 else 256
+
+        position = low + (high - low) * (percent - entry)
+        offsets.append(audio_start + int(position / 256 * size))
+
+    return offsets
+
+
+def seek_entry(offsets: array, interval: int, seconds: float) -> int:
+    """
+    index of the entry to play from seconds, clamped to the last one
+    """
+    return max(min(int(seconds // interval), len(offsets) - 1), 0)
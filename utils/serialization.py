@@ -0,0 +1,269 @@
+"""
+fast serialization path for list endpoints
+
+list endpoints select plain column tuples instead of ORM objects and
+encode them straight to bytes, skipping per row pydantic validation.
+routes keep their response_model so the openapi schema is unchanged,
+fastapi does not re-validate a Response returned directly
+
+the body encoding is negotiated from Accept (json, msgpack or cbor, all
+with the same fields) and compressed with brotli or gzip from
+Accept-Encoding once it is over COMPRESS_MIN_BYTES
+
+packages, declared in pyproject.toml but imported optionally so a bare
+environment still serves json with gzip:
+    orjson   faster json, otherwise the standard library encoder
+    msgpack  application/msgpack
+    cbor2    application/cbor
+    brotli   br content encoding, gzip is always available
+"""
+
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Annotated, Any, Callable, Iterable, Optional, Sequence
+
+from fastapi import HTTPException, Query, Request, Response, status
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# smaller bodies are not worth the cpu of compressing
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+
+# fast settings, these responses are compressed on every request
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        # Z for utc like pydantic and orjson, so a field reads the same
+        # whichever path encoded it
+        text = value.isoformat()
+        return text[:-6] + "Z" if value.utcoffset() == timedelta(0) else text
+
+    raise TypeError(f"cannot serialize {type(value).__name__}")
+
+
+def encode_json(payload: Any) -> bytes:
+    """
+    args:
+        dicts, lists and scalars, datetimes become iso 8601 strings with
+        utc written as Z
+
+    returns:
+        compact json bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_UTC_Z)
+
+    return json.dumps(payload, default=_default, separators=(",", ":")).encode()
+
+
+def schema_columns(schema: type[BaseModel], model: Any) -> list:
+    """
+    model columns named like the schema fields, keeps the selected
+    columns and the documented response in step
+    """
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+# ?fields= on read endpoints, trims both the selected columns and the body
+FieldsQuery = Annotated[
+    Optional[str],
+    Query(
+        description="comma separated fields to return, id is always included, default all"
+    ),
+]
+
+
+def parse_fields(
+    fields: Optional[str], allowed: Sequence[str], always: Sequence[str] = ("id",)
+) -> list[str]:
+    """
+    args:
+        raw ?fields= value, None or blank keeps every field
+        field names the endpoint can return, in response order
+        fields returned whatever was asked for
+
+    returns:
+        requested field names in response order
+    """
+    if not fields or not fields.strip():
+        return list(allowed)
+
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"unknown fields: {', '.join(sorted(unknown))}, allowed: {', '.join(allowed)}",
+        )
+
+    requested.update(always)
+    return [name for name in allowed if name in requested]
+
+
+def rows_to_dicts(keys: Sequence[str], rows: Iterable[Sequence[Any]]) -> list[dict]:
+    """
+    zip column tuples into dicts without building ORM or pydantic objects
+    """
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def encode_msgpack(payload: Any) -> bytes:
+    return msgpack.packb(payload, default=_default)
+
+
+def encode_cbor(payload: Any) -> bytes:
+    # datetimes become tag 0 strings, the same iso 8601 text as json
+    return cbor2.dumps(payload, default=lambda encoder, value: _default(value))
+
+
+ENCODERS: dict[str, Callable[[Any], bytes]] = {JSON_MEDIA_TYPE: encode_json}
+if msgpack is not None:
+    ENCODERS["application/msgpack"] = encode_msgpack
+    ENCODERS["application/x-msgpack"] = encode_msgpack
+if cbor2 is not None:
+    ENCODERS["application/cbor"] = encode_cbor
+
+COMPRESSORS: dict[str, Callable[[bytes], bytes]] = {
+    "gzip": lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL),
+}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+
+# documents the extra media types on negotiated routes
+NEGOTIATED_RESPONSES = {
+    200: {
+        "content": {
+            media_type: {} for media_type in ENCODERS if media_type != JSON_MEDIA_TYPE
+        }
+    }
+}
+
+
+def _weights(header: Optional[str]) -> dict[str, float]:
+    """
+    value -> q of an Accept style header, in the order they were listed
+    """
+    weights = {}
+    for part in (header or "").split(","):
+        value, _, params = part.partition(";")
+        value = value.strip().lower()
+        if not value:
+            continue
+
+        q = 1.0
+        for param in params.split(";"):
+            name, _, raw = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(raw)
+                except ValueError:
+                    q = 0.0
+
+        weights[value] = q
+
+    return weights
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """
+    best supported media type from Accept, json when nothing better fits
+    """
+    weights = _weights(accept)
+
+    # highest q first, listing order breaks ties
+    for media_type in sorted(weights, key=lambda value: -weights[value]):
+        if weights[media_type] <= 0:
+            break
+        if media_type in ENCODERS:
+            return media_type
+        if media_type in ("*/*", "application/*"):
+            return JSON_MEDIA_TYPE
+
+    return JSON_MEDIA_TYPE
+
+
+def negotiate_content_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    preferred supported coding from Accept-Encoding, br wins ties with
+    gzip, None for identity
+    """
+    weights = _weights(accept_encoding)
+    wildcard = weights.get("*", 0.0)
+
+    best, best_q = None, 0.0
+    for coding in ("br", "gzip"):
+        q = weights.get(coding, wildcard)
+        if coding in COMPRESSORS and q > best_q:
+            best, best_q = coding, q
+
+    return best
+
+
+def negotiate(request: Request) -> tuple[str, Optional[str]]:
+    """
+    media type and content coding the client asked for
+    """
+    return (
+        negotiate_media_type(request.headers.get("accept")),
+        negotiate_content_encoding(request.headers.get("accept-encoding")),
+    )
+
+
+def encode_body(
+    payload: Any, media_type: str, coding: Optional[str]
+) -> tuple[bytes, Optional[str]]:
+    """
+    returns:
+        encoded body and the coding actually applied, small bodies are
+        left uncompressed
+    """
+    body = ENCODERS[media_type](payload)
+
+    if coding is None or len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+
+    return COMPRESSORS[coding](body), coding
+
+
+def encoded_response(body: bytes, media_type: str, coding: Optional[str]) -> Response:
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if coding is not None:
+        headers["Content-Encoding"] = coding
+
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def negotiated_response(request: Request, payload: Any) -> Response:
+    """
+    encode payload as the client asked, compressing large bodies
+    """
+    media_type, coding = negotiate(request)
+    body, coding = encode_body(payload, media_type, coding)
+
+    return encoded_response(body, media_type, coding)
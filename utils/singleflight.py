@@ -0,0 +1,68 @@
+"""
+single flight call coalescing
+
+concurrent calls with the same key share one execution: the first caller
+runs the function, callers arriving while it runs wait for it and get
+the same result or exception. nothing is kept once the call returns,
+caching is left to the caller
+
+routes are sync and run in the threadpool, so waiting is a thread event
+"""
+
+import threading
+from typing import Any, Callable, Hashable, Optional
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: dict[Hashable, _Call] = {}
+
+        # executions and callers that waited on one instead
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        args:
+            key, usually route, user and parameters
+            function to run if no identical call is in flight
+
+        returns:
+            fn() result, shared by every caller of this flight
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+single_flight = SingleFlight()
@@ -17,11 +17,12 @@ import shutil
 import boto3
 from botocore.exceptions import ClientError
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Optional, Union
 from fastapi import UploadFile, HTTPException, status
 import uuid
 from mutagen.mp3 import MP3
-import tempfile
+
+from utils.mpeg import looks_like_mp3
 
 # AWS Configuration
 AWS_ACCESS_KEY_ID = os.environ.get("AWS_ACCESS_KEY_ID")
@@ -45,10 +46,14 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {".mp3"}
 
+# bytes looked at to tell an mp3 from something renamed to one
+SNIFF_BYTES = 4096
+
 
 def validate_audio_file(file: UploadFile) -> None:
     """
-    checking file extension is .mp3 and content type is audio/mpeg
+    checking file extension is .mp3, content type is audio/mpeg and the
+    first bytes are an ID3 tag or mpeg frames
     """
     file_ext = Path(file.filename).suffix.lower()
     if file_ext not in ALLOWED_EXTENSIONS:
@@ -63,6 +68,17 @@ def validate_audio_file(file: UploadFile) -> None:
             detail=f"invalid content type. expected audio/mpeg, got: {file.content_type}",
         )
 
+    # name and type are whatever the client says, look at the bytes
+    file.file.seek(0)
+    head = file.file.read(SNIFF_BYTES)
+    file.file.seek(0)
+
+    if not looks_like_mp3(head):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="file is not an mp3, no ID3 tag or mpeg audio frames at its start",
+        )
+
 
 def save_audio_file_local(file: UploadFile, user_id: int) -> tuple[str, int, int]:
     try:
@@ -102,65 +118,56 @@ def save_audio_file_local(file: UploadFile, user_id: int) -> tuple[str, int, int
         )
 
 
-def save_audio_file(file: UploadFile, user_id: int) -> tuple[str, int, int]:
+def new_audio_key(user_id: int, filename: str) -> str:
+    return f"users/{user_id}/audio/{uuid.uuid4()}{Path(filename).suffix.lower()}"
+
+
+def s3_url_from_key(s3_key: str) -> str:
+    return f"https://{AWS_S3_BUCKET}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
+
+
+def upload_metadata(user_id: int, filename: str) -> dict:
+    safe_filename = filename.encode("ascii", "ignore").decode("ascii")
+    return {
+        "user-id": str(user_id),
+        "original-filename": safe_filename or "audio.mp3",
+    }
+
+
+def store_audio_file(file: UploadFile, user_id: int) -> tuple[str, int]:
+    """
+    stream an upload straight to s3, no temp copy and no parsing, the
+    ingest workers read it back for metadata
+
+    returns:
+        s3 url and file size in bytes
+    """
     try:
-        file_ext = Path(file.filename).suffix.lower()
-        unique_filename = f"{uuid.uuid4()}{file_ext}"
+        s3_key = new_audio_key(user_id, file.filename)
 
-        s3_key = f"users/{user_id}/audio/{unique_filename}"
+        file.file.seek(0, os.SEEK_END)
+        file_size = file.file.tell()
+        file.file.seek(0)
 
-        original_filename = file.filename
+        # managed transfer, switches to multipart for large files
         try:
-            # encode to ascii to replace non-ascii characters
-            safe_filename = original_filename.encode("ascii", "ignore").decode("ascii")
-        except Exception:
-            safe_filename = "audio.mp3"
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
-            temp_path = temp_file.name
-
-            # write uploaded file to temp location
-            file.file.seek(0)  # reset file pointer
-            temp_file.write(file.file.read())
-            temp_file.flush()
-
-            file_size = Path(temp_path).stat().st_size
-
-            # get audio duration from mp3 metadata
-            duration = None
-            try:
-                audio = MP3(temp_path)
-                duration = int(audio.info.length)
-            except Exception as e:
-                print(f"warning: could not extract duration: {e}")
-
-            # upload to s3
-            try:
-                s3_client.upload_file(
-                    temp_path,
-                    AWS_S3_BUCKET,
-                    s3_key,
-                    ExtraArgs={
-                        "ContentType": "audio/mpeg",
-                        "ServerSideEncryption": "AES256",
-                        "Metadata": {
-                            "user-id": str(user_id),
-                            "original-filename": safe_filename,
-                        },
-                    },
-                )
-            except ClientError as e:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"failed to upload to s3: {str(e)}",
-                )
-            finally:
-                # clean up temp file
-                Path(temp_path).unlink(missing_ok=True)
-
-        s3_url = f"https://{AWS_S3_BUCKET}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
-
-        return s3_url, duration, file_size
+            s3_client.upload_fileobj(
+                file.file,
+                AWS_S3_BUCKET,
+                s3_key,
+                ExtraArgs={
+                    "ContentType": "audio/mpeg",
+                    "ServerSideEncryption": "AES256",
+                    "Metadata": upload_metadata(user_id, file.filename),
+                },
+            )
+        except ClientError as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"failed to upload to s3: {str(e)}",
+            )
+
+        return s3_url_from_key(s3_key), file_size
 
     except HTTPException:
         raise
@@ -171,6 +178,124 @@ def save_audio_file(file: UploadFile, user_id: int) -> tuple[str, int, int]:
         )
 
 
+def start_multipart_upload(s3_key: str, user_id: int, filename: str) -> str:
+    """
+    returns:
+        s3 upload id, parts are added with upload_part
+    """
+    response = s3_client.create_multipart_upload(
+        Bucket=AWS_S3_BUCKET,
+        Key=s3_key,
+        ContentType="audio/mpeg",
+        ServerSideEncryption="AES256",
+        Metadata=upload_metadata(user_id, filename),
+    )
+    return response["UploadId"]
+
+
+def upload_part(s3_key: str, upload_id: str, part_number: int, body: bytes) -> str:
+    """
+    every part but the last must be at least 5MB, sending a part number
+    again replaces that part
+
+    returns:
+        etag of the part, needed to complete the upload
+    """
+    response = s3_client.upload_part(
+        Bucket=AWS_S3_BUCKET,
+        Key=s3_key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=body,
+    )
+    return response["ETag"]
+
+
+def complete_multipart_upload(s3_key: str, upload_id: str, etags: list[str]) -> None:
+    s3_client.complete_multipart_upload(
+        Bucket=AWS_S3_BUCKET,
+        Key=s3_key,
+        UploadId=upload_id,
+        MultipartUpload={
+            "Parts": [
+                {"ETag": etag, "PartNumber": number}
+                for number, etag in enumerate(etags, start=1)
+            ]
+        },
+    )
+
+
+def abort_multipart_upload(s3_key: str, upload_id: str) -> None:
+    try:
+        s3_client.abort_multipart_upload(
+            Bucket=AWS_S3_BUCKET, Key=s3_key, UploadId=upload_id
+        )
+    except ClientError as e:
+        print(f"warning: failed to abort multipart upload of {s3_key}: {e}")
+
+
+def s3_key_from_url(file_url: str) -> str:
+    return file_url.split(f"{AWS_S3_BUCKET}.s3.{AWS_REGION}.amazonaws.com/")[1]
+
+
+def open_audio_file(file_url: str):
+    """
+    streaming body of a stored file, read it with iter_chunks()
+    """
+    response = s3_client.get_object(Bucket=AWS_S3_BUCKET, Key=s3_key_from_url(file_url))
+    return response["Body"]
+
+
+def stored_file_reader(file_url: str):
+    """
+    read(offset, length) over a stored file, one ranged GET per call
+    """
+    s3_key = s3_key_from_url(file_url)
+
+    def read(offset: int, length: int) -> bytes:
+        response = s3_client.get_object(
+            Bucket=AWS_S3_BUCKET,
+            Key=s3_key,
+            Range=f"bytes={offset}-{offset + length - 1}",
+        )
+        return response["Body"].read()
+
+    return read
+
+
+def derived_file_url(file_url: str, suffix: str) -> str:
+    """
+    url of a file made from a stored one, kept next to it
+    e.g users/1/audio/{uuid}.mp3 -> users/1/audio/{uuid}.preview.mp3
+    """
+    return f"{file_url.rsplit('.', 1)[0]}.{suffix}"
+
+
+def store_derived_file(
+    file_url: str, suffix: str, body: Union[bytes, BinaryIO], content_type: str
+) -> str:
+    """
+    store a preview, thumbnail etc of a stored file, a rerun overwrites
+    the earlier copy
+
+    returns:
+        url of the derived file
+    """
+    derived_url = derived_file_url(file_url, suffix)
+
+    # never changes under its key, browsers keep it once fetched
+    s3_client.put_object(
+        Bucket=AWS_S3_BUCKET,
+        Key=s3_key_from_url(derived_url),
+        Body=body,
+        ContentType=content_type,
+        CacheControl="private, max-age=31536000, immutable",
+        ServerSideEncryption="AES256",
+    )
+
+    return derived_url
+
+
 def delete_audio_file(file_url: str) -> None:
     try:
         if AWS_S3_BUCKET in file_url:
@@ -0,0 +1,210 @@
+"""
+rejects bad uploads before their body is read
+
+pure asgi middleware in front of the upload routes. from the headers
+alone it turns away requests with no Content-Length, larger than
+UPLOAD_MAX_BYTES or than what is left of the user's storage quota. for
+single uploads it then reads only until the first few KB of the file
+part have arrived and turns the request away unless they start like an
+mp3. batch uploads get the header checks only, one bad file must not
+fail the rest, the route rejects it on its own. nothing reaches the
+route, so a rejected upload costs no disk, no s3 PUT and, for
+clients that wait on Expect: 100-continue, none of the body's bandwidth
+
+Content-Length includes the multipart framing, a few hundred bytes over
+the file size, which the limits do not try to account for
+"""
+
+import asyncio
+import os
+import re
+from typing import Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import func
+
+from database.db import SessionLocal
+from models.audio import AudioFile, User
+from utils.jwt import verify_token
+from utils.mpeg import looks_like_mp3
+from utils.storage import SNIFF_BYTES
+
+# largest single upload
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# storage per user when users.storage_quota_bytes is not set, 0 is unlimited
+USER_STORAGE_QUOTA_BYTES = int(os.environ.get("USER_STORAGE_QUOTA_BYTES", "0"))
+
+# (method, path) of the routes guarded
+GUARDED_UPLOADS = {("POST", "/api/audio/upload"), ("POST", "/api/audio/upload/batch")}
+
+# the guarded routes whose file is sniffed, they take a single file
+SNIFFED_UPLOADS = {("POST", "/api/audio/upload")}
+
+# give up looking for the file part after this much body, the route's own
+# validate_audio_file still checks it
+SNIFF_MAX_BUFFER = 64 * 1024
+
+_BOUNDARY = re.compile(rb'boundary="?([^";,]+)"?', re.IGNORECASE)
+
+
+def storage_left(user_id: int) -> Optional[int]:
+    """
+    bytes the user may still upload, None when there is no quota
+    """
+    db = SessionLocal()
+    try:
+        quota = db.query(User.storage_quota_bytes).filter(User.id == user_id).scalar()
+        quota = quota if quota is not None else USER_STORAGE_QUOTA_BYTES
+        if not quota:
+            return None
+
+        used = (
+            db.query(func.coalesce(func.sum(AudioFile.file_size), 0))
+            .filter(AudioFile.user_id == user_id)
+            .scalar()
+        )
+    finally:
+        db.close()
+
+    return max(quota - used, 0)
+
+
+def first_file_head(body: bytes, boundary: bytes) -> Optional[bytes]:
+    """
+    start of the first part with a filename, None until its headers and
+    SNIFF_BYTES of content (or the part's end) are in body
+    """
+    delimiter = b"--" + boundary
+    position = body.find(delimiter)
+
+    while position != -1:
+        headers_end = body.find(b"\r\n\r\n", position)
+        if headers_end == -1:
+            return None
+
+        content_start = headers_end + 4
+        part_end = body.find(b"\r\n" + delimiter, content_start)
+
+        if b"filename=" in body[position:headers_end].lower():
+            if part_end != -1:
+                return body[content_start:part_end][:SNIFF_BYTES]
+            if len(body) - content_start >= SNIFF_BYTES:
+                return body[content_start : content_start + SNIFF_BYTES]
+            return None
+
+        if part_end == -1:
+            return None
+        position = part_end + 2
+
+    return None
+
+
+class UploadGuardMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or (scope["method"], scope["path"]) not in GUARDED_UPLOADS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.check_headers(scope)
+        except HTTPException as e:
+            await self.reject(scope, receive, send, e)
+            return
+
+        boundary = _BOUNDARY.search(self.header(scope, b"content-type") or b"")
+        if (scope["method"], scope["path"]) not in SNIFFED_UPLOADS or boundary is None:
+            # batch uploads, or not multipart, the route answers that
+            await self.app(scope, receive, send)
+            return
+
+        # read just far enough to see the start of the file
+        messages = []
+        body = b""
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+
+            body += message.get("body", b"")
+            head = first_file_head(body, boundary.group(1))
+            if head is not None:
+                if not looks_like_mp3(head):
+                    await self.reject(
+                        scope,
+                        receive,
+                        send,
+                        HTTPException(
+                            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="file is not an mp3, no ID3 tag or mpeg audio frames at its start",
+                        ),
+                    )
+                    return
+                break
+
+            if not message.get("more_body", False) or len(body) > SNIFF_MAX_BUFFER:
+                break
+
+        # hand the route what was read, then the rest as it arrives
+        async def replay():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        await self.app(scope, replay, send)
+
+    @staticmethod
+    def header(scope, name: bytes) -> Optional[bytes]:
+        for key, value in scope["headers"]:
+            if key == name:
+                return value
+        return None
+
+    async def check_headers(self, scope) -> None:
+        length = self.header(scope, b"content-length")
+        if length is None or not length.isdigit():
+            raise HTTPException(
+                status_code=status.HTTP_411_LENGTH_REQUIRED,
+                detail="uploads need a Content-Length",
+            )
+
+        length = int(length)
+        if length > UPLOAD_MAX_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"upload is larger than the {UPLOAD_MAX_BYTES} byte limit",
+            )
+
+        authorization = self.header(scope, b"authorization") or b""
+        scheme, _, token = authorization.decode("latin-1").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        user_id = int(verify_token(token)["sub"])
+
+        left = await asyncio.to_thread(storage_left, user_id)
+        if left is not None and length > left:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"upload would exceed your storage quota, {left} bytes left",
+            )
+
+    @staticmethod
+    async def reject(scope, receive, send, e: HTTPException) -> None:
+        # the body is left unread, the server closes the connection
+        response = JSONResponse(
+            {"detail": e.detail}, status_code=e.status_code, headers=e.headers
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,125 @@
+"""
+expiry of abandoned resumable uploads
+
+a session that has not received a chunk for UPLOAD_EXPIRES_HOURS is
+deleted and its s3 multipart upload aborted, until then s3 keeps and
+bills the parts. a complete batch upload nobody claimed has its file
+deleted. multipart uploads no session points at any more (a failed
+abort, a deleted user) are aborted too once they are as old
+
+runs from the app lifespan every UPLOAD_CLEANUP_SECONDS
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+from fastapi.concurrency import run_in_threadpool
+
+from database.db import SessionLocal
+from models.audio import UploadSession
+from utils.storage import (
+    AWS_S3_BUCKET,
+    abort_multipart_upload,
+    delete_audio_file,
+    s3_client,
+    s3_url_from_key,
+)
+
+UPLOAD_EXPIRES_HOURS = float(os.environ.get("UPLOAD_EXPIRES_HOURS", "24"))
+
+UPLOAD_CLEANUP_SECONDS = float(os.environ.get("UPLOAD_CLEANUP_SECONDS", "3600"))
+
+# sessions expired per transaction
+CLEANUP_BATCH_SIZE = 100
+
+
+def upload_expiry() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(hours=UPLOAD_EXPIRES_HOURS)
+
+
+def discard_upload(session: UploadSession) -> None:
+    """
+    drops what s3 holds for a session, the caller deletes the row
+    """
+    if session.upload_offset == session.upload_length:
+        # complete batch upload, the parts are a file now
+        delete_audio_file(s3_url_from_key(session.s3_key))
+    else:
+        abort_multipart_upload(session.s3_key, session.s3_upload_id)
+
+
+def expire_upload_sessions() -> int:
+    """
+    returns:
+        number of sessions expired
+    """
+    expired = 0
+    db = SessionLocal()
+
+    try:
+        while True:
+            # skip locked, a session being written to is not abandoned
+            sessions = (
+                db.query(UploadSession)
+                .filter(UploadSession.expires_at < datetime.now(timezone.utc))
+                .limit(CLEANUP_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if not sessions:
+                break
+
+            for session in sessions:
+                discard_upload(session)
+                db.delete(session)
+
+            db.commit()
+            expired += len(sessions)
+
+        abort_orphaned_multipart_uploads(db)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    return expired
+
+
+def abort_orphaned_multipart_uploads(db) -> None:
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=UPLOAD_EXPIRES_HOURS)
+    paginator = s3_client.get_paginator("list_multipart_uploads")
+
+    for page in paginator.paginate(Bucket=AWS_S3_BUCKET, Prefix="users/"):
+        stale = [
+            upload for upload in page.get("Uploads", []) if upload["Initiated"] < cutoff
+        ]
+        if not stale:
+            continue
+
+        known = {
+            upload_id
+            for (upload_id,) in db.query(UploadSession.s3_upload_id).filter(
+                UploadSession.s3_upload_id.in_([u["UploadId"] for u in stale])
+            )
+        }
+        for upload in stale:
+            if upload["UploadId"] not in known:
+                abort_multipart_upload(upload["Key"], upload["UploadId"])
+
+
+async def cleanup_upload_sessions_periodically(
+    interval: float = UPLOAD_CLEANUP_SECONDS,
+):
+    """
+    background task started from the app lifespan
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            expired = await run_in_threadpool(expire_upload_sessions)
+            if expired:
+                print(f"expired {expired} abandoned upload(s)")
+        except Exception as e:
+            print(f"warning: upload cleanup failed: {e}")